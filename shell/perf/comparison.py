@@ -0,0 +1,150 @@
+from models import LatestReport, Metric, _SQLITE_MAX_VARIABLES
+import reduction
+
+# Comparison of the latest report of every system. The latest value of
+# each metric for each system is loaded into a matrix with a row per
+# system and a column per metric (None where a system didn't report the
+# metric), and everything else is computed column by column from that.
+# Metrics with the same name but different units get separate columns;
+# their values can't be compared with each other.
+#
+#  medians: the median of each metric over all systems
+#  scores: each value relative to the median, oriented so that larger is
+#    always better: median / value for times, value / median for rates.
+#    Metrics where we don't know which direction is better (no time in
+#    the units) aren't scored.
+#  ranks: for each metric, the position of each system when sorted from
+#    best to worst, starting at 1
+#  overall: for each system, the geometric mean of its scores
+#  group medians: medians of the metrics and of the overall scores over
+#    the systems in each group, where systems are grouped by one of
+#    GROUP_FIELDS
+
+GROUP_FIELDS = ('graphics', 'processor', 'operating_system')
+
+def _median(values):
+    s = sorted(values)
+    l = len(s)
+    if l == 0:
+        return None
+    elif l % 2 == 1:
+        return s[l // 2]
+    else:
+        return (s[l // 2 - 1] + s[l // 2]) / 2.
+
+def _column(matrix, j):
+    return [row[j] for row in matrix]
+
+def _present(values):
+    return [v for v in values if v is not None]
+
+class ComparisonMatrix:
+    def __init__(self):
+        latest = LatestReport.objects.select_related('system').order_by('system__name')
+        self.systems = [l.system for l in latest]
+        system_index = {}
+        for i, l in enumerate(latest):
+            system_index[l.report_id] = i
+
+        # Keyed by (name, units)
+        values = {}
+        definitions = {}
+        report_ids = system_index.keys()
+        # Batched to stay under SQLite's limit on statement parameters
+        for start in xrange(0, len(report_ids), _SQLITE_MAX_VARIABLES):
+            batch = report_ids[start:start + _SQLITE_MAX_VARIABLES]
+            for metric in Metric.objects.filter(report__in=batch).select_related('definition'):
+                key = (metric.definition.name, metric.definition.units)
+                definitions[key] = metric.definition
+                values[(system_index[metric.report_id], key)] = metric.value
+
+        keys = sorted(definitions.keys())
+        self.metric_names = [name for name, units in keys]
+        self.definitions = [definitions[key] for key in keys]
+        self.matrix = [[values.get((i, key)) for key in keys]
+                       for i in xrange(0, len(self.systems))]
+
+        self.__compute()
+
+    def __compute(self):
+        n_systems = len(self.systems)
+        n_metrics = len(self.metric_names)
+
+        self.medians = [_median(_present(_column(self.matrix, j))) for j in xrange(0, n_metrics)]
+
+        # +1 where larger values are better, -1 where smaller are better
+        self.directions = [- reduction.time_exponent(d.units) for d in self.definitions]
+
+        self.scores = [[None] * n_metrics for i in xrange(0, n_systems)]
+        self.ranks = [[None] * n_metrics for i in xrange(0, n_systems)]
+        for j in xrange(0, n_metrics):
+            direction = self.directions[j]
+            median = self.medians[j]
+            if direction == 0 or not median:
+                continue
+
+            column = _column(self.matrix, j)
+            for i, value in enumerate(column):
+                if value is None or value <= 0:
+                    continue
+                if direction > 0:
+                    self.scores[i][j] = value / median
+                else:
+                    self.scores[i][j] = median / value
+
+            present = [i for i in xrange(0, n_systems) if column[i] is not None]
+            present.sort(key=lambda i: column[i], reverse=(direction > 0))
+            for rank, i in enumerate(present):
+                self.ranks[i][j] = rank + 1
+
+        self.overall = []
+        for i in xrange(0, n_systems):
+            scores = _present(self.scores[i])
+            if len(scores) == 0:
+                self.overall.append(None)
+            else:
+                product = 1.
+                for score in scores:
+                    product *= score ** (1. / len(scores))
+                self.overall.append(product)
+
+    # Returns a list of the groups of systems with the same value of
+    # field, each a dictionary with the value, the names of the systems,
+    # the median of each metric, and the median overall score
+    def groups(self, field):
+        members = {}
+        for i, system in enumerate(self.systems):
+            members.setdefault(getattr(system, field), []).append(i)
+
+        result = []
+        for value in sorted(members.keys()):
+            rows = members[value]
+            medians = [_median(_present([self.matrix[i][j] for i in rows]))
+                       for j in xrange(0, len(self.metric_names))]
+            result.append({ 'value': value,
+                            'systems': [self.systems[i].name for i in rows],
+                            'medians': medians,
+                            'overall': _median(_present([self.overall[i] for i in rows])) })
+
+        return result
+
+    # Systems in order of overall score, best first, with systems without
+    # a score at the end
+    def ranking(self):
+        order = range(0, len(self.systems))
+        order.sort(key=lambda i: (self.overall[i] is None, - (self.overall[i] or 0)))
+        return [{ 'system': self.systems[i],
+                  'overall': self.overall[i] } for i in order]
+
+    def to_json(self, group_field):
+        return { 'systems': [s.name for s in self.systems],
+                 'metrics': [{ 'name': d.name,
+                               'description': d.description,
+                               'units': d.units } for d in self.definitions],
+                 'values': self.matrix,
+                 'medians': self.medians,
+                 'scores': self.scores,
+                 'ranks': self.ranks,
+                 'overall': self.overall,
+                 'group_field': group_field,
+                 'groups': self.groups(group_field) }
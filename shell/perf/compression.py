@@ -0,0 +1,171 @@
+import bz2
+from gzip import GzipFile
+import os
+
+# The lzma module is in the standard library from Python 3.3, and
+# backports.lzma provides the same API for Python 2. (pyliblzma also
+# installs a module called lzma, but with a different API.)
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+if lzma is not None and not hasattr(lzma, 'FORMAT_XZ'):
+    lzma = None
+
+# Codecs that report files can be stored with. The codec of a report is
+# recorded by the extension of its file (Report.upload), so reports
+# stored with different codecs can be read side by side; the codec for
+# new reports is set by REPORT_CODEC in the settings, and older reports
+# can be converted with 'manage.py recompress_reports'.
+#
+# Event logs (EventLog.upload) are always gzip-compressed, since they are
+# sent to the browser as is.
+
+# Size of the compressed chunks read at once
+_READ_CHUNK_SIZE = 16 * 1024
+
+# File-like object returning the data of f decompressed with decompressor
+# (a bz2.BZ2Decompressor or lzma.LZMADecompressor). Closing it closes f.
+class _DecompressingReader:
+    def __init__(self, f, decompressor):
+        self.__f = f
+        self.__decompressor = decompressor
+        self.__buffer = ''
+        self.__offset = 0
+        self.__eof = False
+
+    def read(self, size=-1):
+        pieces = []
+        wanted = size
+        while size < 0 or wanted > 0:
+            if self.__offset >= len(self.__buffer):
+                if self.__eof:
+                    break
+                data = self.__f.read(_READ_CHUNK_SIZE)
+                if not data:
+                    self.__eof = True
+                    break
+                self.__buffer = self.__decompressor.decompress(data)
+                self.__offset = 0
+                continue
+
+            if size < 0:
+                end = len(self.__buffer)
+            else:
+                end = min(len(self.__buffer), self.__offset + wanted)
+            pieces.append(self.__buffer[self.__offset:end])
+            wanted -= end - self.__offset
+            self.__offset = end
+
+        return ''.join(pieces)
+
+    def close(self):
+        self.__f.close()
+
+# File-like object compressing what is written to it into f with
+# compressor. As with GzipFile(fileobj=f), closing it doesn't close f.
+class _CompressingWriter:
+    def __init__(self, f, compressor):
+        self.__f = f
+        self.__compressor = compressor
+
+    def write(self, data):
+        compressed = self.__compressor.compress(data)
+        if compressed:
+            self.__f.write(compressed)
+
+    def close(self):
+        self.__f.write(self.__compressor.flush())
+
+# Base class of the codecs. Each codec also has the methods:
+#
+#  reader(f): returns a file-like object with the decompressed data of
+#    the file f
+#  writer(f, name, level=None): returns a file-like object compressing
+#    what is written to it into f. name may be stored in the compressed
+#    data; level None is the default for the codec.
+class Codec:
+    # content_encoding is the HTTP Content-Encoding for sending the file
+    # as is, or None if browsers can't decode it. read_step is the step
+    # decompressing is recorded as (see instrumentation.py).
+    def __init__(self, name, extension, mimetype, content_encoding, read_step):
+        self.name = name
+        self.extension = extension
+        self.mimetype = mimetype
+        self.content_encoding = content_encoding
+        self.read_step = read_step
+
+    # Returns a file-like object with the decompressed contents of path
+    def open_read(self, path):
+        return self.reader(open(path, 'rb'))
+
+class _GzipCodec(Codec):
+    def __init__(self):
+        Codec.__init__(self, 'gzip', '.gz', 'application/x-gzip', 'gzip', 'gunzip')
+
+    def reader(self, f):
+        return GzipFile(fileobj=f, mode='rb')
+
+    def open_read(self, path):
+        # Unlike with fileobj, this closes the file when done
+        return GzipFile(path, 'rb')
+
+    def writer(self, f, name, level=None):
+        if level is None:
+            level = 9
+        return GzipFile(name, mode='wb', compresslevel=level, fileobj=f)
+
+class _Bz2Codec(Codec):
+    def __init__(self):
+        Codec.__init__(self, 'bz2', '.bz2', 'application/x-bzip2', None, 'bunzip2')
+
+    def reader(self, f):
+        return _DecompressingReader(f, bz2.BZ2Decompressor())
+
+    def writer(self, f, name, level=None):
+        if level is None:
+            level = 9
+        return _CompressingWriter(f, bz2.BZ2Compressor(level))
+
+class _LzmaCodec(Codec):
+    def __init__(self):
+        Codec.__init__(self, 'lzma', '.xz', 'application/x-xz', None, 'unxz')
+
+    def reader(self, f):
+        return _DecompressingReader(f, lzma.LZMADecompressor())
+
+    def writer(self, f, name, level=None):
+        if level is None:
+            compressor = lzma.LZMACompressor()
+        else:
+            compressor = lzma.LZMACompressor(preset=level)
+        return _CompressingWriter(f, compressor)
+
+# name => Codec, for the codecs that are available
+CODECS = {}
+for _codec in (_GzipCodec(), _Bz2Codec()):
+    CODECS[_codec.name] = _codec
+if lzma is not None:
+    CODECS['lzma'] = _LzmaCodec()
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        if name == 'lzma':
+            raise ValueError("The lzma codec needs the lzma module (backports.lzma on Python 2)")
+        raise ValueError("Unknown codec '%s'" % name)
+
+# The codec that the file at path is stored with; files without a known
+# extension are gzip-compressed, as all reports were before there was a
+# choice
+def codec_for_path(path):
+    extension = os.path.splitext(path)[1]
+    for codec in CODECS.itervalues():
+        if codec.extension == extension:
+            return codec
+
+    return CODECS['gzip']
@@ -0,0 +1,107 @@
+# Reducing a long series of (x, y) points to a number of points that can
+# reasonably be sent to a browser and charted, while keeping the shape of
+# the series: spikes and steps should still be visible after
+# downsampling, which rules out simple averaging or taking every Nth
+# point. Points are sequences whose first two elements are x and y; any
+# other elements (like the ID of the report a value came from) are passed
+# through. The points must be sorted by x, and the first and last points
+# are always kept.
+
+# Largest-Triangle-Three-Buckets (Sveinn Steinarsson, "Downsampling Time
+# Series for Visual Representation", 2013.) The points between the first
+# and last are divided into threshold - 2 buckets, and from each bucket
+# we keep the point that forms the largest triangle with the point kept
+# from the previous bucket and the average of the next bucket.
+def lttb(points, threshold):
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    result = [points[0]]
+    every = float(n - 2) / (threshold - 2)
+
+    a = 0
+    for i in xrange(0, threshold - 2):
+        # Average of the next bucket; for the last bucket, that's the
+        # last point
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= n - 1:
+            next_start = n - 1
+            next_end = n
+        avg_x = 0.
+        avg_y = 0.
+        for point in points[next_start:next_end]:
+            avg_x += point[0]
+            avg_y += point[1]
+        avg_x /= next_end - next_start
+        avg_y /= next_end - next_start
+
+        ax = points[a][0]
+        ay = points[a][1]
+
+        max_area = -1
+        chosen = None
+        for j in xrange(int(i * every) + 1, int((i + 1) * every) + 1):
+            x = points[j][0]
+            y = points[j][1]
+            # Twice the area, which doesn't matter for comparisons
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        result.append(points[chosen])
+        a = chosen
+
+    result.append(points[n - 1])
+
+    return result
+
+# Divides the points between the first and last into buckets of equal
+# ranges of x, and keeps the lowest and highest point in each bucket, in
+# their original order. Unlike LTTB this never hides an outlier, at
+# the cost of returning up to twice as many points as there are buckets.
+def min_max(points, buckets):
+    n = len(points)
+    if 2 * buckets + 2 >= n or buckets < 1:
+        return list(points)
+
+    result = [points[0]]
+
+    first_x = points[1][0]
+    bucket_x = (points[n - 2][0] - first_x) / float(buckets)
+
+    def bucket_of(point):
+        if bucket_x <= 0:
+            return 0
+        return min(int((point[0] - first_x) / bucket_x), buckets - 1)
+
+    i = 1
+    while i < n - 1:
+        bucket = bucket_of(points[i])
+        lowest = highest = i
+        j = i + 1
+        while j < n - 1 and bucket_of(points[j]) == bucket:
+            if points[j][1] < points[lowest][1]:
+                lowest = j
+            if points[j][1] > points[highest][1]:
+                highest = j
+            j += 1
+
+        for k in sorted(set((lowest, highest))):
+            result.append(points[k])
+        i = j
+
+    result.append(points[n - 1])
+
+    return result
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': lambda points, threshold: min_max(points, max(1, (threshold - 2) / 2))
+}
+
+# Downsamples points to about threshold points with the named method
+def downsample(points, threshold, method='lttb'):
+    return METHODS[method](points, threshold)
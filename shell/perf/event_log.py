@@ -0,0 +1,324 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from gzip import GzipFile
+import struct
+import sys
+import tempfile
+import threading
+try:
+    import json
+except:
+    import simplejson as json
+
+# Compact binary form of the event logs in a report, generated at upload
+# time and served to the log viewer in place of the 'logs' member of the
+# report JSON. In the JSON, each event is a [timestamp_us, name, arg]
+# triple with the timestamp in microseconds since the epoch; here each run
+# is stored as separate columns:
+#
+#  args: float64 per event, NaN when the event has no numeric argument
+#  deltas: uint32 per event, microseconds since the previous event
+#   (the first is always 0, the run's start time is in the header)
+#  names: uint16 per event, index into the table of event names
+#
+# The file layout (all little-endian) is:
+#
+#  'SPLG' magic, uint32 version, uint32 header length
+#  header: UTF-8 JSON object with:
+#    'events': the 'events' member of the report
+#    'names': list of event names, indexed by the names column
+#    'runs': for each run, { 'start': <timestamp_us>, 'count': <events>,
+#            'strings': [[<index>, <string arg>], ...] }
+#  padding to a multiple of 8 bytes
+#  for each run: args, deltas, names, padding to a multiple of 8 bytes
+#
+# The padding keeps every column aligned so that the client can create
+# typed array views directly on the downloaded data.
+
+MAGIC = 'SPLG'
+VERSION = 1
+
+_MAX_DELTA = 0xffffffff
+_MAX_NAMES = 0x10000
+
+class EventLogError(Exception):
+    pass
+
+def _pad(f, length):
+    if length % 8 != 0:
+        f.write('\0' * (8 - length % 8))
+
+def _to_little_endian(a):
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+# The logs don't fit in memory as Python objects, so they are fed in
+# one run at a time with add_run(), and the columns are written to a
+# temporary file until the header is known. If a log can't be
+# represented (a gap too long for a uint32 delta, time going backwards,
+# too many distinct names), the writer records the problem in 'error'
+# and ignores the rest of the runs; the client then falls back to the
+# JSON form of the log.
+class EventLogWriter:
+    def __init__(self):
+        self.error = None
+        self.__names = {}
+        self.__name_list = []
+        self.__runs = []
+        self.__body = tempfile.TemporaryFile()
+
+    def __intern(self, name):
+        index = self.__names.get(name)
+        if index is None:
+            index = len(self.__name_list)
+            if index >= _MAX_NAMES:
+                raise EventLogError("Too many distinct event names")
+            self.__names[name] = index
+            self.__name_list.append(name)
+        return index
+
+    def __convert_run(self, log):
+        args = array('d')
+        deltas = array('I')
+        names = array('H')
+        strings = []
+        nan = float('nan')
+
+        start = None
+        last = None
+        for i, event in enumerate(log):
+            timestamp = event[0]
+            if start is None:
+                start = last = timestamp
+            delta = timestamp - last
+            if delta < 0 or delta > _MAX_DELTA:
+                raise EventLogError("Event timestamps out of range")
+            deltas.append(delta)
+            last = timestamp
+
+            names.append(self.__intern(event[1]))
+
+            if len(event) < 3 or event[2] is None:
+                args.append(nan)
+            elif isinstance(event[2], (int, long, float)):
+                args.append(event[2])
+            else:
+                args.append(nan)
+                strings.append([i, event[2]])
+
+        return { 'start': start, 'count': len(log), 'strings': strings }, (args, deltas, names)
+
+    def add_run(self, log):
+        if self.error is not None:
+            return
+
+        try:
+            run, columns = self.__convert_run(log)
+        except (EventLogError, IndexError, TypeError, OverflowError), e:
+            self.error = str(e)
+            return
+
+        length = 0
+        for column in columns:
+            data = _to_little_endian(column).tostring()
+            self.__body.write(data)
+            length += len(data)
+        _pad(self.__body, length)
+
+        self.__runs.append(run)
+
+    # Handler for json_stream.read_members() that reads the 'logs' member
+    # of a report one run at a time
+    def read_logs(self, reader):
+        for i in reader.iter_array():
+            self.add_run(reader.read_value())
+
+    # Writes the complete log to f; events is the 'events' member of the report
+    def write(self, f, events):
+        header = json.dumps({ 'events': events,
+                              'names': self.__name_list,
+                              'runs': self.__runs })
+
+        f.write(MAGIC)
+        f.write(struct.pack('<II', VERSION, len(header)))
+        f.write(header)
+        _pad(f, len(MAGIC) + 8 + len(header))
+
+        self.__body.seek(0)
+        while True:
+            data = self.__body.read(64 * 1024)
+            if not data:
+                break
+            f.write(data)
+
+    def close(self):
+        self.__body.close()
+
+# Reading back the compact logs, for serving windows of a run to the log
+# viewer without sending it the whole log. The columns of a run are
+# loaded into memory along with the cumulative times, which form an index
+# that can be searched with bisect. Loaded runs are kept in a per-process
+# cache, since the viewer will typically ask for many windows of the
+# same run as the user zooms and scrolls.
+
+# Limit on the total number of events in the cached runs; each event takes
+# about 20 bytes
+CACHE_MAX_EVENTS = 2000000
+
+# A bucket of the window with more events than this is summarized rather
+# than the events being sent individually
+MAX_BUCKET_EVENTS = 4
+
+class RunIndex:
+    def __init__(self, header, run, args, deltas, names):
+        self.events = header['events']
+        self.name_list = header['names']
+        self.run_count = len(header['runs'])
+        self.start = run['start']
+        self.count = run['count']
+        self.strings = dict([(i, s) for i, s in run['strings']])
+        self.args = args
+        self.names = names
+
+        # Seconds since the start of the run
+        self.times = array('d')
+        time = 0
+        for delta in deltas:
+            time += delta
+            self.times.append(time / 1000000.)
+
+        if self.count > 0:
+            self.range = self.times[-1]
+        else:
+            self.range = 0.
+
+    def event(self, i):
+        e = [self.times[i], self.name_list[self.names[i]]]
+        if i in self.strings:
+            e.append(self.strings[i])
+        elif self.args[i] == self.args[i]: # not NaN
+            e.append(self.args[i])
+        return e
+
+    # Returns the events between start and end (in seconds since the start
+    # of the run), as seen at a resolution of height pixels for the window.
+    # The window is divided into buckets of bucket_size pixels; events in
+    # buckets with only a few events are returned individually in 'events',
+    # other buckets are summarized in 'clusters' as
+    # [first time, last time, count, { name: count }].
+    def query(self, start, end, height, bucket_size):
+        times = self.times
+        lo = bisect_left(times, start)
+        hi = bisect_right(times, end)
+
+        events = []
+        clusters = []
+        bucket_time = (end - start) * bucket_size / float(height)
+
+        i = lo
+        while i < hi:
+            bucket = int((times[i] - start) / bucket_time)
+            j = bisect_left(times, start + (bucket + 1) * bucket_time, i + 1, hi)
+            if j - i > MAX_BUCKET_EVENTS:
+                by_index = {}
+                for name in self.names[i:j]:
+                    by_index[name] = by_index.get(name, 0) + 1
+                counts = {}
+                for name, count in by_index.iteritems():
+                    counts[self.name_list[name]] = count
+                clusters.append([times[i], times[j - 1], j - i, counts])
+            else:
+                for k in xrange(i, j):
+                    events.append(self.event(k))
+            i = j
+
+        return { 'events': events, 'clusters': clusters }
+
+    # The pixel rows (out of height for the whole run) that have at least
+    # one event in them; used to draw the overview in the scrollbar
+    def overview(self, height):
+        rows = []
+        if self.count == 0 or self.range == 0:
+            return rows
+
+        times = self.times
+        last = 0
+        for row in xrange(0, height):
+            next = bisect_left(times, self.range * (row + 1) / height, last)
+            if row == height - 1:
+                next = self.count
+            if next > last:
+                rows.append(row)
+            last = next
+
+        return rows
+
+def _read_run(f, run_index):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise EventLogError("Not an event log")
+    version, header_length = struct.unpack('<II', f.read(8))
+    if version != VERSION:
+        raise EventLogError("Unknown event log version %d" % version)
+
+    header = json.loads(f.read(header_length))
+    f.read((8 - (len(MAGIC) + 8 + header_length) % 8) % 8)
+
+    runs = header['runs']
+    if run_index < 0 or run_index >= len(runs):
+        raise EventLogError("No run %d" % run_index)
+
+    for run in runs[0:run_index]:
+        length = 14 * run['count']
+        while length > 0:
+            length -= len(f.read(min(length, 64 * 1024)))
+        f.read((8 - (14 * run['count']) % 8) % 8)
+
+    run = runs[run_index]
+    columns = []
+    for typecode in ('d', 'I', 'H'):
+        column = array(typecode)
+        column.fromstring(f.read(column.itemsize * run['count']))
+        columns.append(_to_little_endian(column))
+
+    return RunIndex(header, run, *columns)
+
+_run_cache = {}
+_run_cache_order = []
+_run_cache_lock = threading.Lock()
+
+# Returns the RunIndex for a run of the log stored at path
+def load_run(path, run_index):
+    key = (path, run_index)
+    _run_cache_lock.acquire()
+    try:
+        if key in _run_cache:
+            _run_cache_order.remove(key)
+            _run_cache_order.append(key)
+            return _run_cache[key]
+    finally:
+        _run_cache_lock.release()
+
+    gunzip = GzipFile(path, "r")
+    try:
+        run = _read_run(gunzip, run_index)
+    finally:
+        gunzip.close()
+
+    _run_cache_lock.acquire()
+    try:
+        if not key in _run_cache:
+            _run_cache[key] = run
+            _run_cache_order.append(key)
+
+        total = 0
+        for cached in _run_cache.itervalues():
+            total += cached.count
+        while total > CACHE_MAX_EVENTS and len(_run_cache_order) > 1:
+            old_key = _run_cache_order.pop(0)
+            total -= _run_cache[old_key].count
+            del _run_cache[old_key]
+    finally:
+        _run_cache_lock.release()
+
+    return run
@@ -0,0 +1,306 @@
+import datetime
+import os
+import time
+import traceback
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+
+from models import EventLog, LatestReport, Metric, MetricDefinition, SystemBaseline, Report, ReportInfo, ReportStatistics, RunValues, UploadJob
+import compression
+import event_log
+import instrumentation
+import json_stream
+import page_cache
+import reduction
+import util
+
+# Processing of uploaded reports. The upload view only checks the
+# signature of the request and saves the body as an UploadJob; the work
+# of parsing the report, reducing the metrics, compressing the report and
+# storing everything in the database is done here, normally by the
+# 'manage.py process_uploads' worker processes.
+
+# Members of the top-level report object that we need to store the
+# report; everything else (in particular, the event logs) is only
+# compressed and stored.
+_HEADER_FIELDS = ReportInfo.HEADER_FIELDS + ('events',)
+_REQUIRED_HEADER_FIELDS = ('date', 'metrics')
+# Fields of each metric that are used when storing the report
+_REQUIRED_METRIC_FIELDS = ('description', 'units', 'values')
+
+# A job that has been processing for longer than this is assumed to
+# belong to a worker that died, and is queued again
+JOB_TIMEOUT = 60 * 60
+
+class MalformedReport(Exception):
+    pass
+
+# File-like object wrapping the uploaded body of a report. As the JSON
+# reader pulls the body through, it is converted to UTF-8 and compressed
+# into the output file, so the report is only processed in a single pass.
+class _ReportStream:
+    def __init__(self, f, out, chunk_size=64*1024):
+        self.__f = f
+        self.__out = out
+        self.__chunk_size = chunk_size
+        self.__transcoder = util.JsonUtf8Transcoder()
+        self.__done = False
+
+    def read(self, size=-1):
+        while not self.__done:
+            raw = self.__f.read(self.__chunk_size)
+            if raw:
+                data = self.__transcoder.feed(raw)
+            else:
+                self.__done = True
+                data = self.__transcoder.finish()
+
+            if data:
+                self.__out.write(data)
+                return data
+
+        return ''
+
+# A report that has been parsed and compressed, ready to be stored
+class _ParsedReport:
+    def __init__(self, job):
+        self.job = job
+        self.header = None
+        self.date = None
+        self.statistics = None
+        self.codec = compression.get_codec(settings.REPORT_CODEC)
+        self.spool = TemporaryUploadedFile(job.system.name + self.codec.extension, self.codec.mimetype, 0, None)
+        self.log_writer = event_log.EventLogWriter()
+        # Files moved into place by _store_report(), to be deleted if the
+        # transaction is rolled back
+        self.stored_paths = []
+
+    def close(self):
+        self.spool.close()
+        self.log_writer.close()
+
+# Parses and compresses the report uploaded for job. Raises MalformedReport
+# if the report can't be parsed.
+def _parse_job(job):
+    parsed = _ParsedReport(job)
+    try:
+        out = parsed.codec.writer(parsed.spool, job.system.name, settings.REPORT_COMPRESS_LEVEL)
+
+        # Reading from the stream includes compressing the report, so the
+        # time is split into that and parsing
+        start = time.time()
+        f = open(job.upload.path, 'rb')
+        try:
+            stream = instrumentation.TimedReader(_ReportStream(f, out))
+            try:
+                header = json_stream.read_members(stream, _HEADER_FIELDS,
+                                                  { 'logs': parsed.log_writer.read_logs })
+            except ValueError, e:
+                raise MalformedReport(str(e))
+        finally:
+            f.close()
+        instrumentation.observe_read(start, stream, 'read_compress', 'json_parse')
+
+        out.close()
+
+        for field in _REQUIRED_HEADER_FIELDS:
+            if not field in header:
+                raise MalformedReport("'%s' missing" % field)
+
+        try:
+            parsed.date = util.parse_isodate(header['date'])
+            # Checked here rather than when storing the report, where a
+            # missing field would fail the whole batch it is stored with
+            for name, metric in header['metrics'].iteritems():
+                for field in _REQUIRED_METRIC_FIELDS:
+                    if not field in metric:
+                        raise MalformedReport("'%s' missing for metric '%s'" % (field, name))
+            parsed.statistics = reduction.reduce_metrics(header['metrics'])
+        except (ValueError, KeyError, TypeError, AttributeError), e:
+            raise MalformedReport("Bad metrics: %s" % e)
+
+        parsed.header = header
+    except:
+        parsed.close()
+        raise
+
+    return parsed
+
+def _store_report(parsed, definitions):
+    system = parsed.job.system
+    reportJson = parsed.header
+    date = parsed.date
+    spool = parsed.spool
+    log_writer = parsed.log_writer
+
+    metrics = reportJson['metrics']
+
+    report = Report(system=system, date=date)
+
+    filename = system.name + "-" + date.strftime("%Y%m%d-%H%M%S") + parsed.codec.extension
+
+    # The compressed report is already on disk, so this just moves it
+    # into place
+    spool.flush()
+    spool.size = spool.tell()
+    report.upload.save(filename, spool, save=False)
+    parsed.stored_paths.append(report.upload.path)
+    report.save()
+    LatestReport.objects.update_for_report(report)
+    ReportInfo.objects.create_from_header(report, reportJson)
+    ReportStatistics.objects.create_for_report(report, parsed.statistics)
+    if log_writer.error is None:
+        log = EventLog.objects.create_from_writer(report, log_writer, reportJson.get('events', []))
+        parsed.stored_paths.append(log.upload.path)
+
+    values = [(definitions[(name, metric['description'], metric['units'])], metric['value'])
+              for name, metric in metrics.iteritems()]
+
+    Metric.objects.bulk_insert([Metric(report=report, definition=definition, value=value)
+                                for definition, value in values])
+    RunValues.objects.bulk_insert([RunValues(report=report,
+                                             definition=definitions[(name, metric['description'], metric['units'])],
+                                             values=metric['values'])
+                                   for name, metric in metrics.iteritems()])
+
+    return report, values
+
+# The reports, all of their metrics, and the new states of the jobs are
+# written in a single transaction
+@transaction.commit_on_success
+def _store_reports(parsed_reports):
+    keys = []
+    for parsed in parsed_reports:
+        keys.extend([(name, metric['description'], metric['units'])
+                     for name, metric in parsed.header['metrics'].iteritems()])
+    definitions = MetricDefinition.objects.get_for_keys(keys)
+
+    # In date order, so the baselines for regression detection see the
+    # reports in the right order
+    by_system = {}
+    for parsed in sorted(parsed_reports, key=lambda parsed: parsed.date):
+        report, values = _store_report(parsed, definitions)
+        by_system.setdefault(report.system_id, []).append((report, values))
+
+        job = parsed.job
+        job.state = 'done'
+        job.report = report
+        job.error = ''
+        job.finished = datetime.datetime.now()
+        job.save()
+
+    for reports in by_system.itervalues():
+        SystemBaseline.objects.update_for_reports(reports)
+
+def _fail_job(job, error):
+    job.state = 'failed'
+    # The transaction that stored the report may have been rolled back
+    job.report = None
+    job.error = error[0:1023]
+    job.finished = datetime.datetime.now()
+    job.save()
+
+def _fail_job_with_exception(job, e):
+    # Anything other than a malformed report is probably a problem on our
+    # side, which might go away if the job is retried
+    traceback.print_exc()
+    _fail_job(job, "%s: %s" % (e.__class__.__name__, e))
+
+# Processes jobs that have been claimed (or just created), recording the
+# outcome in each job. The reports that can be parsed are stored in one
+# transaction, which is much faster than committing each separately when
+# there are many of them. Returns the number of reports stored.
+def run_jobs(jobs):
+    parsed_reports = []
+    try:
+        for job in jobs:
+            try:
+                parsed_reports.append(_parse_job(job))
+            except MalformedReport, e:
+                _fail_job(job, "Malformed report: %s" % e)
+            except Exception, e:
+                _fail_job_with_exception(job, e)
+
+        if len(parsed_reports) == 0:
+            return 0
+
+        try:
+            _store_reports(parsed_reports)
+        except Exception, e:
+            # The rows pointing to the files were rolled back
+            for parsed in parsed_reports:
+                for path in parsed.stored_paths:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                parsed.stored_paths = []
+
+            if len(parsed_reports) == 1:
+                _fail_job_with_exception(parsed_reports[0].job, e)
+                return 0
+
+            # Find out which report caused the problem by processing them
+            # one at a time. The transaction was rolled back, and the
+            # compressed reports that were moved into place have been
+            # deleted, so start over from the uploaded bodies.
+            for parsed in parsed_reports:
+                parsed.close()
+            stored = 0
+            for parsed in parsed_reports:
+                stored += run_jobs([parsed.job])
+            return stored
+    finally:
+        for parsed in parsed_reports:
+            parsed.close()
+
+    systems = {}
+    for parsed in parsed_reports:
+        job = parsed.job
+        # The body is included in the stored report, so there's no need
+        # to keep it around
+        job.upload.delete(save=False)
+        job.save()
+        systems[job.system.name] = True
+
+    # Only after the transaction has been committed, so the pages can't
+    # be re-rendered and cached with the old data
+    page_cache.invalidate('uploads', *['system:' + name for name in systems])
+
+    return len(parsed_reports)
+
+def run_job(job):
+    return run_jobs([job]) == 1
+
+# Takes up to limit of the oldest queued jobs for this process to work
+# on; an empty list means there is nothing to do. Any number of workers
+# can call this at once; the UPDATE for each job only succeeds for one of
+# them.
+def claim_jobs(limit):
+    now = datetime.datetime.now()
+
+    stale = now - datetime.timedelta(seconds=JOB_TIMEOUT)
+    UploadJob.objects.filter(state='processing', started__lt=stale).update(state='queued')
+
+    claimed = []
+    candidates = list(UploadJob.objects.filter(state='queued').order_by('id').values_list('id', flat=True)[0:limit])
+    for job_id in candidates:
+        if UploadJob.objects.filter(id=job_id, state='queued').update(state='processing', started=now) == 1:
+            claimed.append(job_id)
+
+    jobs = list(UploadJob.objects.select_related('system').filter(id__in=claimed).order_by('id'))
+    for job in jobs:
+        job.attempts += 1
+        job.save()
+
+    return jobs
+
+# Puts failed jobs back on the queue; if job_ids is None, all of them
+def retry_jobs(job_ids=None):
+    jobs = UploadJob.objects.filter(state='failed')
+    if job_ids is not None:
+        jobs = jobs.filter(id__in=job_ids)
+
+    return jobs.update(state='queued', error='')
@@ -0,0 +1,358 @@
+import errno
+import fcntl
+import os
+import socket
+import threading
+import time
+try:
+    import json
+except:
+    import simplejson as json
+
+from django.conf import settings
+from django.db import connection
+
+# Counters and histograms of where the time goes in handling requests,
+# exposed in the Prometheus text format at /metrics.
+#
+# Each process keeps its own samples in memory, and every FLUSH_INTERVAL
+# seconds writes them to a file of its own in DATA_ROOT/metrics. /metrics
+# adds up the files of all the processes - the web server processes and
+# the upload workers alike - so it doesn't matter which process a scrape
+# ends up in. The files of processes that have exited are folded into
+# a single file of retired samples, so the counts never go backwards.
+#
+# All samples are counters (a histogram is a set of counters for the
+# buckets, the sum and the count), so combining processes is just adding.
+
+FLUSH_INTERVAL = 10
+
+# Upper bounds of the histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name: (type, help)
+METRICS = {
+    'shell_perf_requests_total':
+        ('counter', "Requests handled, by view, method and response status"),
+    'shell_perf_request_duration_seconds':
+        ('histogram', "Time to handle requests, by view; doesn't include streaming the response"),
+    'shell_perf_sql_queries_total':
+        ('counter', "SQL queries made while handling requests, by view"),
+    'shell_perf_sql_duration_seconds_total':
+        ('counter', "Time spent in SQL queries while handling requests, by view"),
+    'shell_perf_request_body_bytes_total':
+        ('counter', "Bytes of request bodies received (uploads), by view"),
+    'shell_perf_step_duration_seconds':
+        ('histogram', "Time spent in steps of processing reports, such as decompressing and parsing, by view and step"),
+}
+
+_RETIRED = 'retired.json'
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_samples = {}
+_owner = None
+_last_flush = 0
+_current = threading.local()
+
+# The samples belong to the process that recorded them; after a fork,
+# the child starts over with none
+def _check_owner():
+    global _owner, _samples, _last_flush
+    if _owner is None or _owner[1] != os.getpid():
+        _owner = (socket.gethostname(), os.getpid(), int(time.time() * 1000))
+        _samples = {}
+        _last_flush = time.time()
+
+def _add(name, labels, amount):
+    key = (name, tuple(sorted(labels.items())))
+    _lock.acquire()
+    try:
+        _check_owner()
+        _samples[key] = _samples.get(key, 0) + amount
+    finally:
+        _lock.release()
+
+def inc(name, labels, amount=1):
+    _add(name, labels, amount)
+
+def observe(name, labels, value, buckets=DURATION_BUCKETS):
+    for bound in buckets:
+        if value <= bound:
+            bucket_labels = dict(labels)
+            bucket_labels['le'] = repr(float(bound))
+            _add(name + '_bucket', bucket_labels, 1)
+    bucket_labels = dict(labels)
+    bucket_labels['le'] = '+Inf'
+    _add(name + '_bucket', bucket_labels, 1)
+    _add(name + '_sum', labels, value)
+    _add(name + '_count', labels, 1)
+
+# The view being handled by this thread, used to label the samples
+# recorded while handling it
+def _current_view():
+    return getattr(_current, 'view', None) or 'none'
+
+def observe_step(step, seconds):
+    observe('shell_perf_step_duration_seconds', { 'view': _current_view(), 'step': step }, seconds)
+
+# File-like object that keeps track of the time spent reading from f;
+# used to separate the time to decompress a report from the time to parse
+# it when the two are interleaved
+class TimedReader:
+    def __init__(self, f):
+        self.__f = f
+        self.elapsed = 0.
+
+    def read(self, size=-1):
+        start = time.time()
+        try:
+            return self.__f.read(size)
+        finally:
+            self.elapsed += time.time() - start
+
+    def close(self):
+        self.__f.close()
+
+# Records the time since start, split into the time spent reading from
+# reader as read_step and the rest as parse_step
+def observe_read(start, reader, read_step, parse_step):
+    total = time.time() - start
+    observe_step(read_step, reader.elapsed)
+    observe_step(parse_step, max(total - reader.elapsed, 0))
+
+class _TimedCursor:
+    def __init__(self, cursor):
+        self.__cursor = cursor
+
+    def __record(self, start):
+        if getattr(_current, 'active', False):
+            _current.sql_queries += 1
+            _current.sql_time += time.time() - start
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.__cursor.execute(sql, params)
+        finally:
+            self.__record(start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.__cursor.executemany(sql, param_list)
+        finally:
+            self.__record(start)
+
+    def __iter__(self):
+        return iter(self.__cursor)
+
+    def __getattr__(self, attr):
+        return getattr(self.__cursor, attr)
+
+# Wraps all database cursors to count and time the queries. The
+# connection is thread-local, so this is done on its class.
+def _install_cursor_wrapper():
+    cls = connection.__class__
+    if getattr(cls, '_perf_timed_cursor', False):
+        return
+
+    original_cursor = cls.cursor
+    def cursor(self):
+        return _TimedCursor(original_cursor(self))
+    cls.cursor = cursor
+    cls._perf_timed_cursor = True
+
+def _metrics_directory():
+    return os.path.join(settings.DATA_ROOT, 'metrics')
+
+def _write_json(path, data):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    f = open(tmp, 'w')
+    try:
+        json.dump(data, f)
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+def _read_json(path):
+    try:
+        f = open(path)
+    except IOError:
+        return []
+    try:
+        try:
+            return json.load(f)
+        except ValueError:
+            return []
+    finally:
+        f.close()
+
+# Writes the samples of this process to its file; unless force is set,
+# only if FLUSH_INTERVAL has passed since the last time
+def flush(force=False):
+    global _last_flush
+    # Held while writing, so that the snapshots of a process are written
+    # in order
+    _flush_lock.acquire()
+    try:
+        _lock.acquire()
+        try:
+            _check_owner()
+            if not force and time.time() < _last_flush + FLUSH_INTERVAL:
+                return
+            _last_flush = time.time()
+            data = [[name, list(labels), value] for (name, labels), value in _samples.iteritems()]
+            filename = "%s-%d-%d.json" % _owner
+        finally:
+            _lock.release()
+
+        directory = _metrics_directory()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        _write_json(os.path.join(directory, filename), data)
+    finally:
+        _flush_lock.release()
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno != errno.ESRCH
+    return True
+
+def _sum_into(totals, data):
+    for name, labels, value in data:
+        key = (name, tuple([tuple(l) for l in labels]))
+        totals[key] = totals.get(key, 0) + value
+
+# Folds the files of exited processes on this host into the retired file
+def _retire_exited(directory):
+    hostname = socket.gethostname()
+
+    exited = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        parts = filename[:-len('.json')].rsplit('-', 2)
+        if len(parts) != 3 or parts[0] != hostname:
+            continue
+        try:
+            pid = int(parts[1])
+        except ValueError:
+            continue
+        if not _process_exists(pid):
+            exited.append(filename)
+
+    if len(exited) == 0:
+        return
+
+    totals = {}
+    _sum_into(totals, _read_json(os.path.join(directory, _RETIRED)))
+    for filename in exited:
+        _sum_into(totals, _read_json(os.path.join(directory, filename)))
+    _write_json(os.path.join(directory, _RETIRED),
+                [[name, list(labels), value] for (name, labels), value in totals.iteritems()])
+    for filename in exited:
+        os.unlink(os.path.join(directory, filename))
+
+# The samples of all processes, added up
+def _read_all():
+    directory = _metrics_directory()
+
+    # So that files aren't counted both before and after being retired
+    lock = open(os.path.join(directory, '.lock'), 'w')
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        _retire_exited(directory)
+
+        totals = {}
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                _sum_into(totals, _read_json(os.path.join(directory, filename)))
+    finally:
+        lock.close()
+
+    return totals
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float) and value != int(value):
+        return repr(value)
+    return str(int(value))
+
+# The samples of all processes, in the Prometheus text format
+def render():
+    flush(force=True)
+    totals = _read_all()
+
+    by_metric = {}
+    for (name, labels), value in totals.iteritems():
+        base = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                base = name[:-len(suffix)]
+        by_metric.setdefault(base, []).append((name, labels, value))
+
+    lines = []
+    for base in sorted(by_metric.keys()):
+        if base in METRICS:
+            metric_type, help = METRICS[base]
+            lines.append("# HELP %s %s" % (base, help))
+            lines.append("# TYPE %s %s" % (base, metric_type))
+        for name, labels, value in sorted(by_metric[base]):
+            label_text = ",".join(['%s="%s"' % (k, _escape_label(v)) for k, v in labels])
+            if label_text:
+                lines.append("%s{%s} %s" % (name, label_text, _format_value(value)))
+            else:
+                lines.append("%s %s" % (name, _format_value(value)))
+
+    return "\n".join(lines) + "\n"
+
+# Records the time, SQL queries and body size of each request. This should
+# be first in MIDDLEWARE_CLASSES, so that the time of the other middleware
+# is included.
+class InstrumentationMiddleware(object):
+    def __init__(self):
+        _install_cursor_wrapper()
+
+    def process_request(self, request):
+        _current.active = True
+        _current.start = time.time()
+        _current.view = 'unknown'
+        _current.sql_queries = 0
+        _current.sql_time = 0.
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current.view = view_func.__name__
+
+    def process_response(self, request, response):
+        if not getattr(_current, 'active', False):
+            return response
+        _current.active = False
+
+        view = _current.view
+        observe('shell_perf_request_duration_seconds', { 'view': view }, time.time() - _current.start)
+        inc('shell_perf_requests_total', { 'view': view,
+                                           'method': request.method,
+                                           'status': str(response.status_code) })
+        inc('shell_perf_sql_queries_total', { 'view': view }, _current.sql_queries)
+        inc('shell_perf_sql_duration_seconds_total', { 'view': view }, _current.sql_time)
+
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > 0:
+            inc('shell_perf_request_body_bytes_total', { 'view': view }, length)
+
+        flush()
+
+        return response
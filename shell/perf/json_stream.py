@@ -0,0 +1,326 @@
+try:
+    import json
+except:
+    import simplejson as json
+import re
+
+# A minimal pull-style reader for JSON documents that are too big to
+# comfortably hold in memory. It only understands enough of the
+# syntax to find the boundaries of values; a value that the caller
+# actually wants is captured as text and handed to json.loads(), so
+# validation of the interesting parts is left to the json module, while
+# skipped values (like the event logs in a report) are never kept
+# around in memory. Skipped values are still checked to be valid JSON,
+# unless the reader is created with check_skipped=False for a document
+# that is known to be valid (say, a report that was checked when it was
+# uploaded).
+#
+# Usage is something like:
+#
+#  reader = JsonReader(f)
+#  for key in reader.iter_object():
+#      if key == 'metrics':
+#          metrics = reader.read_value()
+#      else:
+#          reader.skip_value()
+#
+# After each key or element that iter_object() or iter_array() yields,
+# the caller must consume exactly one value, either with read_value(),
+# skip_value(), or a nested iter_object()/iter_array().
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE_RE = re.compile(r'[ \t\r\n]*')
+_STRING_SPECIAL_RE = re.compile(r'[\\"]')
+_STRUCTURE_RE = re.compile(r'[\[\]{}"]')
+_SCALAR_END_RE = re.compile(r'[,:\]}\s]')
+# Characters in a string that need a closer look when checking it; the
+# json module doesn't allow control characters in strings
+_STRING_CHECK_RE = re.compile(r'[\\"\x00-\x1f]')
+_ESCAPE_RE = re.compile(r'["\\/bfnrt]|u[0-9a-fA-F]{4}')
+# NaN and the infinities are accepted by json.loads() too
+_SCALAR_RE = re.compile(r'(?:true|false|null|NaN|-?Infinity|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)$')
+
+# What can come next while checking a skipped value
+_VALUE = 0
+_VALUE_OR_CLOSE = 1 # after '['
+_KEY = 2
+_KEY_OR_CLOSE = 3 # after '{'
+_AFTER_VALUE = 4
+
+class JsonReader:
+    def __init__(self, f, chunk_size=CHUNK_SIZE, check_skipped=True):
+        self.__f = f
+        self.__chunk_size = chunk_size
+        self.__check_skipped = check_skipped
+        self.__buf = ''
+        self.__pos = 0
+        self.__capture = None
+        self.__capture_start = 0
+
+    # Read more data into the buffer, discarding the part we've already
+    # consumed. Returns False at the end of the input.
+    def __fill(self):
+        data = self.__f.read(self.__chunk_size)
+        if not data:
+            return False
+
+        if self.__capture is not None:
+            self.__capture.append(self.__buf[self.__capture_start:self.__pos])
+            self.__capture_start = 0
+
+        self.__buf = self.__buf[self.__pos:] + data
+        self.__pos = 0
+
+        return True
+
+    # Returns the next non-whitespace character without consuming it,
+    # or '' at the end of the input
+    def __peek(self):
+        while True:
+            self.__pos = _WHITESPACE_RE.match(self.__buf, self.__pos).end()
+            if self.__pos < len(self.__buf):
+                return self.__buf[self.__pos]
+            if not self.__fill():
+                return ''
+
+    def __expect(self, c):
+        found = self.__peek()
+        if found != c:
+            raise ValueError("Expected '%s', found '%s'" % (c, found))
+        self.__pos += 1
+
+    def __search(self, regexp):
+        while True:
+            m = regexp.search(self.__buf, self.__pos)
+            if m is not None:
+                return m
+            self.__pos = len(self.__buf)
+            if not self.__fill():
+                return None
+
+    # With check, also checks the escapes and that there are no control
+    # characters
+    def __skip_string(self, check=False):
+        if check:
+            special = _STRING_CHECK_RE
+            # Longest escape after the backslash
+            escape_length = 5
+        else:
+            special = _STRING_SPECIAL_RE
+            escape_length = 1
+
+        self.__pos += 1 # opening quote
+        while True:
+            m = self.__search(special)
+            if m is None:
+                raise ValueError("Unterminated string")
+            c = m.group()
+            if c == '"':
+                self.__pos = m.end()
+                return
+            if c != '\\':
+                raise ValueError("Control character in string")
+            # Backslash escape; make sure that we have the escaped
+            # characters in the buffer before skipping over them
+            if m.end() + escape_length > len(self.__buf):
+                self.__pos = m.start()
+                if self.__fill():
+                    continue
+                if m.end() >= len(self.__buf):
+                    raise ValueError("Unterminated string")
+            if check:
+                escape = _ESCAPE_RE.match(self.__buf, m.end())
+                if escape is None:
+                    raise ValueError("Bad escape in string")
+                self.__pos = escape.end()
+            else:
+                self.__pos = m.end() + 1
+
+    def __skip_compound(self):
+        depth = 0
+        while True:
+            m = self.__search(_STRUCTURE_RE)
+            if m is None:
+                raise ValueError("Unexpected end of document")
+            c = m.group()
+            if c == '"':
+                self.__pos = m.start()
+                self.__skip_string()
+            else:
+                self.__pos = m.end()
+                if c == '[' or c == '{':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+
+    def __skip_scalar(self, check=False):
+        pieces = []
+        while True:
+            m = _SCALAR_END_RE.search(self.__buf, self.__pos)
+            end = len(self.__buf)
+            if m is not None:
+                end = m.start()
+            pieces.append(self.__buf[self.__pos:end])
+            self.__pos = end
+            if m is not None or not self.__fill():
+                break
+
+        text = ''.join(pieces)
+        if text == '' or (check and _SCALAR_RE.match(text) is None):
+            raise ValueError("Expected value")
+
+    # Finds the end of the next value, only looking at as much of the
+    # syntax as that needs
+    def __skip_unchecked(self):
+        c = self.__peek()
+        if c == '':
+            raise ValueError("Unexpected end of document")
+        elif c == '"':
+            self.__skip_string()
+        elif c == '[' or c == '{':
+            self.__skip_compound()
+        else:
+            self.__skip_scalar()
+
+    # Skips the next value, raising ValueError for anything that
+    # json.loads() would reject
+    def __skip_checked(self):
+        # The closing characters of the arrays and objects we're in
+        stack = []
+        state = _VALUE
+        while True:
+            c = self.__peek()
+            if state == _AFTER_VALUE:
+                if len(stack) == 0:
+                    return
+                if c == stack[-1]:
+                    self.__pos += 1
+                    stack.pop()
+                elif c == ',':
+                    self.__pos += 1
+                    if stack[-1] == '}':
+                        state = _KEY
+                    else:
+                        state = _VALUE
+                else:
+                    raise ValueError("Expected ',' or '%s', found '%s'" % (stack[-1], c))
+            elif state == _KEY or state == _KEY_OR_CLOSE:
+                if c == '}' and state == _KEY_OR_CLOSE:
+                    self.__pos += 1
+                    stack.pop()
+                    state = _AFTER_VALUE
+                elif c == '"':
+                    self.__skip_string(True)
+                    self.__expect(':')
+                    state = _VALUE
+                else:
+                    raise ValueError("Expected object key")
+            else:
+                if c == ']' and state == _VALUE_OR_CLOSE:
+                    self.__pos += 1
+                    stack.pop()
+                    state = _AFTER_VALUE
+                elif c == '{':
+                    self.__pos += 1
+                    stack.append('}')
+                    state = _KEY_OR_CLOSE
+                elif c == '[':
+                    self.__pos += 1
+                    stack.append(']')
+                    state = _VALUE_OR_CLOSE
+                elif c == '"':
+                    self.__skip_string(True)
+                    state = _AFTER_VALUE
+                elif c == '':
+                    raise ValueError("Unexpected end of document")
+                else:
+                    self.__skip_scalar(True)
+                    state = _AFTER_VALUE
+
+    def skip_value(self):
+        if self.__check_skipped:
+            self.__skip_checked()
+        else:
+            self.__skip_unchecked()
+
+    def read_value(self):
+        self.__peek()
+        self.__capture = []
+        self.__capture_start = self.__pos
+        try:
+            # json.loads() checks the value
+            self.__skip_unchecked()
+            self.__capture.append(self.__buf[self.__capture_start:self.__pos])
+            text = ''.join(self.__capture)
+        finally:
+            self.__capture = None
+
+        return json.loads(text)
+
+    def __end_member(self, close):
+        c = self.__peek()
+        if c == close:
+            self.__pos += 1
+            return True
+        elif c == ',':
+            self.__pos += 1
+            return False
+        else:
+            raise ValueError("Expected ',' or '%s', found '%s'" % (close, c))
+
+    # Yields the key of each member of an object in turn
+    def iter_object(self):
+        self.__expect('{')
+        if self.__peek() == '}':
+            self.__pos += 1
+            return
+
+        while True:
+            if self.__peek() != '"':
+                raise ValueError("Expected object key")
+            key = self.read_value()
+            self.__expect(':')
+            yield key
+            if self.__end_member('}'):
+                return
+
+    # Yields the index of each element of an array in turn
+    def iter_array(self):
+        self.__expect('[')
+        if self.__peek() == ']':
+            self.__pos += 1
+            return
+
+        i = 0
+        while True:
+            yield i
+            i += 1
+            if self.__end_member(']'):
+                return
+
+    # Checks that nothing but whitespace follows the document
+    def finish(self):
+        if self.__peek() != '':
+            raise ValueError("Extra data after end of document")
+
+# Reads the top-level object of a document, returning a dictionary with
+# the members with the given names. handlers can map other member names
+# to functions that are called with the reader to consume the value
+# themselves; everything else is skipped (see JsonReader for
+# check_skipped).
+def read_members(f, names, handlers={}, check_skipped=True):
+    result = {}
+    reader = JsonReader(f, check_skipped=check_skipped)
+    for key in reader.iter_object():
+        if key in names:
+            result[key] = reader.read_value()
+        elif key in handlers:
+            handlers[key](reader)
+        else:
+            reader.skip_value()
+    reader.finish()
+
+    return result
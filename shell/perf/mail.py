@@ -0,0 +1,140 @@
+import datetime
+import re
+import smtplib
+import socket
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from models import OutgoingMail
+
+# Mail is never sent from within a request, since a slow or unreachable
+# mail server would hold up the request for the whole SMTP timeout.
+# send_email() just adds the message to the OutgoingMail table, and a
+# separate worker process ('manage.py send_mail') delivers queued mail
+# over a single SMTP connection that it reuses between messages.
+
+# Number of messages to take from the queue at once
+BATCH_SIZE = 20
+
+# Messages that can't be delivered are retried after RETRY_DELAY,
+# doubling for each failed attempt up to MAX_RETRY_DELAY, and given up
+# on after MAX_ATTEMPTS attempts
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 6 * 60 * 60
+MAX_ATTEMPTS = 10
+
+# Close the connection to the server after it's been unused this long
+IDLE_TIMEOUT = 60
+
+# Timeout for connecting to and talking to the server
+SMTP_TIMEOUT = 30
+
+def send_email(template_name, args, toaddr):
+    fullargs = dict(args)
+    fullargs['fromaddr'] = settings.MAIL_FROM
+    fullargs['toaddr'] = toaddr
+    msg = render_to_string(template_name, fullargs)
+
+    OutgoingMail.objects.create(fromaddr=settings.MAIL_FROM,
+                                toaddr=toaddr,
+                                message=msg,
+                                next_attempt=datetime.datetime.now())
+
+def _parse_server(server):
+    m = re.match(r'^([^:]+)(?::(\d+))?$', server)
+    if m is None:
+        raise ValueError("Bad setting for SMTP_SERVER, should be <host>[:<port>]")
+    host = m.group(1)
+    if m.group(2) is not None:
+        port = int(m.group(2))
+    else:
+        port = 25
+
+    return host, port
+
+def _retry_delay(attempts):
+    return datetime.timedelta(seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+# Delivers queued mail. The connection to the SMTP server is opened when
+# there is something to send and kept open between batches.
+class MailSender:
+    def __init__(self, server=None):
+        if server is None:
+            server = settings.SMTP_SERVER
+        self.host, self.port = _parse_server(server)
+        self.__smtp = None
+        self.__last_used = None
+
+        self.sent = 0
+        self.failed = 0
+
+    def __connect(self):
+        if self.__smtp is None:
+            # smtplib.SMTP only takes a timeout argument in Python 2.6
+            old_timeout = socket.getdefaulttimeout()
+            socket.setdefaulttimeout(SMTP_TIMEOUT)
+            try:
+                self.__smtp = smtplib.SMTP(self.host, self.port)
+            finally:
+                socket.setdefaulttimeout(old_timeout)
+
+        return self.__smtp
+
+    def close(self):
+        if self.__smtp is not None:
+            try:
+                self.__smtp.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+            self.__smtp = None
+
+    # Closes the connection if it hasn't been used in a while
+    def close_if_idle(self):
+        if self.__last_used is not None and \
+                datetime.datetime.now() - self.__last_used > datetime.timedelta(seconds=IDLE_TIMEOUT):
+            self.close()
+
+    def __record_failure(self, mail, error, permanent):
+        mail.attempts += 1
+        mail.last_error = str(error)[0:1023]
+        if permanent or mail.attempts >= MAX_ATTEMPTS:
+            mail.failed = True
+            self.failed += 1
+        else:
+            mail.next_attempt = datetime.datetime.now() + _retry_delay(mail.attempts)
+        mail.save()
+
+    # Sends one batch of the mail that is due. Returns the number of
+    # messages that were taken from the queue; 0 means there's nothing
+    # to do right now.
+    def send_batch(self):
+        batch = list(OutgoingMail.objects.filter(failed=False,
+                                                 next_attempt__lte=datetime.datetime.now()).order_by('next_attempt', 'id')[0:BATCH_SIZE])
+
+        for i, mail in enumerate(batch):
+            try:
+                smtp = self.__connect()
+                smtp.sendmail(mail.fromaddr, [mail.toaddr], mail.message.encode('UTF-8'))
+            except smtplib.SMTPRecipientsRefused, e:
+                # The server won't take this message; if that's because of a
+                # temporary (4xx) error, try again later
+                code = min([refusal[0] for refusal in e.recipients.values()])
+                self.__record_failure(mail, e, code >= 500)
+                continue
+            except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError), e:
+                self.__record_failure(mail, e, e.smtp_code >= 500)
+                continue
+            except (smtplib.SMTPException, socket.error), e:
+                # Problem with the server or the connection; drop the
+                # connection and put off the rest of the batch
+                self.close()
+                for unsent in batch[i:]:
+                    self.__record_failure(unsent, e, False)
+                break
+
+            self.__last_used = datetime.datetime.now()
+            mail.delete()
+            self.sent += 1
+
+        return len(batch)
@@ -0,0 +1,24 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from shell.perf.models import LatestReport, Report, System
+
+# Fills in the LatestReport table from the existing reports. This is needed
+# once for a database that has reports from before LatestReport was added;
+# after that, the table is kept up to date when reports are uploaded. It's
+# safe to run again at any time.
+class Command(NoArgsCommand):
+    help = 'Rebuild the table of the latest report for each system'
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        LatestReport.objects.all().delete()
+
+        count = 0
+        for system in System.objects.all():
+            reports = Report.objects.filter(system=system).order_by('-date')[0:1]
+            if len(reports) > 0:
+                LatestReport.objects.create(system=system, report=reports[0], date=reports[0].date)
+                count += 1
+
+        print "Found latest reports for %d systems" % count
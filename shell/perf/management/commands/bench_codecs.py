@@ -0,0 +1,163 @@
+from optparse import make_option
+import os
+from StringIO import StringIO
+import time
+try:
+    import json
+except:
+    import simplejson as json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shell.perf.compression import CODECS, codec_for_path, get_codec
+from shell.perf.models import Report
+
+def _read_file(path):
+    if path.endswith('.json'):
+        f = open(path, 'rb')
+    else:
+        f = codec_for_path(path).open_read(path)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def _load_directory(directory, limit):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            # As written by generate_reports, along with the reports
+            if filename == 'systems.json':
+                continue
+            if filename.endswith('.json') or codec_for_path(filename).extension == os.path.splitext(filename)[1]:
+                paths.append(os.path.join(dirpath, filename))
+    paths.sort()
+
+    return [_read_file(path) for path in paths[0:limit]]
+
+def _load_reports(limit):
+    return [_read_file(report.upload.path) for report in Report.objects.order_by('-id')[0:limit]]
+
+def _compress(codec, level, data):
+    out = StringIO()
+    writer = codec.writer(out, 'report', level)
+    writer.write(data)
+    writer.close()
+    return out.getvalue()
+
+def _decompress(codec, compressed):
+    f = codec.reader(StringIO(compressed))
+    try:
+        while f.read(64 * 1024):
+            pass
+    finally:
+        f.close()
+
+def _percentile(values, p):
+    s = sorted(values)
+    return s[min(len(s) - 1, int(p * len(s)))]
+
+def _measure(codec, level, corpus, repeat):
+    raw_bytes = 0
+    compressed_bytes = 0
+    compress_time = 0.
+    decompress_times = []
+    for data in corpus:
+        start = time.time()
+        compressed = _compress(codec, level, data)
+        compress_time += time.time() - start
+
+        raw_bytes += len(data)
+        compressed_bytes += len(compressed)
+
+        best = None
+        for i in xrange(0, repeat):
+            start = time.time()
+            _decompress(codec, compressed)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        decompress_times.append(1000 * best)
+
+    decompress_total = sum(decompress_times) / 1000.
+    return { 'raw_bytes': raw_bytes,
+             'compressed_bytes': compressed_bytes,
+             'ratio': float(raw_bytes) / max(compressed_bytes, 1),
+             'compress_mb_per_s': raw_bytes / 1e6 / max(compress_time, 1e-9),
+             'decompress_ms': { 'mean': sum(decompress_times) / len(decompress_times),
+                                'p90': _percentile(decompress_times, 0.9),
+                                'max': max(decompress_times) },
+             'decompress_mb_per_s': raw_bytes / 1e6 / max(decompress_total, 1e-9) }
+
+# Measures, for each codec in compression.py, the compression ratio on
+# real reports against the time to compress and decompress them. The
+# reports are the most recently stored ones, or the report files in a
+# directory (plain .json, or compressed with any of the codecs, like those
+# written by 'manage.py generate_reports'). Decompression latency is the
+# best of --repeat times for each report, and is what reading a stored
+# report costs in report_json for clients that can't take the file as is,
+# and when loading data for older reports.
+class Command(BaseCommand):
+    args = '[<directory>]'
+    help = 'Compare the compression codecs for stored reports'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reports', dest='reports', type='int', default=50,
+                    help='Number of reports to use'),
+        make_option('--codecs', dest='codecs', default=None,
+                    help='Comma-separated list of codecs (default: all available)'),
+        make_option('--level', dest='level', type='int', default=None,
+                    help='Compression level (default: the default of each codec)'),
+        make_option('--repeat', dest='repeat', type='int', default=3,
+                    help='Number of times each report is decompressed'),
+        make_option('--output', dest='output', default=None,
+                    help='File to write the results to as JSON'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Usage: bench_codecs [options] [<directory>]")
+        if options['reports'] < 1 or options['repeat'] < 1:
+            raise CommandError("--reports and --repeat must be at least 1")
+
+        if options['codecs'] is None:
+            codec_names = sorted(CODECS.keys())
+        else:
+            codec_names = options['codecs'].split(',')
+        try:
+            codecs = [get_codec(name) for name in codec_names]
+        except ValueError, e:
+            raise CommandError(str(e))
+
+        if len(args) == 1:
+            corpus = _load_directory(args[0], options['reports'])
+        else:
+            corpus = _load_reports(options['reports'])
+        if len(corpus) == 0:
+            raise CommandError("No reports found")
+
+        results = { 'reports': len(corpus),
+                    'level': options['level'],
+                    'codecs': {} }
+        for codec in codecs:
+            results['codecs'][codec.name] = _measure(codec, options['level'], corpus, options['repeat'])
+
+        if options['output'] is not None:
+            f = open(options['output'], 'w')
+            try:
+                json.dump(results, f, indent=4, sort_keys=True)
+            finally:
+                f.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            raw_bytes = results['codecs'][codecs[0].name]['raw_bytes']
+            print "%d reports, %.1f MB uncompressed" % (len(corpus), raw_bytes / 1e6)
+            print "%-8s %12s %8s %14s %12s %12s %14s" % ("codec", "size (MB)", "ratio", "compr. (MB/s)",
+                                                        "decompr. ms", "p90 ms", "decompr. MB/s")
+            for codec in codecs:
+                r = results['codecs'][codec.name]
+                print "%-8s %12.2f %8.2f %14.1f %12.2f %12.2f %14.1f" % (codec.name, r['compressed_bytes'] / 1e6,
+                                                                      r['ratio'], r['compress_mb_per_s'],
+                                                                      r['decompress_ms']['mean'],
+                                                                      r['decompress_ms']['p90'],
+                                                                      r['decompress_mb_per_s'])
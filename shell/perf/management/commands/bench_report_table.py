@@ -0,0 +1,109 @@
+from optparse import make_option
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shell.perf.models import Metric, MetricDefinition, Regression, Report, ReportStatistics, System
+from shell.perf.report_table import ReportTable, COLUMNS_PER_PAGE, LATENCY_BUDGET, ROWS_PER_PAGE
+from shell.perf import reduction
+
+UNITS = ['ms', 's', 'us', 'B', 'KiB', 'frames / s', '']
+
+@transaction.commit_on_success
+def _create_reports(system, n_reports, n_metrics, n_runs):
+    keys = [('bench.metric%04d' % i, "Benchmark metric %d" % i, UNITS[i % len(UNITS)])
+            for i in xrange(0, n_metrics)]
+    definitions = MetricDefinition.objects.get_for_keys(keys)
+
+    date = datetime.datetime(2010, 1, 1)
+    for i in xrange(0, n_reports):
+        date += datetime.timedelta(hours=8)
+        report = Report(system=system, date=date, upload='')
+        report.save()
+
+        metrics = []
+        regressions = []
+        statistics = {}
+        for key in keys:
+            values = [random.uniform(1, 1000) for j in xrange(0, n_runs)]
+            statistics[key[0]] = reduction.compute_statistics(values)
+            value = statistics[key[0]]['min']
+            metrics.append(Metric(report=report, definition=definitions[key], value=value))
+            if random.random() < 0.01:
+                regressions.append(Regression(report=report, definition=definitions[key],
+                                              value=value, baseline=value / 2, spread=1, score=5))
+
+        Metric.objects.bulk_insert(metrics)
+        Regression.objects.bulk_insert(regressions)
+        ReportStatistics.objects.create_for_report(report, statistics)
+
+def _render(system, n_columns):
+    report_table = ReportTable(row_count=ROWS_PER_PAGE, column_count=COLUMNS_PER_PAGE)
+    for report in Report.objects.filter(system=system).order_by('-date')[0:n_columns]:
+        report_table.add_report(report, report.date.strftime("%y-%m-%d"), "report/%d" % report.id)
+
+    return render_to_string('include/report_table.html', { 'report_table': report_table })
+
+# Measures the time to build and render a page of the report table on the
+# system page as the number of reports (columns) grows, and compares it
+# against report_table.LATENCY_BUDGET. Like bench_upload, this runs
+# against a freshly created test database.
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--columns', dest='columns', default='5,20,50,100',
+                    help='Comma-separated list of column counts to benchmark'),
+        make_option('--metrics', dest='metrics', type='int', default=200,
+                    help='Number of metrics in each report'),
+        make_option('--runs', dest='runs', type='int', default=5,
+                    help='Number of runs in each report'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of renders for each column count'),
+    )
+    help = 'Benchmark rendering of the report table against the number of reports'
+
+    def handle(self, *args, **options):
+        try:
+            column_counts = [int(n) for n in options['columns'].split(',')]
+        except ValueError:
+            raise CommandError("--columns should be a comma-separated list of numbers")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            system = System(name='bench-report-table',
+                            owner_email='bench@example.com',
+                            operating_system='Benchmark OS',
+                            graphics='Benchmark graphics',
+                            processor='Benchmark CPU',
+                            notes='',
+                            secret_key='0' * 32)
+            system.save()
+
+            _create_reports(system, max(column_counts), options['metrics'], options['runs'])
+
+            over_budget = False
+            print "%8s %10s %10s %10s" % ("columns", "mean (ms)", "min (ms)", "max (ms)")
+            for n_columns in column_counts:
+                times = []
+                for i in xrange(0, options['repeat']):
+                    start = time.time()
+                    _render(system, n_columns)
+                    times.append(1000 * (time.time() - start))
+
+                mean = sum(times) / len(times)
+                note = ''
+                if mean > 1000 * LATENCY_BUDGET:
+                    note = ' over budget'
+                    over_budget = True
+                print "%8d %10.1f %10.1f %10.1f%s" % (n_columns, mean, min(times), max(times), note)
+
+            if over_budget:
+                print "Latency budget: %d ms" % (1000 * LATENCY_BUDGET)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,87 @@
+from optparse import make_option
+import datetime
+import time
+try:
+    import json
+except:
+    import simplejson as json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shell.perf.models import Report
+from shell.perf import signed_request
+from shell.perf import synthetic
+
+# Measures the latency of system_upload as the number of metrics in a report
+# grows. This runs against a freshly created test database, so it's safe to
+# run on a production installation, though uploaded report files are
+# written to (and then removed from) MEDIA_ROOT.
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--metrics', dest='metrics', default='10,100,300,1000',
+                    help='Comma-separated list of metric counts to benchmark'),
+        make_option('--runs', dest='runs', type='int', default=3,
+                    help='Number of runs in each report'),
+        make_option('--events', dest='events', type='int', default=1000,
+                    help='Number of events in the log for each run'),
+        make_option('--repeat', dest='repeat', type='int', default=10,
+                    help='Number of uploads for each metric count'),
+    )
+    help = 'Benchmark report upload latency against the number of metrics'
+
+    def handle(self, *args, **options):
+        try:
+            metric_counts = [int(n) for n in options['metrics'].split(',')]
+        except ValueError:
+            raise CommandError("--metrics should be a comma-separated list of numbers")
+
+        # Measure the whole of the processing, not just queueing the upload;
+        # all the uploads are from one system, more than the rate limit allows
+        old_deferred = settings.DEFERRED_UPLOADS
+        old_upload_rate = settings.UPLOAD_RATE
+        settings.DEFERRED_UPLOADS = False
+        settings.UPLOAD_RATE = None
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            system = synthetic.Generator().system()
+            system.save()
+
+            client = Client()
+            path = '/system/%s/upload' % system.name
+            date = datetime.datetime(2010, 1, 1)
+
+            print "%8s %10s %10s %10s" % ("metrics", "mean (ms)", "min (ms)", "max (ms)")
+            for n_metrics in metric_counts:
+                generator = synthetic.Generator(n_metrics=n_metrics,
+                                                n_runs=options['runs'],
+                                                n_events=options['events'])
+                times = []
+                for i in xrange(0, options['repeat']):
+                    date += datetime.timedelta(seconds=1)
+                    body = json.dumps(generator.report(system, date))
+                    signature = signed_request.sign(system.secret_key, 'POST',
+                                                    'http://testserver' + path, body)
+
+                    start = time.time()
+                    response = client.post(path, body,
+                                           content_type='application/json',
+                                           HTTP_X_SHELL_SIGNATURE=signature)
+                    times.append(1000 * (time.time() - start))
+
+                    if response.status_code != 200:
+                        raise CommandError("Upload failed: %d %s" % (response.status_code, response.content))
+
+                print "%8d %10.1f %10.1f %10.1f" % (n_metrics, sum(times) / len(times), min(times), max(times))
+        finally:
+            for report in Report.objects.all():
+                report.upload.delete(save=False)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            settings.DEFERRED_UPLOADS = old_deferred
+            settings.UPLOAD_RATE = old_upload_rate
@@ -0,0 +1,35 @@
+from django.core.management.base import NoArgsCommand
+
+from shell.perf.compression import codec_for_path
+from shell.perf.event_log import EventLogWriter
+from shell.perf.json_stream import read_members
+from shell.perf.models import EventLog, Report
+
+# Generates the compact form of the event logs (see event_log.py) for
+# reports uploaded before it was generated at upload time. Reports that
+# already have one are skipped, so this can be interrupted and rerun.
+class Command(NoArgsCommand):
+    help = 'Generate compact event logs for reports that don\'t have them'
+
+    def handle_noargs(self, **options):
+        converted = 0
+        failed = 0
+        for report in Report.objects.filter(eventlog__isnull=True).order_by('id'):
+            writer = EventLogWriter()
+            try:
+                f = codec_for_path(report.upload.path).open_read(report.upload.path)
+                try:
+                    header = read_members(f, ('events',), { 'logs': writer.read_logs }, check_skipped=False)
+                finally:
+                    f.close()
+
+                if writer.error is None:
+                    EventLog.objects.create_from_writer(report, writer, header.get('events', []))
+                    converted += 1
+                else:
+                    print "Report %d: %s" % (report.id, writer.error)
+                    failed += 1
+            finally:
+                writer.close()
+
+        print "Converted %d event logs, %d could not be converted" % (converted, failed)
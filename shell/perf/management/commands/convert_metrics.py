@@ -0,0 +1,64 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+
+from shell.perf.models import Metric, MetricDefinition
+
+LEGACY_TABLE = 'perf_metric'
+
+# Converts metrics stored in the old perf_metric table, where each row
+# repeated the name, description and units of the metric, to
+# MetricDefinition and compact Metric rows. Run 'manage.py syncdb' first
+# to create the new tables.
+#
+# Each batch is converted and deleted from the old table in a single
+# transaction, so the conversion can be interrupted and restarted
+# at any point. The old table is dropped once it is empty.
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=10000,
+                    help='Number of metric rows to convert in each transaction'),
+    )
+    help = 'Convert metrics from the old perf_metric table to the normalized layout'
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+
+        if not LEGACY_TABLE in connection.introspection.table_names():
+            print "No %s table, nothing to convert" % LEGACY_TABLE
+            transaction.rollback()
+            return
+
+        total = 0
+        try:
+            while True:
+                cursor.execute("SELECT id, report_id, name, description, units, value FROM %s "
+                               "ORDER BY id LIMIT %d" % (qn(LEGACY_TABLE), options['batch_size']))
+                rows = cursor.fetchall()
+                if len(rows) == 0:
+                    break
+
+                definitions = MetricDefinition.objects.get_for_keys([(name, description, units)
+                                                                     for id, report_id, name, description, units, value in rows])
+
+                Metric.objects.bulk_insert([Metric(report_id=report_id,
+                                                   definition=definitions[(name, description, units)],
+                                                   value=value)
+                                            for id, report_id, name, description, units, value in rows])
+
+                cursor.execute("DELETE FROM %s WHERE id <= %%s" % qn(LEGACY_TABLE), [rows[-1][0]])
+                transaction.commit()
+
+                total += len(rows)
+                print "Converted %d metrics" % total
+
+            cursor.execute("DROP TABLE %s" % qn(LEGACY_TABLE))
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        print "Conversion complete, dropped %s" % LEGACY_TABLE
@@ -0,0 +1,73 @@
+from optparse import make_option
+import os
+try:
+    import json
+except:
+    import simplejson as json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shell.perf import synthetic
+
+# Writes synthetic systems and reports (see shell/perf/synthetic.py) to a
+# directory: systems.json, with the fields of each system including the
+# secret key needed to sign uploads, and <system>/<date>.json.gz for the
+# reports. Nothing is stored in the database.
+class Command(BaseCommand):
+    args = '<directory>'
+    help = 'Generate synthetic systems and gzip-compressed reports'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--seed', dest='seed', type='int', default=0,
+                    help='Random seed'),
+        make_option('--systems', dest='systems', type='int', default=3,
+                    help='Number of systems'),
+        make_option('--reports', dest='reports', type='int', default=10,
+                    help='Number of reports for each system'),
+        make_option('--metrics', dest='metrics', type='int', default=len(synthetic.METRIC_TEMPLATES),
+                    help='Number of metrics in each report'),
+        make_option('--runs', dest='runs', type='int', default=3,
+                    help='Number of runs in each report'),
+        make_option('--events', dest='events', type='int', default=1000,
+                    help='Number of events in the log for each run'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: generate_reports [options] <directory>")
+        directory = args[0]
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        generator = synthetic.Generator(seed=options['seed'],
+                                        n_metrics=options['metrics'],
+                                        n_runs=options['runs'],
+                                        n_events=options['events'])
+
+        systems = []
+        for i in xrange(0, options['systems']):
+            system = generator.system()
+            systems.append({ 'name': system.name,
+                             'owner_email': system.owner_email,
+                             'operating_system': system.operating_system,
+                             'graphics': system.graphics,
+                             'processor': system.processor,
+                             'notes': system.notes,
+                             'secret_key': system.secret_key })
+
+            system_directory = os.path.join(directory, system.name)
+            if not os.path.isdir(system_directory):
+                os.mkdir(system_directory)
+            for report in generator.reports(system, options['reports']):
+                filename = report['date'].replace(':', '') + ".json.gz"
+                synthetic.write_report(report, os.path.join(system_directory, filename))
+
+        f = open(os.path.join(directory, 'systems.json'), 'w')
+        try:
+            json.dump(systems, f, indent=4)
+        finally:
+            f.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            print "Wrote %d reports for %d systems to %s" % (options['systems'] * options['reports'],
+                                                             options['systems'], directory)
@@ -0,0 +1,98 @@
+from optparse import make_option
+import os
+import signal
+import sys
+import time
+import traceback
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection, transaction
+
+from shell.perf import ingest
+from shell.perf import instrumentation
+
+# Number of jobs to claim at once; the reports for all of them are stored
+# in a single transaction
+BATCH_SIZE = 20
+
+def _work(once, interval):
+    count = 0
+    while True:
+        jobs = ingest.claim_jobs(BATCH_SIZE)
+        if len(jobs) > 0:
+            ingest.run_jobs(jobs)
+            count += len(jobs)
+            instrumentation.flush()
+            continue
+
+        instrumentation.flush(force=True)
+        if once:
+            break
+
+        # Without this, we'd be stuck in a transaction that started with
+        # the first query, and with some databases we'd never see new jobs
+        transaction.commit_unless_managed()
+        time.sleep(interval)
+
+    return count
+
+# The workers that process uploaded reports (see shell/perf/ingest.py).
+# This should be kept running alongside the web server, unless
+# DEFERRED_UPLOADS is turned off. Any number of copies can be run at once,
+# on one or more machines sharing the database and the data directory.
+class Command(NoArgsCommand):
+    help = 'Process uploaded reports'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=2,
+                    help='Number of worker processes'),
+        make_option('--once', action='store_true', dest='once', default=False,
+                    help='Process the queued uploads, then exit'),
+        make_option('--interval', type='int', dest='interval', default=2,
+                    help='Seconds to wait between checks for new uploads'),
+    )
+
+    def handle_noargs(self, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        if workers == 1:
+            count = _work(options['once'], options['interval'])
+            if options['once'] and int(options.get('verbosity', 1)) > 0:
+                print "Processed %d uploads" % count
+            return
+
+        # The children must not share the parent's database connection
+        connection.close()
+
+        children = []
+        for i in xrange(0, workers):
+            pid = os.fork()
+            if pid == 0:
+                status = 0
+                try:
+                    try:
+                        _work(options['once'], options['interval'])
+                    except KeyboardInterrupt:
+                        pass
+                    except:
+                        traceback.print_exc()
+                        status = 1
+                finally:
+                    os._exit(status)
+            children.append(pid)
+
+        try:
+            while len(children) > 0:
+                pid, status = os.wait()
+                if pid in children:
+                    children.remove(pid)
+                if status != 0:
+                    print >>sys.stderr, "Worker %d exited with status %d" % (pid, status)
+        except KeyboardInterrupt:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
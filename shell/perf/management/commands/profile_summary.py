@@ -0,0 +1,18 @@
+from django.core.management.base import NoArgsCommand
+
+from shell.perf import profiling
+
+# Writes the summary.txt of the functions taking the most time for each
+# view that has profiles saved (see profiling.py). The profiles are
+# loaded and added up for this, which is too slow to do on each profiled
+# request.
+class Command(NoArgsCommand):
+    help = 'Summarize the saved request profiles'
+
+    def handle_noargs(self, **options):
+        view_names = profiling.write_summaries()
+        if int(options.get('verbosity', 1)) > 0:
+            if len(view_names) == 0:
+                print "No profiles saved"
+            for view_name in view_names:
+                print "Wrote summary for %s" % view_name
@@ -0,0 +1,254 @@
+from optparse import make_option
+import datetime
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shell.perf.compression import codec_for_path, get_codec
+from shell.perf.models import Report
+
+class _Failed(Exception):
+    pass
+
+# Writes the decompressed contents of source_path compressed with codec
+# to path, and checks that it reads back the same
+def _recompress(source_path, path, codec, level):
+    source_digest = hashlib.sha1()
+    source = codec_for_path(source_path).open_read(source_path)
+    try:
+        out = open(path, 'wb')
+        try:
+            writer = codec.writer(out, os.path.basename(source_path), level)
+            while True:
+                data = source.read(64 * 1024)
+                if not data:
+                    break
+                source_digest.update(data)
+                writer.write(data)
+            writer.close()
+        finally:
+            out.close()
+    finally:
+        source.close()
+
+    digest = hashlib.sha1()
+    f = codec.open_read(path)
+    try:
+        while True:
+            data = f.read(64 * 1024)
+            if not data:
+                break
+            digest.update(data)
+    finally:
+        f.close()
+
+    if digest.digest() != source_digest.digest():
+        raise _Failed("Contents differ after recompressing")
+
+# The replaced files that haven't been deleted yet are also listed in a
+# file in the reports directory, one per running command, so that if a
+# command is interrupted its files are deleted by the next run rather
+# than left behind for good
+_PENDING_PREFIX = 'recompress-pending.'
+
+def _pending_directory():
+    return os.path.join(settings.MEDIA_ROOT, 'reports')
+
+# Returns the (time replaced, path) entries of a pending file
+def _read_pending(path):
+    result = []
+    f = open(path)
+    try:
+        for line in f:
+            # Skip a line cut short by the command being killed
+            if not line.endswith('\n'):
+                continue
+            fields = line[:-1].split(' ', 1)
+            try:
+                result.append((float(fields[0]), fields[1]))
+            except (ValueError, IndexError):
+                pass
+    finally:
+        f.close()
+
+    return result
+
+def _append_pending(path, replaced_time, replaced_path):
+    f = open(path, 'a')
+    try:
+        f.write("%f %s\n" % (replaced_time, replaced_path))
+    finally:
+        f.close()
+
+def _write_pending(path, replaced):
+    if len(replaced) == 0:
+        if os.path.exists(path):
+            os.unlink(path)
+        return
+
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'w')
+    try:
+        for replaced_time, replaced_path in replaced:
+            f.write("%f %s\n" % (replaced_time, replaced_path))
+    finally:
+        f.close()
+    os.rename(tmp_path, path)
+
+# Takes over the files still to be deleted from earlier runs: returns
+# their entries, and writes them to pending_path in place of the files
+# of those runs
+def _take_over_pending(pending_path):
+    directory = _pending_directory()
+    if not os.path.isdir(directory):
+        return []
+
+    replaced = []
+    others = []
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if filename.startswith(_PENDING_PREFIX) and not filename.endswith('.tmp') and path != pending_path:
+            replaced.extend(_read_pending(path))
+            others.append(path)
+
+    replaced.sort()
+    _write_pending(pending_path, replaced)
+    for path in others:
+        os.unlink(path)
+
+    return replaced
+
+# Converts stored reports to a different codec (see compression.py),
+# normally a denser one than the reports were uploaded with, while the
+# site keeps running. The new file is written alongside the old one and
+# the report is pointed at it; a request that looked up the report just
+# before can still be reading the old file, so old files are only
+# deleted after --grace seconds. Reports are converted in batches with a
+# pause between them so as not to compete too much with serving requests.
+# Reports already converted are skipped, so this can be interrupted and
+# rerun; files replaced by an interrupted run are deleted by the next one.
+class Command(BaseCommand):
+    help = 'Recompress stored reports with a different codec'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--codec', dest='codec', default=None,
+                    help='Codec to convert to (default: REPORT_CODEC)'),
+        make_option('--level', dest='level', type='int', default=None,
+                    help='Compression level (default: REPORT_COMPRESS_LEVEL)'),
+        make_option('--min-age', dest='min_age', type='int', default=0,
+                    help='Only convert reports older than this many days'),
+        make_option('--batch-size', dest='batch_size', type='int', default=20,
+                    help='Number of reports converted between pauses'),
+        make_option('--pause', dest='pause', type='float', default=1.,
+                    help='Seconds to wait between batches'),
+        make_option('--grace', dest='grace', type='float', default=60.,
+                    help='Seconds to keep replaced files before deleting them'),
+    )
+
+    def handle(self, *args, **options):
+        codec_name = options['codec']
+        if codec_name is None:
+            codec_name = settings.REPORT_CODEC
+        try:
+            codec = get_codec(codec_name)
+        except ValueError, e:
+            raise CommandError(str(e))
+
+        level = options['level']
+        if level is None:
+            level = settings.REPORT_COMPRESS_LEVEL
+
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        verbose = int(options.get('verbosity', 1)) > 0
+
+        reports = Report.objects.exclude(upload__endswith=codec.extension)
+        if options['min_age'] > 0:
+            reports = reports.filter(date__lt=datetime.datetime.now() - datetime.timedelta(days=options['min_age']))
+
+        # (time replaced, path) of the old files
+        pending_path = os.path.join(_pending_directory(), _PENDING_PREFIX + str(os.getpid()))
+        replaced = _take_over_pending(pending_path)
+        def delete_replaced(before):
+            deleted = False
+            while len(replaced) > 0 and replaced[0][0] < before:
+                try:
+                    os.unlink(replaced[0][1])
+                except OSError:
+                    pass
+                del replaced[0]
+                deleted = True
+            if deleted:
+                _write_pending(pending_path, replaced)
+
+        converted = 0
+        failed = 0
+        old_bytes = 0
+        new_bytes = 0
+        last_id = 0
+        while True:
+            batch = list(reports.filter(id__gt=last_id).order_by('id')[0:options['batch_size']])
+            if len(batch) == 0:
+                break
+
+            for report in batch:
+                last_id = report.id
+                storage = report.upload.storage
+                old_name = report.upload.name
+                old_path = report.upload.path
+                new_name = storage.get_available_name(os.path.splitext(old_name)[0] + codec.extension)
+                new_path = storage.path(new_name)
+                tmp_path = "%s.%d.tmp" % (new_path, os.getpid())
+
+                try:
+                    st = os.stat(old_path)
+                    _recompress(old_path, tmp_path, codec, level)
+                    # Keep the modification time, which is the
+                    # Last-Modified of the report for HTTP caching
+                    os.utime(tmp_path, (st.st_atime, st.st_mtime))
+                    os.rename(tmp_path, new_path)
+                except Exception, e:
+                    # A missing or corrupt file; the decompressors raise
+                    # various exceptions for corrupt data
+                    print "Report %d: %s: %s" % (report.id, e.__class__.__name__, e)
+                    failed += 1
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    continue
+
+                # Unless another process has converted it in the meantime
+                if Report.objects.filter(id=report.id, upload=old_name).update(upload=new_name) == 1:
+                    replaced_time = time.time()
+                    replaced.append((replaced_time, old_path))
+                    _append_pending(pending_path, replaced_time, old_path)
+                    converted += 1
+                    old_bytes += st.st_size
+                    new_bytes += os.stat(new_path).st_size
+                else:
+                    os.unlink(new_path)
+
+            if verbose:
+                print "Converted %d reports, %d failed" % (converted, failed)
+
+            delete_replaced(time.time() - options['grace'])
+            if len(batch) == options['batch_size']:
+                time.sleep(options['pause'])
+
+        if len(replaced) > 0:
+            wait = replaced[-1][0] + options['grace'] - time.time()
+            if wait > 0:
+                if verbose:
+                    print "Waiting %.0f seconds to delete the replaced files" % wait
+                time.sleep(wait)
+            delete_replaced(time.time())
+
+        if verbose:
+            if old_bytes > 0:
+                print "Converted %d reports to %s, %d failed; %d bytes => %d bytes (%.1f%%)" % (
+                    converted, codec.name, failed, old_bytes, new_bytes, 100. * new_bytes / old_bytes)
+            else:
+                print "Converted %d reports to %s, %d failed" % (converted, codec.name, failed)
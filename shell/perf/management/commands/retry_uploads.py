@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shell.perf import ingest
+
+# Queues failed uploads to be processed again by 'manage.py process_uploads',
+# for example after fixing the problem that made them fail. The error for
+# each failed upload is shown on its status page,
+# system/<system>/upload/<id>.
+class Command(BaseCommand):
+    args = '[<upload id> ...]'
+    help = 'Retry failed uploads; all of them if no ids are given'
+
+    def handle(self, *args, **options):
+        job_ids = None
+        if len(args) > 0:
+            try:
+                job_ids = [int(arg) for arg in args]
+            except ValueError:
+                raise CommandError("Upload ids must be numbers")
+
+        count = ingest.retry_jobs(job_ids)
+
+        if int(options.get('verbosity', 1)) > 0:
+            print "Queued %d uploads" % count
@@ -0,0 +1,243 @@
+from optparse import make_option
+import datetime
+import os
+import resource
+import subprocess
+import sys
+import time
+try:
+    import json
+except:
+    import simplejson as json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.client import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shell.perf.models import EventLog, Report
+from shell.perf import page_cache
+from shell.perf import signed_request
+from shell.perf import synthetic
+
+def _revision():
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+
+    if process.returncode != 0:
+        return None
+
+    return output.strip()
+
+# Peak resident set size of this process so far, in KiB
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _median(values):
+    s = sorted(values)
+    l = len(s)
+    if l % 2 == 1:
+        return s[l // 2]
+    else:
+        return (s[l // 2 - 1] + s[l // 2]) / 2.
+
+# Makes each of the requests (functions returning a response), timing
+# them and counting their SQL queries. The page cache is cleared before
+# each request, so it's the full work of the view that is measured.
+def _measure(requests):
+    times = []
+    queries = []
+    rss_before = _peak_rss()
+    for request in requests:
+        page_cache.invalidate('site')
+        reset_queries()
+        start = time.time()
+        response = request()
+        # For views that return an iterator, the work may only be done
+        # when the content is read
+        response.content
+        times.append(1000 * (time.time() - start))
+        queries.append(len(connection.queries))
+
+        if not response.status_code in (200, 202):
+            raise CommandError("Request failed: %d %s" % (response.status_code, response.content[0:1000]))
+    rss_after = _peak_rss()
+
+    return { 'count': len(times),
+             'latency_ms': { 'mean': sum(times) / len(times),
+                             'median': _median(times),
+                             'min': min(times),
+                             'max': max(times) },
+             'queries': { 'mean': float(sum(queries)) / len(queries),
+                          'max': max(queries) },
+             'peak_rss_kb': rss_after,
+             'peak_rss_growth_kb': rss_after - rss_before }
+
+def _upload_request(client, system, body):
+    path = '/system/%s/upload' % system.name
+    signature = signed_request.sign(system.secret_key, 'POST', 'http://testserver' + path, body)
+    def request():
+        return client.post(path, body,
+                           content_type='application/json',
+                           HTTP_X_SHELL_SIGNATURE=signature)
+
+    return request
+
+def _get_request(client, path):
+    def request():
+        return client.get(path)
+
+    return request
+
+def _cycle(items, n):
+    return [items[i % len(items)] for i in xrange(0, n)]
+
+def _print_results(results):
+    print "%-16s %10s %10s %10s %8s %12s" % ("benchmark", "mean (ms)", "min (ms)", "max (ms)", "queries", "peak (KiB)")
+    for name in sorted(results['benchmarks'].keys()):
+        b = results['benchmarks'][name]
+        print "%-16s %10.1f %10.1f %10.1f %8.1f %12d" % (name, b['latency_ms']['mean'], b['latency_ms']['min'],
+                                                        b['latency_ms']['max'], b['queries']['mean'], b['peak_rss_kb'])
+
+def _print_comparison(old, new):
+    print
+    print "Compared to %s (%s):" % (old.get('revision') or 'unknown revision', old.get('date'))
+    if old.get('parameters') != new['parameters']:
+        print "Warning: the benchmarks were run with different parameters"
+    print "%-16s %10s %10s %8s %10s %10s" % ("benchmark", "old (ms)", "new (ms)", "change", "old queries", "new queries")
+    for name in sorted(new['benchmarks'].keys()):
+        if not name in old['benchmarks']:
+            continue
+        o = old['benchmarks'][name]
+        n = new['benchmarks'][name]
+        old_mean = o['latency_ms']['mean']
+        new_mean = n['latency_ms']['mean']
+        change = ''
+        if old_mean > 0:
+            change = "%+.1f%%" % (100 * (new_mean - old_mean) / old_mean)
+        print "%-16s %10.1f %10.1f %8s %10.1f %10.1f" % (name, old_mean, new_mean, change,
+                                                         o['queries']['mean'], n['queries']['mean'])
+
+# Runs a reproducible set of benchmarks against a freshly created test
+# database, loaded with synthetic systems and reports (see
+# shell/perf/synthetic.py): uploading the reports, then viewing the home
+# page, the system pages and the reports. The latency, number of SQL
+# queries and peak memory use for each are written to a JSON file, and can
+# be compared with the results from an earlier run with --compare.
+class Command(BaseCommand):
+    help = 'Run the benchmark suite and save the results'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--output', dest='output', default='benchmark-results.json',
+                    help='File to write the results to'),
+        make_option('--compare', dest='compare', default=None,
+                    help='Results of an earlier run to compare with'),
+        make_option('--seed', dest='seed', type='int', default=0,
+                    help='Random seed for the synthetic data'),
+        make_option('--systems', dest='systems', type='int', default=3,
+                    help='Number of systems'),
+        make_option('--reports', dest='reports', type='int', default=10,
+                    help='Number of reports uploaded for each system'),
+        make_option('--metrics', dest='metrics', type='int', default=len(synthetic.METRIC_TEMPLATES),
+                    help='Number of metrics in each report'),
+        make_option('--runs', dest='runs', type='int', default=3,
+                    help='Number of runs in each report'),
+        make_option('--events', dest='events', type='int', default=1000,
+                    help='Number of events in the log for each run'),
+        make_option('--repeat', dest='repeat', type='int', default=10,
+                    help='Number of requests for each page'),
+    )
+
+    def handle(self, *args, **options):
+        parameters = {}
+        for name in ('seed', 'systems', 'reports', 'metrics', 'runs', 'events', 'repeat'):
+            parameters[name] = options[name]
+            if name != 'seed' and options[name] < 1:
+                raise CommandError("--%s must be at least 1" % name)
+
+        old_results = None
+        if options['compare'] is not None:
+            f = open(options['compare'])
+            try:
+                old_results = json.load(f)
+            finally:
+                f.close()
+
+        results = { 'revision': _revision(),
+                    'date': datetime.datetime.now().isoformat(),
+                    'python': sys.version.split()[0],
+                    'parameters': parameters,
+                    'benchmarks': {} }
+
+        # Uploads are measured through to the report being stored, and
+        # without the rate limit on uploads from each system; the number
+        # of queries is only recorded with DEBUG
+        old_deferred = settings.DEFERRED_UPLOADS
+        old_upload_rate = settings.UPLOAD_RATE
+        old_debug = settings.DEBUG
+        settings.DEFERRED_UPLOADS = False
+        settings.UPLOAD_RATE = None
+        settings.DEBUG = True
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            generator = synthetic.Generator(seed=options['seed'],
+                                            n_metrics=options['metrics'],
+                                            n_runs=options['runs'],
+                                            n_events=options['events'])
+            client = Client()
+
+            systems = []
+            for i in xrange(0, options['systems']):
+                system = generator.system()
+                system.save()
+                systems.append(system)
+
+            # The reports from the systems are interleaved, as they would be
+            # on a real installation
+            uploads = []
+            for system in systems:
+                for i, report in enumerate(generator.reports(system, options['reports'])):
+                    uploads.append((i, _upload_request(client, system, json.dumps(report))))
+            uploads.sort(key=lambda upload: upload[0])
+            results['benchmarks']['system_upload'] = _measure([request for i, request in uploads])
+
+            repeat = options['repeat']
+            reports = list(Report.objects.select_related('system').order_by('-date')[0:repeat])
+
+            benchmarks = [
+                ('home', ['/home']),
+                ('system_view', ['/system/%s' % system.name for system in systems]),
+                ('report_view', ['/report/%s/%d' % (report.system.name, report.id) for report in reports]),
+                ('report_json', ['/report/%s/%d/json' % (report.system.name, report.id) for report in reports]),
+            ]
+            for name, paths in benchmarks:
+                results['benchmarks'][name] = _measure([_get_request(client, path) for path in _cycle(paths, repeat)])
+        finally:
+            for report in Report.objects.all():
+                report.upload.delete(save=False)
+            for log in EventLog.objects.all():
+                log.upload.delete(save=False)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            settings.DEFERRED_UPLOADS = old_deferred
+            settings.UPLOAD_RATE = old_upload_rate
+            settings.DEBUG = old_debug
+
+        f = open(options['output'], 'w')
+        try:
+            json.dump(results, f, indent=4, sort_keys=True)
+        finally:
+            f.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            _print_results(results)
+            if old_results is not None:
+                _print_comparison(old_results, results)
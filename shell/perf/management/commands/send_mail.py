@@ -0,0 +1,44 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from shell.perf.mail import MailSender
+
+# The worker that delivers the mail queued by the web application. It
+# should be kept running alongside the web server; with --once it sends
+# whatever is due and exits, which is suitable for running from cron.
+# Only one worker should be run at once, or messages may be sent twice.
+class Command(NoArgsCommand):
+    help = 'Send queued outgoing mail'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--once', action='store_true', dest='once', default=False,
+                    help='Send the mail that is due, then exit'),
+        make_option('--interval', type='int', dest='interval', default=5,
+                    help='Seconds to wait between checks of the queue'),
+    )
+
+    def handle_noargs(self, **options):
+        sender = MailSender()
+        try:
+            while True:
+                # Keep going until there's nothing due
+                while sender.send_batch() > 0:
+                    pass
+
+                if options['once']:
+                    break
+
+                sender.close_if_idle()
+                # Without this, we'd be stuck in a transaction that started
+                # with the first query, and with some databases we'd never
+                # see newly queued mail
+                transaction.commit_unless_managed()
+                time.sleep(options['interval'])
+        finally:
+            sender.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            print "Sent %d messages, %d failed" % (sender.sent, sender.failed)
@@ -1,8 +1,60 @@
+from array import array
+import base64
+import datetime
+from gzip import GzipFile
+import os
+import sys
+import time
+try:
+    import json
+except:
+    import simplejson as json
+
 from django.conf import settings
-from django.db import models
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connection, models, transaction, IntegrityError
 
+import compression
+import event_log
+import instrumentation
+import json_stream
+import reduction
+import regression
 import util
 
+# A list of floats, stored packed as little-endian float64 values, and
+# base64-encoded since Django doesn't have a binary field. On the model
+# the value is an array('d'), so loading it doesn't involve parsing
+# anything, just decoding and copying the bytes.
+class PackedFloatArrayField(models.TextField):
+    __metaclass__ = models.SubfieldBase
+
+    def get_internal_type(self):
+        return 'TextField'
+
+    def to_python(self, value):
+        if isinstance(value, array):
+            return value
+        elif isinstance(value, basestring):
+            result = array('d')
+            result.fromstring(base64.b64decode(value))
+            if sys.byteorder == 'big':
+                result.byteswap()
+            return result
+        elif value is None:
+            return None
+        else:
+            return array('d', value)
+
+    def get_db_prep_value(self, value):
+        if value is None:
+            return None
+        value = self.to_python(value)
+        if sys.byteorder == 'big':
+            value = array('d', value)
+            value.byteswap()
+        return base64.b64encode(value.tostring())
+
 class System(models.Model):
     name = models.CharField(max_length=255, unique=True)
     owner_email = models.CharField(max_length=255)
@@ -39,9 +91,639 @@ class Report(models.Model):
     date = models.DateTimeField()
     upload = models.FileField(upload_to='reports')
 
-class Metric(models.Model):
-    name = models.CharField(max_length=255)
+class ReportInfoManager(models.Manager):
+    # Called at upload time with the header fields of the report that
+    # were read from the upload (see ReportInfo.HEADER_FIELDS)
+    def create_from_header(self, report, header):
+        monitors = header.get('monitors') or []
+        if isinstance(monitors, list):
+            monitors = " ".join([unicode(m) for m in monitors])
+
+        return self.create(report=report,
+                           revision=unicode(header.get('revision') or '')[:255],
+                           monitors=unicode(monitors)[:1023],
+                           run_values='{}')
+
+    # Reports uploaded before ReportInfo existed don't have one; for
+    # those, we read the header fields from the report file the first
+    # time they are needed. The metrics are read along with them, so the
+    # RunValues of the report are stored at the same time rather than
+    # reading the file again for them. If two requests for the report do
+    # this at once, the one whose insert fails uses the row the other
+    # created.
+    def get_for_report(self, report):
+        try:
+            return self.get(report=report)
+        except ReportInfo.DoesNotExist:
+            start = time.time()
+            codec = compression.codec_for_path(report.upload.path)
+            f = instrumentation.TimedReader(codec.open_read(report.upload.path))
+            try:
+                # Stored reports were checked when they were uploaded
+                header = json_stream.read_members(f, ReportInfo.HEADER_FIELDS, check_skipped=False)
+            finally:
+                f.close()
+            instrumentation.observe_read(start, f, codec.read_step, 'json_parse')
+
+            sid = transaction.savepoint()
+            try:
+                info = self.create_from_header(report, header)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                transaction.rollback_unless_managed()
+                return self.get(report=report)
+            transaction.savepoint_commit(sid)
+
+            RunValues.objects.create_from_metrics(report, header.get('metrics') or {})
+
+            return info
+
+# Fields from the top level of a report that are shown on the report page,
+# and the individual values of each metric for each run. These are
+# extracted when the report is uploaded so that the page can be shown
+# without reading and parsing the (possibly large) report file.
+class ReportInfo(models.Model):
+    HEADER_FIELDS = ('date', 'metrics', 'revision', 'monitors')
+
+    report = models.OneToOneField(Report, primary_key=True)
+    revision = models.CharField(max_length=255)
+    # Space separated, as displayed
+    monitors = models.CharField(max_length=1023)
+    # JSON dictionary mapping metric name to a list of values. This is
+    # only filled in for reports uploaded before RunValues was added, and
+    # is only used to create the RunValues for those reports.
+    run_values = models.TextField()
+
+    objects = ReportInfoManager()
+
+    def get_run_values(self):
+        return json.loads(self.run_values)
+
+class ReportStatisticsManager(models.Manager):
+    def create_for_report(self, report, statistics):
+        return self.create(report=report, statistics=json.dumps(statistics))
+
+    # Returns a dictionary mapping the ids of the given reports to the
+    # statistics of their metrics. Reports uploaded before statistics
+    # were stored get them computed from their ReportInfo and saved;
+    # as in ReportInfoManager.get_for_report(), a concurrent request
+    # may have saved them first.
+    def get_for_reports(self, reports):
+        result = {}
+        report_ids = [report.id for report in reports]
+        for start in xrange(0, len(report_ids), _SQLITE_MAX_VARIABLES):
+            for stats in self.filter(report__in=report_ids[start:start + _SQLITE_MAX_VARIABLES]):
+                result[stats.report_id] = stats.get_statistics()
+
+        for report in reports:
+            if not report.id in result:
+                statistics = {}
+                for run_values in RunValues.objects.get_for_report(report):
+                    if len(run_values.values) > 0:
+                        statistics[run_values.definition.name] = reduction.compute_statistics(run_values.values)
+
+                sid = transaction.savepoint()
+                try:
+                    self.create_for_report(report, statistics)
+                except IntegrityError:
+                    transaction.savepoint_rollback(sid)
+                    transaction.rollback_unless_managed()
+                    statistics = self.get(report=report).get_statistics()
+                else:
+                    transaction.savepoint_commit(sid)
+                result[report.id] = statistics
+
+        return result
+
+# Statistics of the values of each metric over the runs of a report, as
+# computed by reduction.reduce_metrics() at upload time
+class ReportStatistics(models.Model):
+    report = models.OneToOneField(Report, primary_key=True)
+    # JSON dictionary mapping metric name to a dictionary of statistics
+    statistics = models.TextField()
+
+    objects = ReportStatisticsManager()
+
+    def get_statistics(self):
+        return json.loads(self.statistics)
+
+class EventLogManager(models.Manager):
+    # Stores the log from an event_log.EventLogWriter that the logs of the
+    # report have been fed to; events is the 'events' member of the report
+    def create_from_writer(self, report, writer, events):
+        spool = TemporaryUploadedFile('log.gz', 'application/x-gzip', 0, None)
+        try:
+            gz = GzipFile('log', mode="wb", fileobj=spool)
+            writer.write(gz, events)
+            gz.close()
+
+            spool.flush()
+            spool.size = spool.tell()
+
+            # The log is gzip-compressed whatever the codec of the report
+            filename = os.path.splitext(os.path.basename(report.upload.name))[0] + '.gz'
+            log = self.model(report=report)
+            log.upload.save(filename, spool, save=False)
+            log.save()
+        finally:
+            spool.close()
+
+        return log
+
+# The event logs of a report in the compact form described in event_log.py.
+# Generated when the report is uploaded; 'manage.py convert_event_logs'
+# generates them for older reports.
+class EventLog(models.Model):
+    report = models.OneToOneField(Report, primary_key=True)
+    upload = models.FileField(upload_to='logs')
+
+    objects = EventLogManager()
+
+class LatestReportManager(models.Manager):
+    # Called when a report is uploaded; makes it the latest report for
+    # its system unless the system already has a more recent one (reports
+    # are not necessarily uploaded in date order.) The conditional UPDATE
+    # is atomic, so concurrent uploads can't replace a newer report with
+    # an older one.
+    #
+    # If two first reports for a system are stored at once, both can find
+    # no row and try to create it; the one that loses rolls back its
+    # insert to a savepoint (so that the rest of the transaction, which may
+    # be storing a whole batch of reports, goes on) and does the UPDATE
+    # against the row that the other created.
+    def update_for_report(self, report):
+        for attempt in xrange(0, 2):
+            updated = self.filter(system=report.system_id,
+                                  date__lte=report.date).update(report=report,
+                                                                date=report.date)
+            if updated > 0 or self.filter(system=report.system_id).count() > 0:
+                return
+
+            sid = transaction.savepoint()
+            try:
+                self.create(system_id=report.system_id, report=report, date=report.date)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                transaction.rollback_unless_managed()
+                if attempt > 0:
+                    raise
+                continue
+            transaction.savepoint_commit(sid)
+            return
+
+# The most recent report for each system. This duplicates what could be
+# found from the Report table, but lets the home page find the systems
+# with the most recent reports with a single indexed query. Filled in for
+# an existing database by 'manage.py backfill_latest_reports'.
+class LatestReport(models.Model):
+    system = models.OneToOneField(System)
+    report = models.ForeignKey(Report)
+    date = models.DateTimeField(db_index=True)
+
+    objects = LatestReportManager()
+
+# SQLite limits the number of parameters in a single statement
+_SQLITE_MAX_VARIABLES = 999
+
+class BulkInsertManager(models.Manager):
+    # Saves a list of new objects using a multi-row INSERT rather than
+    # one INSERT (and with autocommit, one commit) per object. A report
+    # has hundreds of metrics, so this matters on upload. The objects
+    # don't get their ids filled in.
+    def bulk_insert(self, objects):
+        if len(objects) == 0:
+            return
+
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        fields = [f for f in opts.local_fields if not isinstance(f, models.AutoField)]
+
+        if settings.DATABASE_ENGINE == 'sqlite3':
+            batch_size = _SQLITE_MAX_VARIABLES // len(fields)
+        else:
+            batch_size = len(objects)
+
+        row_sql = "(" + ", ".join(["%s"] * len(fields)) + ")"
+        cursor = connection.cursor()
+        for start in xrange(0, len(objects), batch_size):
+            batch = objects[start:start + batch_size]
+            params = []
+            for obj in batch:
+                for f in fields:
+                    params.append(f.get_db_prep_save(f.pre_save(obj, True)))
+
+            cursor.execute("INSERT INTO %s (%s) VALUES %s" %
+                           (qn(opts.db_table),
+                            ", ".join([qn(f.column) for f in fields]),
+                            ", ".join([row_sql] * len(batch))),
+                           params)
+
+        transaction.commit_unless_managed()
+
+class MetricDefinitionManager(models.Manager):
+    # Returns a dictionary mapping (name, description, units) tuples
+    # to MetricDefinition objects, creating any that don't exist yet.
+    def get_for_keys(self, keys):
+        keys = set(keys)
+        names = list(set([key[0] for key in keys]))
+
+        result = {}
+        # Batched to stay under SQLite's limit on statement parameters
+        for start in xrange(0, len(names), _SQLITE_MAX_VARIABLES):
+            for definition in self.filter(name__in=names[start:start + _SQLITE_MAX_VARIABLES]):
+                key = (definition.name, definition.description, definition.units)
+                if key in keys:
+                    result[key] = definition
+
+        for key in keys:
+            if not key in result:
+                definition = self.model(name=key[0], description=key[1], units=key[2])
+                definition.save()
+                result[key] = definition
+
+        return result
+
+# Each distinct combination of metric name, description and units is
+# stored once here, rather than being repeated for every report
+class MetricDefinition(models.Model):
+    name = models.CharField(max_length=255, db_index=True)
     description = models.CharField(max_length=255)
     units = models.CharField(max_length=255)
+
+    objects = MetricDefinitionManager()
+
+# The value of a metric in a particular report. Before MetricDefinition
+# was split out, the name, description and units were stored inline in
+# the perf_metric table; 'manage.py convert_metrics' converts a database
+# with the old layout.
+class Metric(models.Model):
     report = models.ForeignKey(Report)
+    definition = models.ForeignKey(MetricDefinition)
     value = models.FloatField()
+
+    objects = BulkInsertManager()
+
+    class Meta:
+        db_table = 'perf_metricvalue'
+        unique_together = (('report', 'definition'),)
+
+    @property
+    def name(self):
+        return self.definition.name
+
+    @property
+    def description(self):
+        return self.definition.description
+
+    @property
+    def units(self):
+        return self.definition.units
+
+class SystemBaselineManager(models.Manager):
+    # Returns the baseline for system, creating it (as of date) if there
+    # isn't one yet, with its row locked until the end of the transaction,
+    # so that workers storing reports for the same system at the same time
+    # take turns rather than overwriting each other's changes. SQLite
+    # doesn't have SELECT ... FOR UPDATE, but it only lets one transaction
+    # write at a time anyway.
+    def _get_for_update(self, system, date):
+        if self.filter(system=system).count() == 0:
+            # Another worker may be creating it at the same time
+            sid = transaction.savepoint()
+            try:
+                self.create(system=system, date=date, state='{}')
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                transaction.rollback_unless_managed()
+            else:
+                transaction.savepoint_commit(sid)
+
+        if settings.DATABASE_ENGINE == 'sqlite3':
+            return self.get(system=system)
+
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        # Read through the locking SELECT, which sees the latest committed
+        # row even where a plain SELECT would see an older snapshot
+        cursor.execute("SELECT %s, %s FROM %s WHERE %s = %%s FOR UPDATE" %
+                       (qn(opts.get_field('date').column),
+                        qn(opts.get_field('state').column),
+                        qn(opts.db_table),
+                        qn(opts.get_field('system').column)),
+                       [system.id])
+        date, state = cursor.fetchone()
+
+        return self.model(system=system, date=date, state=state)
+
+    # Checks the values of the metrics in newly uploaded reports against
+    # the baselines for their system, updates the baselines, and records
+    # any regressions. reports is a list of (Report, values) tuples for
+    # reports from a single system, in date order, where values is a list
+    # of (MetricDefinition, value) tuples. Returns the list of new
+    # Regression objects.
+    def update_for_reports(self, reports):
+        system = reports[0][0].system
+        baseline = self._get_for_update(system, reports[0][0].date)
+
+        state = json.loads(baseline.state)
+        regressions = []
+        for report, values in reports:
+            # The baselines only make sense in date order; a report uploaded
+            # late, with a date before reports we've already seen, is left out
+            if report.date < baseline.date:
+                continue
+
+            for definition, value in values:
+                # Smaller values of times are better, larger values of rates
+                better = - reduction.time_exponent(definition.units)
+                result = regression.check_value(state.setdefault(str(definition.id), []), value, better)
+                if result is not None:
+                    score, median, mad = result
+                    regressions.append(Regression(report=report, definition=definition, value=value,
+                                                  baseline=median, spread=mad, score=score))
+
+            baseline.date = report.date
+
+        baseline.state = json.dumps(state)
+        baseline.save()
+
+        Regression.objects.bulk_insert(regressions)
+
+        return regressions
+
+# The recent values of each metric for a system, for detecting
+# regressions (see regression.py). Rather than a row for each metric,
+# which would mean hundreds of UPDATEs on each upload, the baselines for
+# all the metrics of the system are stored together as JSON mapping
+# MetricDefinition ids to lists of values.
+class SystemBaseline(models.Model):
+    system = models.OneToOneField(System, primary_key=True)
+    # Date of the most recent report included
+    date = models.DateTimeField()
+    state = models.TextField()
+
+    objects = SystemBaselineManager()
+
+# A metric value in a report that was out of line with the recent values
+# for the system. baseline and spread are the median and median absolute
+# deviation of the recent values, and score is how far off the value was,
+# as computed by regression.check_value().
+class Regression(models.Model):
+    report = models.ForeignKey(Report)
+    definition = models.ForeignKey(MetricDefinition)
+    value = models.FloatField()
+    baseline = models.FloatField()
+    spread = models.FloatField()
+    score = models.FloatField()
+
+    objects = BulkInsertManager()
+
+# Mail waiting to be sent by the mail worker; see mail.py. Messages are
+# deleted once sent; messages that couldn't be delivered are kept with
+# failed set, and last_error says why.
+class OutgoingMail(models.Model):
+    fromaddr = models.CharField(max_length=255)
+    toaddr = models.CharField(max_length=255)
+    message = models.TextField()
+    next_attempt = models.DateTimeField(db_index=True)
+    attempts = models.IntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    last_error = models.CharField(max_length=1023, blank=True)
+
+class UploadJobManager(models.Manager):
+    # Creates a job for the body of an upload, which has been spooled to
+    # a TemporaryUploadedFile. state is 'queued' for a worker to pick up,
+    # or 'processing' if the caller is going to process it.
+    def create_from_spool(self, system, spool, state):
+        now = datetime.datetime.now()
+        job = self.model(system=system, created=now, state=state)
+        if state == 'processing':
+            job.started = now
+            job.attempts = 1
+
+        filename = system.name + "-" + now.strftime("%Y%m%d-%H%M%S") + ".json"
+
+        spool.flush()
+        spool.size = spool.tell()
+        job.upload.save(filename, spool, save=False)
+        job.save()
+
+        return job
+
+# An uploaded report waiting to be processed, or the outcome of processing
+# it; see ingest.py. The uploaded body is kept in 'upload' until the report
+# has been stored.
+class UploadJob(models.Model):
+    STATES = (('queued', 'Queued'),
+              ('processing', 'Processing'),
+              ('done', 'Done'),
+              ('failed', 'Failed'))
+
+    system = models.ForeignKey(System)
+    created = models.DateTimeField()
+    upload = models.FileField(upload_to='incoming', blank=True)
+    state = models.CharField(max_length=16, choices=STATES, db_index=True)
+    attempts = models.IntegerField(default=0)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    error = models.CharField(max_length=1023, blank=True)
+    report = models.ForeignKey(Report, null=True)
+
+    objects = UploadJobManager()
+
+class UploadDigestManager(models.Manager):
+    # The UploadDigest for an earlier upload of the same content from
+    # system, with its job, or None
+    def lookup(self, system, digest):
+        try:
+            return self.select_related('job').get(system=system, digest=digest)
+        except UploadDigest.DoesNotExist:
+            return None
+
+    # Records job as the upload of the content with the given digest.
+    # previous is the result of lookup(): a record for an upload that
+    # failed is pointed at the new job instead. Returns False if another
+    # upload of the same content was recorded since the lookup.
+    #
+    # This can be called within a managed transaction: the failed insert
+    # is rolled back to a savepoint, so the transaction can go on (on
+    # PostgreSQL, an error otherwise aborts the whole transaction).
+    def record(self, job, digest, previous):
+        if previous is not None:
+            return self.filter(id=previous.id, job=previous.job_id).update(job=job) == 1
+
+        sid = transaction.savepoint()
+        try:
+            self.create(system=job.system, digest=digest, job=job)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            transaction.rollback_unless_managed()
+            return False
+        transaction.savepoint_commit(sid)
+
+        return True
+
+# The SHA-1 digest of the body of an upload, so that when a client uploads
+# the same report again (say, retrying after a timeout) we can point it at
+# the first upload rather than storing the report twice; see
+# views.system_upload
+class UploadDigest(models.Model):
+    system = models.ForeignKey(System)
+    digest = models.CharField(max_length=40)
+    job = models.ForeignKey(UploadJob)
+
+    objects = UploadDigestManager()
+
+    class Meta:
+        unique_together = (('system', 'digest'),)
+
+class UploadRateLimitManager(models.Manager):
+    # Takes a token from the bucket of system, which holds at most burst
+    # tokens and is refilled at rate tokens a second. Returns 0 if there
+    # was a token, or otherwise the number of seconds until there will be.
+    #
+    # Any number of server processes can do this at once: the UPDATE only
+    # succeeds if the bucket hasn't changed since we read it, and if it has,
+    # we read it again.
+    def take(self, system, rate, burst):
+        for attempt in xrange(0, 5):
+            now = datetime.datetime.now()
+            try:
+                bucket = self.get(system=system)
+            except UploadRateLimit.DoesNotExist:
+                try:
+                    self.create(system=system, tokens=burst - 1, updated=now, version=0)
+                    return 0
+                except IntegrityError:
+                    # Created by another process in the meantime
+                    transaction.rollback_unless_managed()
+                    continue
+
+            elapsed = now - bucket.updated
+            elapsed = elapsed.days * 86400 + elapsed.seconds + elapsed.microseconds / 1000000.
+            tokens = min(burst, bucket.tokens + max(elapsed, 0) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+
+            if self.filter(system=system, version=bucket.version).update(tokens=tokens - 1,
+                                                                          updated=now,
+                                                                          version=bucket.version + 1) == 1:
+                return 0
+
+            # Otherwise we might keep reading the same state of the bucket
+            transaction.commit_unless_managed()
+
+        # Too many others at the same time
+        return 1. / rate
+
+    # Puts back a token taken by take(), for an upload that turned out
+    # not to be from the system (its signature didn't check out), so that
+    # anyone who knows the name of a system can't use up its uploads
+    def refund(self, system, burst):
+        for attempt in xrange(0, 5):
+            try:
+                bucket = self.get(system=system)
+            except UploadRateLimit.DoesNotExist:
+                return
+
+            # The tokens are as of bucket.updated, which is left alone, so
+            # the refill since then is still added on the next take()
+            if self.filter(system=system, version=bucket.version).update(tokens=min(burst, bucket.tokens + 1),
+                                                                          version=bucket.version + 1) == 1:
+                return
+
+            transaction.commit_unless_managed()
+
+# A token bucket limiting the rate of uploads from a system; see
+# views.system_upload
+class UploadRateLimit(models.Model):
+    system = models.OneToOneField(System, primary_key=True)
+    tokens = models.FloatField()
+    updated = models.DateTimeField()
+    # Incremented on every change
+    version = models.IntegerField()
+
+    objects = UploadRateLimitManager()
+
+class RunValuesManager(BulkInsertManager):
+    # Returns the RunValues for all the metrics of a report, with their
+    # definitions. For reports uploaded before RunValues existed, they are
+    # created from the values stored in ReportInfo, or failing that, from
+    # the report file (see ReportInfoManager.get_for_report()). A report
+    # without metrics has no RunValues, and there is nothing to read for
+    # it.
+    def get_for_report(self, report):
+        result = list(self.filter(report=report).select_related('definition'))
+        if len(result) > 0:
+            return result
+
+        report_metrics = list(report.metric_set.select_related('definition'))
+        if len(report_metrics) == 0:
+            return result
+
+        try:
+            info = ReportInfo.objects.get(report=report)
+        except ReportInfo.DoesNotExist:
+            # Reading the header from the file stores the RunValues too
+            ReportInfo.objects.get_for_report(report)
+            return list(self.filter(report=report).select_related('definition'))
+
+        values = info.get_run_values()
+        if len(values) == 0:
+            start = time.time()
+            codec = compression.codec_for_path(report.upload.path)
+            f = instrumentation.TimedReader(codec.open_read(report.upload.path))
+            try:
+                metrics = json_stream.read_members(f, ('metrics',), check_skipped=False).get('metrics', {})
+            finally:
+                f.close()
+            instrumentation.observe_read(start, f, codec.read_step, 'json_parse')
+            return self.create_from_metrics(report, metrics, report_metrics)
+
+        return self.__create(report, values, report_metrics)
+
+    # Stores the RunValues of an older report from the 'metrics' member of
+    # the report file; report_metrics are the Metric objects of the report
+    # if they have already been loaded
+    def create_from_metrics(self, report, metrics, report_metrics=None):
+        values = {}
+        for name, metric in metrics.iteritems():
+            values[name] = metric['values']
+
+        if report_metrics is None:
+            report_metrics = list(report.metric_set.select_related('definition'))
+
+        return self.__create(report, values, report_metrics)
+
+    def __create(self, report, values, report_metrics):
+        result = []
+        for metric in report_metrics:
+            if metric.name in values:
+                result.append(self.model(report=report,
+                                         definition=metric.definition,
+                                         values=values[metric.name]))
+
+        # Another request for the same report may have inserted them first
+        sid = transaction.savepoint()
+        try:
+            self.bulk_insert(result)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            transaction.rollback_unless_managed()
+            return list(self.filter(report=report).select_related('definition'))
+        transaction.savepoint_commit(sid)
+
+        return result
+
+# The values of a metric for each run of a report; Metric.value is
+# computed from these (see reduction.py)
+class RunValues(models.Model):
+    report = models.ForeignKey(Report)
+    definition = models.ForeignKey(MetricDefinition)
+    values = PackedFloatArrayField()
+
+    objects = RunValuesManager()
+
+    class Meta:
+        unique_together = (('report', 'definition'),)
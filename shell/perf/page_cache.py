@@ -0,0 +1,111 @@
+import datetime
+import time
+
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
+from django.views.decorators.http import condition
+
+# Caching of rendered pages. The data shown on the site only changes when
+# a report is uploaded or when a system is added or edited, so instead of
+# expiring pages on a timer we keep a "last changed" stamp for each scope
+# of data, and a page is cached under a key that includes the stamps of
+# all the scopes it depends on. invalidate() updates the stamps, so pages
+# that showed the old data are simply never looked up again.
+#
+# The scopes used are:
+#
+#  'site': information about systems (names, owners, ...), which can
+#     show up on any page
+#  'uploads': changes whenever any report is uploaded
+#  'system:<name>': changes whenever a report for that system is uploaded
+#
+# The same stamps give us ETag and Last-Modified headers, so a client
+# that already has the current version of a page gets a 304 without the
+# page being rendered or even fetched from the cache.
+#
+# The stamps live in the cache too, so CACHE_BACKEND needs to be shared
+# between all the server processes for invalidation to work.
+
+# How long rendered pages are kept around; pages that are still current
+# are re-rendered after this, which doesn't hurt
+PAGE_TIMEOUT = 24 * 60 * 60
+
+# Memcached doesn't support relative timeouts longer than 30 days. If a
+# stamp is dropped from the cache it comes back as the current time,
+# which just means pages that depend on it are rendered again.
+STAMP_TIMEOUT = 30 * 24 * 60 * 60
+
+def _stamp_key(scope):
+    return 'perf.stamp.' + scope
+
+def _get_stamps(scopes):
+    keys = [_stamp_key(scope) for scope in scopes]
+    stamps = cache.get_many(keys)
+    result = []
+    for key in keys:
+        if not key in stamps:
+            cache.add(key, time.time(), STAMP_TIMEOUT)
+            stamps[key] = cache.get(key)
+            # With the dummy backend, nothing is ever stored
+            if stamps[key] is None:
+                stamps[key] = time.time()
+        result.append(stamps[key])
+
+    return result
+
+# Marks the data in the given scopes as changed
+def invalidate(*scopes):
+    for scope in scopes:
+        key = _stamp_key(scope)
+        stamp = time.time()
+        # Last-Modified only has a resolution of a second, so make sure
+        # that every change moves it forward
+        old_stamp = cache.get(key)
+        if old_stamp is not None and stamp < old_stamp + 1:
+            stamp = old_stamp + 1
+        cache.set(key, stamp, STAMP_TIMEOUT)
+
+# Decorator for a view whose output depends only on the data in the given
+# scopes and on the query string. Scopes are formatted with the keyword
+# arguments of the view, so 'system:%(system_name)s' can be used for a
+# view taking system_name. Only successful GET and HEAD responses are
+# cached.
+def cached_page(*scopes):
+    def decorator(view):
+        # The stamps are needed for the ETag, the Last-Modified header, and
+        # the cache key; look them up only once per request
+        def get_state(request, **kwargs):
+            if not hasattr(request, '_perf_page_state'):
+                stamps = _get_stamps([scope % kwargs for scope in scopes])
+                etag = md5_constructor(repr((view.__name__, sorted(kwargs.items()), request.META.get('QUERY_STRING', ''), stamps))).hexdigest()
+                last_modified = datetime.datetime.utcfromtimestamp(max(stamps))
+                request._perf_page_state = (etag, last_modified)
+
+            return request._perf_page_state
+
+        def get_etag(request, **kwargs):
+            return get_state(request, **kwargs)[0]
+
+        def get_last_modified(request, **kwargs):
+            return get_state(request, **kwargs)[1]
+
+        def inner(request, **kwargs):
+            # Requests being profiled (see profiling.py) skip the cache
+            if not request.method in ('GET', 'HEAD') or getattr(request, '_perf_bypass_cache', False):
+                return view(request, **kwargs)
+
+            key = 'perf.page.' + get_etag(request, **kwargs)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response, PAGE_TIMEOUT)
+
+            return response
+
+        inner.__name__ = view.__name__
+        decorated = condition(etag_func=get_etag, last_modified_func=get_last_modified)(inner)
+        decorated.__name__ = view.__name__
+        return decorated
+
+    return decorator
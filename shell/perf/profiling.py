@@ -0,0 +1,197 @@
+import os
+import random
+import time
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+import pstats
+
+from django.conf import settings
+
+# Profiling of requests on the live site. A fraction PROFILE_FRACTION of
+# requests is picked at random, and a request with ?profile=<PROFILE_KEY>
+# is always profiled (and bypasses the page cache, so the work of the view
+# is what is seen). The view is run under the profiler, along with
+# producing the content of a streaming response, and the profile is saved
+# to DATA_ROOT/profiles/<view>/<time>-<pid>.prof, which can be loaded with
+# pstats or a viewer like RunSnakeRun. 'manage.py profile_summary' writes
+# a summary.txt alongside them listing the functions taking the most time
+# over all the recent profiles of the view.
+#
+# The oldest profiles are deleted to keep the total size of the saved
+# profiles under PROFILE_MAX_BYTES; since that means looking at all the
+# saved profiles, it is only done every ROTATE_INTERVAL seconds in each
+# process, so the limit can be exceeded for a little while.
+
+# Number of functions listed in each table of the summary
+SUMMARY_FUNCTIONS = 30
+# The summary covers at most this many of the most recent profiles
+SUMMARY_PROFILES = 50
+# Seconds between checks of the total size of the profiles
+ROTATE_INTERVAL = 60
+
+# When this process last checked the total size
+_last_rotate = None
+
+def _profiles_directory():
+    return os.path.join(settings.DATA_ROOT, 'profiles')
+
+def _should_profile(request):
+    key = settings.PROFILE_KEY
+    if key and request.GET.get('profile') == key:
+        # See page_cache.cached_page()
+        request._perf_bypass_cache = True
+        return True
+
+    return settings.PROFILE_FRACTION > 0 and random.random() < settings.PROFILE_FRACTION
+
+def _function_name(func):
+    filename, line, name = func
+    if filename == '~':
+        # A builtin
+        return name
+    return "%s:%d(%s)" % (os.path.basename(filename), line, name)
+
+def _format_table(title, rows, n_profiles):
+    lines = [title,
+             "%10s %12s %12s %12s  %s" % ("calls", "own (ms)", "cumul. (ms)", "per call", "function")]
+    for func, (cc, nc, tt, ct, callers) in rows:
+        per_call = ''
+        if nc > 0:
+            per_call = "%.3f" % (1000. * ct / nc)
+        lines.append("%10.1f %12.1f %12.1f %12s  %s" % (float(nc) / n_profiles,
+                                                         1000. * tt / n_profiles,
+                                                         1000. * ct / n_profiles,
+                                                         per_call,
+                                                         _function_name(func)))
+    return lines
+
+# Writes summary.txt for the profiles in directory
+def write_summary(directory, view_name):
+    path = os.path.join(directory, 'summary.txt')
+    filenames = sorted([f for f in os.listdir(directory) if f.endswith('.prof')])[-SUMMARY_PROFILES:]
+    if len(filenames) == 0:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return
+
+    stats = None
+    n_profiles = 0
+    for filename in filenames:
+        try:
+            if stats is None:
+                stats = pstats.Stats(os.path.join(directory, filename))
+            else:
+                stats.add(os.path.join(directory, filename))
+            n_profiles += 1
+        except (IOError, OSError, EOFError, ValueError):
+            # Deleted by another process, or still being written
+            pass
+
+    if stats is None:
+        return
+
+    entries = stats.stats.items()
+    lines = ["Profile of %s, averaged over %d requests (%s to %s); times are per request" %
+             (view_name, n_profiles, filenames[0].split('-')[0], filenames[-1].split('-')[0]),
+             ""]
+    entries.sort(key=lambda entry: - entry[1][2])
+    lines.extend(_format_table("Functions by own time:", entries[0:SUMMARY_FUNCTIONS], n_profiles))
+    lines.append("")
+    entries.sort(key=lambda entry: - entry[1][3])
+    lines.extend(_format_table("Functions by cumulative time:", entries[0:SUMMARY_FUNCTIONS], n_profiles))
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    f = open(tmp, 'w')
+    try:
+        f.write("\n".join(lines) + "\n")
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+# Writes summary.txt for each view that has been profiled; returns the
+# names of the views
+def write_summaries():
+    top = _profiles_directory()
+    if not os.path.isdir(top):
+        return []
+
+    view_names = []
+    for view_name in sorted(os.listdir(top)):
+        directory = os.path.join(top, view_name)
+        if os.path.isdir(directory):
+            write_summary(directory, view_name)
+            view_names.append(view_name)
+
+    return view_names
+
+# Deletes the oldest profiles of all views until their total size is at
+# most PROFILE_MAX_BYTES
+def _rotate(top):
+    profiles = []
+    for view_name in os.listdir(top):
+        directory = os.path.join(top, view_name)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if filename.endswith('.prof'):
+                path = os.path.join(directory, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                profiles.append((st.st_mtime, path, st.st_size))
+
+    profiles.sort()
+    total = sum([size for mtime, path, size in profiles])
+    for mtime, path, size in profiles:
+        if total <= settings.PROFILE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total -= size
+
+def _save(profiler, view_name):
+    top = _profiles_directory()
+    directory = os.path.join(top, view_name)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    now = time.time()
+    filename = "%s.%06d-%d.prof" % (time.strftime("%Y%m%dT%H%M%S", time.localtime(now)),
+                                    int((now % 1) * 1000000), os.getpid())
+    profiler.dump_stats(os.path.join(directory, filename))
+
+    global _last_rotate
+    if _last_rotate is None or now - _last_rotate >= ROTATE_INTERVAL:
+        _last_rotate = now
+        _rotate(top)
+
+# Runs the view under the profiler for the requests picked to be
+# profiled. This should be last in MIDDLEWARE_CLASSES, so that only the
+# view is profiled.
+class ProfilingMiddleware(object):
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not _should_profile(request):
+            return None
+
+        profiler = profile.Profile()
+        try:
+            response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+            # A view returning an iterator (like report_json) does most of
+            # its work as the content is sent; read it all here, so that
+            # the work is in the profile. The response isn't streamed then.
+            if not response._is_string:
+                response.content = profiler.runcall(''.join, response._container)
+            return response
+        finally:
+            _save(profiler, view_func.__name__)
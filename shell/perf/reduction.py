@@ -0,0 +1,104 @@
+import math
+
+from django.conf import settings
+
+import util
+
+# Reduction of the values of a metric over the runs in a report. Each
+# metric gets a single primary 'value', which is what's stored in Metric
+# and shown in tables and series: for times, the least contaminated run
+# is the shortest run, so the minimum; for rates (time in the
+# denominator) the maximum; for anything else, the median. Along with that,
+# the statistics named in settings.METRIC_STATISTICS are computed for
+# every metric and stored with the report (see ReportStatistics), so that
+# the spread of the runs can be shown without going back to the values.
+
+# Functions computing each statistic from the sorted values of the runs
+def _median(s):
+    l = len(s)
+    if l % 2 == 1:
+        return s[int(l/2)]
+    else:
+        return (s[l/2 - 1] + s[l/2]) / 2
+
+def _mean(s):
+    return float(sum(s)) / len(s)
+
+def _stddev(s):
+    # Sample standard deviation; 0 for a single run
+    if len(s) < 2:
+        return 0.
+    mean = _mean(s)
+    return math.sqrt(sum([(v - mean) * (v - mean) for v in s]) / (len(s) - 1))
+
+# Mean of the values with the lowest and highest 10% removed
+def _trimmed_mean(s):
+    k = int(len(s) * 0.1)
+    return _mean(s[k:len(s) - k])
+
+# Percentile with linear interpolation between the closest runs
+def _percentile(p):
+    def percentile(s):
+        position = (len(s) - 1) * p / 100.
+        low = int(math.floor(position))
+        high = min(low + 1, len(s) - 1)
+        return s[low] + (s[high] - s[low]) * (position - low)
+    return percentile
+
+STATISTICS = {
+    'min': lambda s: s[0],
+    'max': lambda s: s[-1],
+    'median': _median,
+    'mean': _mean,
+    'stddev': _stddev,
+    'trimmed_mean': _trimmed_mean,
+    'p90': _percentile(90),
+}
+
+# Parsing the units string of a metric for its time exponent (see
+# util.time_exponent()) is done once for each distinct units string;
+# there are only a handful of them, and every upload has hundreds of
+# metrics.
+_unit_signatures = {}
+
+def time_exponent(units):
+    exponent = _unit_signatures.get(units)
+    if exponent is None:
+        exponent = util.time_exponent(units)
+        _unit_signatures[units] = exponent
+    return exponent
+
+def _statistics(s):
+    result = {}
+    for name in settings.METRIC_STATISTICS:
+        result[name] = STATISTICS[name](s)
+    return result
+
+# Computes the configured statistics for a list of run values
+def compute_statistics(values):
+    return _statistics(sorted(values))
+
+# Sets the primary 'value' of each metric in the 'metrics' member of a
+# report, and returns a dictionary mapping metric names to their
+# statistics. Raises ValueError, TypeError or KeyError for malformed
+# metrics.
+def reduce_metrics(metrics):
+    statistics = {}
+    for name in metrics:
+        metric = metrics[name]
+        values = metric['values']
+        if len(values) == 0:
+            raise ValueError("No values for '%s'" % name)
+
+        s = sorted(values)
+        exponent = time_exponent(metric['units'])
+        if exponent > 0:
+            metric['value'] = s[0]
+        elif exponent < 0:
+            metric['value'] = s[-1]
+        else:
+            metric['value'] = _median(s)
+
+        statistics[name] = _statistics(s)
+
+    return statistics
@@ -0,0 +1,91 @@
+# Detection of regressions as reports are uploaded. For each (system,
+# metric) we keep a baseline: the values from the last WINDOW reports.
+# A new value is compared to the median of the window, with the median
+# absolute deviation (MAD) as the measure of the usual spread of the
+# values; neither is thrown off by the occasional outlier the way a mean
+# and standard deviation would be. The score of a value is the "modified
+# z-score" of Iglewicz and Hoaglin:
+#
+#  score = 0.6745 * (value - median) / MAD
+#
+# and values scoring beyond THRESHOLD in the bad direction are flagged.
+# Every value, flagged or not, then goes into the window, so after a
+# genuine change the baseline moves to the new level within half a
+# window and only the first reports after the change are flagged.
+#
+# Since the window has a fixed size, checking a value is a constant
+# amount of work no matter how many reports the system has uploaded.
+
+# Number of recent values in a baseline
+WINDOW = 20
+
+# Values aren't checked until the baseline has this many values
+MIN_SAMPLES = 5
+
+# Modified z-score beyond which a value is flagged
+THRESHOLD = 3.5
+
+# If the past values are nearly all the same, the MAD is zero or tiny,
+# and any change at all would be flagged; the MAD is taken to be at least
+# this fraction of the median.
+MIN_RELATIVE_SPREAD = 0.01
+
+def _median(values):
+    s = sorted(values)
+    l = len(s)
+    if l % 2 == 1:
+        return s[l // 2]
+    else:
+        return (s[l // 2 - 1] + s[l // 2]) / 2.
+
+# Returns the median and MAD of the values in a baseline
+def summarize(values):
+    median = _median(values)
+    mad = _median([abs(v - median) for v in values])
+    mad = max(mad, MIN_RELATIVE_SPREAD * abs(median))
+
+    return median, mad
+
+# Checks value against the past values in baseline (a list, which is
+# updated in place), and returns (score, median, mad) if it's a
+# regression, otherwise None. better is -1 if smaller values are better,
+# 1 if larger values are better, 0 if we don't know, in which case a
+# change in either direction is flagged.
+def check_value(baseline, value, better):
+    result = None
+    if len(baseline) >= MIN_SAMPLES:
+        median, mad = summarize(baseline)
+        if mad > 0:
+            score = 0.6745 * (value - median) / mad
+            if better > 0:
+                regressed = score < - THRESHOLD
+            elif better < 0:
+                regressed = score > THRESHOLD
+            else:
+                regressed = abs(score) > THRESHOLD
+            if regressed:
+                result = (score, median, mad)
+
+    baseline.append(value)
+    del baseline[0:-WINDOW]
+
+    return result
+
+if __name__ == '__main__':
+    baseline = []
+    for v in [10, 11, 10, 9, 10, 10]:
+        assert check_value(baseline, v, -1) is None
+
+    # Increase in a smaller-is-better value is flagged, decrease isn't
+    assert check_value(baseline, 20, -1) is not None
+    assert check_value(list(baseline), 1, -1) is None
+    assert check_value(list(baseline), 1, 0) is not None
+
+    # After a step change, the baseline catches up
+    flagged = 0
+    for i in xrange(0, WINDOW):
+        if check_value(baseline, 20, -1) is not None:
+            flagged += 1
+    assert 0 < flagged < WINDOW / 2 + 1
+
+    assert len(baseline) == WINDOW
@@ -1,4 +1,7 @@
-from models import Metric
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from models import Metric, MetricDefinition, Regression, ReportStatistics, _SQLITE_MAX_VARIABLES
 import math
 import sys
 
@@ -14,7 +17,11 @@ TIME_UNITS = {
     'us': 0.000001
 }
 
-def format_values(values, units):
+# Figures out how to display a set of values, given the smallest and
+# largest of them, how many there are, and their units. Returns the
+# multiplier to apply to the values, the suffix to append, the number of
+# significant digits to show, and the units after scaling.
+def choose_format(low, high, count, units):
     # This routine figures out how to display the values on a line
     # of the report using three pieces of information
     #
@@ -24,11 +31,8 @@ def format_values(values, units):
     #
     # I've marked various arbitrary parameters below as TWEAKABLE
 
-    set_values = [v for v in values if v is not None]
-    if len(set_values) == 0:
-        return ['' for v in values], units
-    high = max(max(set_values), - min(set_values))
-    diff = max(set_values) - min(set_values)
+    diff = high - low
+    high = max(high, - low)
     suffix = ''
     mult = 1
 
@@ -81,13 +85,22 @@ def format_values(values, units):
 
         # If we have multiple values, determine how many digits we need
         # to distinguish the values
-        if len(values) > 1:
+        if count > 1:
             if diff > 0:
                 diff_digits = 1 + math.floor(math.log10(high)) - math.floor(math.log10(diff))
                 digits = max(digits, diff_digits)
 
         digits = int(digits)
 
+    return mult, suffix, digits, units
+
+def format_values(values, units):
+    set_values = [v for v in values if v is not None]
+    if len(set_values) == 0:
+        return ['' for v in values], units
+
+    mult, suffix, digits, units = choose_format(min(set_values), max(set_values), len(values), units)
+
     format = '%.*g' + suffix
     result = []
     for v in values:
@@ -98,61 +111,296 @@ def format_values(values, units):
 
     return result, units
 
+# Formats the statistics of the runs of a metric in a report (see
+# reduction.py) as strings like "min 10ms, median 12ms, ...". This is
+# done for all the reports in a row of a table at once, with a single
+# choice of units and digits for the row; statistics is a list with the
+# statistics for the metric in each report, or None.
+def _format_row_statistics(statistics, units):
+    names = settings.METRIC_STATISTICS
+    present = []
+    for s in statistics:
+        if s:
+            present.extend([s[name] for name in names if name in s])
+    if len(present) == 0:
+        return [None for s in statistics]
+
+    mult, suffix, digits, units = choose_format(min(present), max(present), len(present), units)
+
+    # The format strings are built once for the row, so each cell is a
+    # single string formatting operation
+    formats = {}
+    result = []
+    for s in statistics:
+        if s:
+            cell_names = tuple([name for name in names if name in s])
+            format = formats.get(cell_names)
+            if format is None:
+                format = formats[cell_names] = ", ".join(["%s %%.%dg%s" % (name, digits, suffix) for name in cell_names])
+            result.append(format % tuple([mult * s[name] for name in cell_names]))
+        else:
+            result.append(None)
+
+    return result
+
+# The HTML for the cells of a row of a table; this is done here rather
+# than in the template, since with hundreds of columns, the template
+# loop over the cells dominates the time to render the page. The cells
+# only contain numbers formatted by format_values() and the names of
+# statistics from the settings, so they don't need escaping.
+def _render_cells(cells):
+    html = []
+    for cell in cells:
+        title = cell['statistics']
+        if cell['baseline'] is not None:
+            title = "Possible regression; recent values around " + cell['baseline'] + (title and ("&#10;" + title) or "")
+            html.append('<td class="regression" title="%s">%s</td>' % (title, cell['value']))
+        elif title:
+            html.append('<td title="%s">%s</td>' % (title, cell['value']))
+        else:
+            html.append('<td>%s</td>' % cell['value'])
+
+    return mark_safe("".join(html))
+
+# Slice of seq for a page starting at offset, with count items or all the
+# rest if count is None
+def _page(seq, offset, count):
+    if count is None:
+        return seq[offset:]
+    else:
+        return seq[offset:offset + count]
+
+# Sizes of the pages of the table of reports on the system page
+ROWS_PER_PAGE = 200
+COLUMNS_PER_PAGE = 100
+
+# The statistics of the runs are shown as tooltips on the cells only for
+# pages with at most this many columns; beyond that, loading and
+# formatting them is most of the time to render the page, and most of its
+# size. They are still on the page of each report.
+STATISTICS_COLUMNS = 20
+
+# Building and rendering a page of a table with COLUMNS_PER_PAGE columns
+# should take less than this many seconds; 'manage.py bench_report_table'
+# checks it.
+LATENCY_BUDGET = 0.5
+
+# Relative change from the oldest value of a row to the newest one, or
+# None if there aren't two values to compare
+def _relative_change(values, date_order):
+    oldest = None
+    for i in date_order:
+        if values[i] is not None:
+            oldest = values[i]
+            break
+    newest = None
+    for i in reversed(date_order):
+        if values[i] is not None:
+            newest = values[i]
+            break
+
+    if oldest is None or newest is None or oldest == 0:
+        return None
+
+    return (newest - oldest) / abs(oldest)
+
+# A table comparing the metrics of a number of reports, with a row per
+# metric and a column per report, in the order they are added.
+#
+# All the metric values for all the reports are loaded into a matrix with
+# a single query, and the per-row work - finding the range of the values
+# to pick the units and digits to show, and the relative change for
+# sorting - is done in one pass over that matrix. Only the page of rows
+# and columns selected by row_offset and column_offset is formatted, and
+# regressions and statistics are only loaded for the reports on the page,
+# so the cost of a page doesn't depend much on how many reports are in
+# the table.
+#
+# sort is 'name' to sort the rows by metric name, or 'change' to put the
+# metrics that changed the most, relative to their value in the oldest
+# report, first. A row_count or column_count of None means all of them.
 class ReportTable:
-    def __init__(self):
+    def __init__(self, sort='name',
+                 row_offset=0, row_count=None,
+                 column_offset=0, column_count=None):
+        if not sort in ('name', 'change'):
+            raise ValueError("Unknown sort order '%s'" % sort)
+
+        self.sort = sort
+        self.row_offset = row_offset
+        self.row_count = row_count
+        self.column_offset = column_offset
+        self.column_count = column_count
         self.reports = []
-        self.col_headers = []
+        self.__all_col_headers = []
+        self.__n_rows = None
         self.__rows = None
 
     def add_report(self, report, name, link=None):
         self.reports.append(report)
-        self.col_headers.append({ 'name': name,
-                                  'link': link })
+        self.__all_col_headers.append({ 'name': name,
+                                        'link': link })
+
+    def __load_matrix(self):
+        column_index = {}
+        for i, report in enumerate(self.reports):
+            column_index[report.id] = i
+
+        # Rows keyed by definition id; there may be several definitions
+        # with the same name (if the description or units changed), which
+        # are merged below
+        values_by_definition = {}
+        report_ids = column_index.keys()
+        n_columns = len(self.reports)
+        for start in xrange(0, len(report_ids), _SQLITE_MAX_VARIABLES):
+            batch = report_ids[start:start + _SQLITE_MAX_VARIABLES]
+            for report_id, definition_id, value in Metric.objects.filter(report__in=batch).values_list('report', 'definition', 'value'):
+                row = values_by_definition.get(definition_id)
+                if row is None:
+                    row = values_by_definition[definition_id] = [None] * n_columns
+                row[column_index[report_id]] = value
+
+        definition_ids = values_by_definition.keys()
+        definitions = {}
+        for start in xrange(0, len(definition_ids), _SQLITE_MAX_VARIABLES):
+            definitions.update(MetricDefinition.objects.in_bulk(definition_ids[start:start + _SQLITE_MAX_VARIABLES]))
+
+        # The definition used for a row is the one from the newest report
+        # with the metric
+        date_order = range(0, n_columns)
+        date_order.sort(key=lambda i: self.reports[i].date)
+        newest = {}
+        rows = {}
+        for definition_id, values in values_by_definition.iteritems():
+            definition = definitions[definition_id]
+            last = [i for i in date_order if values[i] is not None][-1]
+            row = rows.get(definition.name)
+            if row is None:
+                rows[definition.name] = values
+                newest[definition.name] = (self.reports[last].date, definition)
+            else:
+                for i, value in enumerate(values):
+                    if value is not None:
+                        row[i] = value
+                if self.reports[last].date > newest[definition.name][0]:
+                    newest[definition.name] = (self.reports[last].date, definition)
+
+        return [(newest[name][1], rows[name]) for name in rows], date_order
 
     def __get_data(self):
         if self.__rows != None:
             return
 
         self.__rows = []
+        self.__n_rows = 0
         if len(self.reports) == 0:
             return
 
-        metrics_by_report = {}
-        for report in self.reports:
-            report_metrics = {}
-            for metric in report.metric_set.all():
-                report_metrics[metric.name] = metric
-            metrics_by_report[report] = report_metrics
-
-        sorted_reports = sorted(self.reports, lambda a, b: cmp(a.date, b.date))
-        latest_report = sorted_reports[-1]
-        latest_metrics = sorted(metrics_by_report[latest_report].values(), lambda a, b: cmp(a.name, b.name))
-
-        for metric in latest_metrics:
-            values = []
-            for report in self.reports:
-                report_metrics = metrics_by_report[report]
-                if metric.name in report_metrics:
-                    m = report_metrics[metric.name]
-                    values.append(m.value)
-                else:
-                    values.append(None)
-
-            formatted, units = format_values(values, metric.units)
-            self.__rows.append({ 'metric': metric,
+        matrix, date_order = self.__load_matrix()
+
+        # One pass over the matrix for the summaries of each row
+        summaries = []
+        for definition, values in matrix:
+            present = [v for v in values if v is not None]
+            summaries.append({ 'definition': definition,
+                               'values': values,
+                               'low': min(present),
+                               'high': max(present),
+                               'change': _relative_change(values, date_order) })
+
+        if self.sort == 'change':
+            summaries.sort(key=lambda s: (s['change'] is None, - abs(s['change'] or 0), s['definition'].name))
+        else:
+            summaries.sort(key=lambda s: s['definition'].name)
+
+        self.__n_rows = len(summaries)
+        page_summaries = _page(summaries, self.row_offset, self.row_count)
+        columns = _page(range(0, len(self.reports)), self.column_offset, self.column_count)
+        page_reports = [self.reports[i] for i in columns]
+        page_report_ids = [report.id for report in page_reports]
+
+        regressions = {}
+        for regression in Regression.objects.filter(report__in=page_report_ids):
+            regressions[(regression.report_id, regression.definition_id)] = regression
+
+        if len(page_reports) <= STATISTICS_COLUMNS:
+            statistics = ReportStatistics.objects.get_for_reports(page_reports)
+        else:
+            statistics = None
+
+        for summary in page_summaries:
+            definition = summary['definition']
+            values = summary['values']
+            low = summary['low']
+            high = summary['high']
+
+            # Baselines are formatted along with the values so that they
+            # are shown the same way
+            row_regressions = [regressions.get((report.id, definition.id)) for report in page_reports]
+            for regression in row_regressions:
+                if regression is not None:
+                    low = min(low, regression.baseline)
+                    high = max(high, regression.baseline)
+
+            # Scaled by the range of the whole row, not just the page, so
+            # the values don't change units from one page to the next
+            mult, suffix, digits, units = choose_format(low, high, len(values), definition.units)
+            format = '%.*g' + suffix
+
+            if statistics is not None:
+                row_statistics = _format_row_statistics([statistics[report.id].get(definition.name) for report in page_reports],
+                                                        definition.units)
+            else:
+                row_statistics = [None] * len(page_reports)
+
+            cells = []
+            for i, regression, cell_statistics in zip(columns, row_regressions, row_statistics):
+                value = values[i]
+                cell = { 'value': '',
+                         'baseline': None,
+                         'statistics': cell_statistics }
+                if value is not None:
+                    cell['value'] = format % (digits, mult * value)
+                if regression is not None:
+                    cell['baseline'] = format % (digits, mult * regression.baseline)
+                cells.append(cell)
+
+            change = summary['change']
+            if change is not None:
+                change = "%+.1f%%" % (100 * change)
+
+            self.__rows.append({ 'metric': definition,
                                  'units': units,
-                                 'values': formatted })
-                
+                                 'change': change,
+                                 'cells': cells,
+                                 'cells_html': _render_cells(cells) })
+
+    @property
+    def col_headers(self):
+        return _page(self.__all_col_headers, self.column_offset, self.column_count)
+
     @property
     def rows(self):
         self.__get_data()
         return self.__rows
 
+    # Total number of rows and columns, over all pages
+    @property
+    def n_rows(self):
+        self.__get_data()
+        return self.__n_rows
+
+    @property
+    def n_columns(self):
+        return len(self.reports)
+
 # This provides an identical interface to ReportTable, but instead
-# of comparing reports, it compares runs in one report
+# of comparing reports, it compares runs in one report. metrics is
+# a dictionary in the same form as the 'metrics' member of an uploaded
+# report.
 class RunTable:
-    def __init__(self, report_json):
-        self.json = report_json
+    def __init__(self, metrics):
+        self.metrics = metrics
         self.reports = []
         self.__col_headers = None
         self.__rows = None
@@ -164,7 +412,7 @@ class RunTable:
         self.__col_headers = []
         self.__rows = []
 
-        metrics = self.json['metrics']
+        metrics = self.metrics
         metric_names = sorted(metrics.keys())
 
         if len(metric_names) == 0:
@@ -181,10 +429,12 @@ class RunTable:
             # For ReportTable, row.metric is a Metric object, here it's just a dictionary
             # that looks much the same to to the template
             formatted, units = format_values(metric['values'], metric['units'])
+            cells = [{ 'value': v, 'baseline': None, 'statistics': None } for v in formatted]
             self.__rows.append({ 'metric': { 'name': name,
                                              'description': metric['description'] },
                                  'units': units,
-                                 'values': formatted })
+                                 'cells': cells,
+                                 'cells_html': _render_cells(cells) })
 
     @property
     def col_headers(self):
@@ -1,7 +1,9 @@
 import base64
+import cgi
 import re
 import sys
 import urllib
+import urlparse
 import util
 
 class BadSignature(Exception):
@@ -14,39 +16,18 @@ def _dequote(str):
     else:
         return str
 
-# This defines a method of signing an HTTP request similar to an OAuth
-# signed request, except that instead of treating the body of a POST
-# as a form with additional parameters, we just treat it as an opaque
-# blob.
-def check_signature(request, secret_key):
-    if isinstance(secret_key, unicode):
-        secret_key = secret_key.encode("UTF-8")
-
-    if not 'HTTP_X_SHELL_SIGNATURE' in request.META:
-        raise BadSignature("X-Shell-Signature header missing")
-
-    sent_signature_header = request.META['HTTP_X_SHELL_SIGNATURE']
-    m = re.match(r'^\s*(\S+)\s+(\S+)\s*$', sent_signature_header)
-    if not m:
-        raise BadSignature("Can't parse X-Shell-Signature header")
-
-    signature_method = _dequote(m.group(1))
-    sent_signature = _dequote(m.group(2))
-
-    if signature_method != "HMAC-SHA1":
-        raise BadSignature("Bad signature method '%s'" % signature_method)
-
-    signature_data = request.method + "&"
-    if request.is_secure():
+def _signature_base(method, secure, host, path, query):
+    signature_data = method + "&"
+    if secure:
         signature_data += "https://"
     else:
         signature_data += "http://"
 
-    signature_data += request.get_host()
-    signature_data += request.path
+    signature_data += host
+    signature_data += path
 
     params = []
-    for key, values in request.GET.iterlists():
+    for key, values in query:
         for value in values:
             params.append(urllib.quote(key, "~") + "=" + urllib.quote(value, "~"))
 
@@ -55,10 +36,73 @@ def check_signature(request, secret_key):
 
     signature_data += "&&"
 
-    h = util.hmac_sha1(secret_key.encode("UTF-8"))
-    h.update(signature_data)
-    h.update(request.raw_post_data)
-    expected_signature = urllib.quote(base64.b64encode(h.digest()), "~")
+    return signature_data
+
+# This defines a method of signing an HTTP request similar to an OAuth
+# signed request, except that instead of treating the body of a POST
+# as a form with additional parameters, we just treat it as an opaque
+# blob.
+#
+# SignatureChecker checks the signature incrementally, so that the body
+# can be fed through in chunks as it is read rather than being held
+# in memory. The header is parsed when the checker is created, so a
+# missing or malformed header is rejected before any of the body is read.
+class SignatureChecker:
+    def __init__(self, request, secret_key):
+        if isinstance(secret_key, unicode):
+            secret_key = secret_key.encode("UTF-8")
+
+        if not 'HTTP_X_SHELL_SIGNATURE' in request.META:
+            raise BadSignature("X-Shell-Signature header missing")
+
+        sent_signature_header = request.META['HTTP_X_SHELL_SIGNATURE']
+        m = re.match(r'^\s*(\S+)\s+(\S+)\s*$', sent_signature_header)
+        if not m:
+            raise BadSignature("Can't parse X-Shell-Signature header")
+
+        signature_method = _dequote(m.group(1))
+        self.__sent_signature = _dequote(m.group(2))
+
+        if signature_method != "HMAC-SHA1":
+            raise BadSignature("Bad signature method '%s'" % signature_method)
+
+        # The signature is the quoted base64 of a 20 byte SHA-1 digest
+        try:
+            digest = base64.b64decode(urllib.unquote(self.__sent_signature))
+        except TypeError:
+            raise BadSignature("Can't parse signature")
+        if len(digest) != 20:
+            raise BadSignature("Can't parse signature")
+
+        signature_data = _signature_base(request.method, request.is_secure(),
+                                         request.get_host(), request.path,
+                                         request.GET.iterlists())
+
+        self.__hmac = util.hmac_sha1(secret_key.encode("UTF-8"))
+        self.__hmac.update(signature_data)
+
+    def update(self, data):
+        self.__hmac.update(data)
+
+    def check(self):
+        expected_signature = urllib.quote(base64.b64encode(self.__hmac.digest()), "~")
+
+        if self.__sent_signature != expected_signature:
+            raise BadSignature("Bad signature")
+
+# The client side of the above: returns the value of the X-Shell-Signature
+# header for a request to the given URL with the given body. This is
+# what the shell does when uploading; it's used here for generating test
+# uploads.
+def sign(secret_key, method, url, body):
+    if isinstance(secret_key, unicode):
+        secret_key = secret_key.encode("UTF-8")
+
+    scheme, host, path, query, fragment = urlparse.urlsplit(url)
+    query = [(key, [value]) for key, value in cgi.parse_qsl(query, keep_blank_values=True)]
+
+    h = util.hmac_sha1(secret_key)
+    h.update(_signature_base(method, scheme == 'https', host, path, query))
+    h.update(body)
 
-    if sent_signature != expected_signature:
-        raise BadSignature("Bad signature")
+    return 'HMAC-SHA1 "%s"' % urllib.quote(base64.b64encode(h.digest()), "~")
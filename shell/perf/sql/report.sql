@@ -0,0 +1,2 @@
+-- Reports are almost always looked up for a system in date order
+CREATE INDEX perf_report_system_date ON perf_report (system_id, date);
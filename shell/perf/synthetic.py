@@ -0,0 +1,157 @@
+import datetime
+from gzip import GzipFile
+import os
+import random
+try:
+    import json
+except:
+    import simplejson as json
+
+from models import System
+
+# Generation of synthetic systems and reports, for benchmarking and for
+# loading a development installation with data. Everything is generated
+# from a random seed, so the same parameters always give the same data.
+#
+# The reports look like the ones uploaded by gnome-shell --perf: each
+# metric has a typical value that the runs are scattered around, and
+# which occasionally steps up or down from one report to the next, and
+# the event logs are a mix of paint cycles, script events and memory
+# statistics.
+
+# (name, description, units, typical value)
+METRIC_TEMPLATES = [
+    ('timeToUserActive', "Time from start of gnome-shell until the desktop is usable", 'us', 3000000),
+    ('timeToFirstFrame', "Time from start of gnome-shell until the first frame is drawn", 'us', 1500000),
+    ('overviewLatencyFirst', "Time to switch to the overview the first time", 'us', 250000),
+    ('overviewLatencySubsequent', "Time to switch to the overview after the first time", 'us', 40000),
+    ('overviewFpsFirst', "Frame rate when going to the overview, first time", 'frames / s', 30),
+    ('overviewFpsSubsequent', "Frame rate when going to the overview, subsequent times", 'frames / s', 55),
+    ('applicationsShowTimeFirst', "Time to show the applications view the first time", 'ms', 600),
+    ('applicationsShowTimeSubsequent', "Time to show the applications view after the first time", 'ms', 120),
+    ('usedAfterOverview', "Malloc'ed bytes after the overview is shown once", 'B', 40000000),
+    ('leakedAfterOverview', "Additional malloc'ed bytes the second time the overview is shown", 'B', 20000),
+    ('geditStartTime', "Time from gedit launch to mapping a window", 'ms', 400),
+    ('mallocUsedSize', "Memory allocated with malloc", 'KiB', 60000),
+    ('glxSwapLatency', "Time from requesting a buffer swap to its completion", 'us', 8000),
+    ('gcTime', "Time spent in JavaScript garbage collection", 's', 0.2),
+    ('textureCount', "Number of textures allocated", '', 1200),
+]
+
+OPERATING_SYSTEMS = ['Fedora 14', 'Fedora 15', 'Ubuntu 10.10', 'Ubuntu 11.04', 'openSUSE 11.4', 'Debian unstable']
+GRAPHICS = ['Intel GM45', 'Intel Ironlake', 'ATI Radeon HD 4350', 'ATI Radeon HD 5450', 'NVIDIA GeForce 9400M', 'NVIDIA GeForce GT 220']
+PROCESSORS = ['Intel Core 2 Duo P8600', 'Intel Core i5 520M', 'Intel Core i7 860', 'Intel Atom N450', 'AMD Athlon II X2 250', 'AMD Phenom II X4 945']
+
+# (name, statistic, argument): the argument is 'timestamp' for events whose
+# argument is an earlier timestamp, 'value' for statistics, or None
+EVENTS = [
+    ('clutter.stagePaintStart', False, None),
+    ('clutter.stagePaintDone', False, None),
+    ('glx.swapComplete', False, 'timestamp'),
+    ('script.overviewShowStart', False, None),
+    ('script.overviewShowDone', False, None),
+    ('script.applicationsShowStart', False, None),
+    ('script.applicationsShowDone', False, None),
+    ('glib.mallocUsedSize', True, 'value'),
+    ('perf.statisticsCollected', False, None),
+]
+
+class Generator:
+    def __init__(self, seed=0, n_metrics=len(METRIC_TEMPLATES), n_runs=3, n_events=1000):
+        self.random = random.Random(seed)
+        self.n_runs = n_runs
+        self.n_events = n_events
+
+        self.metrics = []
+        for i in xrange(0, n_metrics):
+            name, description, units, typical = METRIC_TEMPLATES[i % len(METRIC_TEMPLATES)]
+            if i >= len(METRIC_TEMPLATES):
+                name = "%s%d" % (name, i // len(METRIC_TEMPLATES))
+            self.metrics.append((name, description, units, typical))
+
+        # The current typical value of each metric for each system, which
+        # changes as reports are generated
+        self.__levels = {}
+        self.__n_systems = 0
+
+    # A new System, not yet saved
+    def system(self):
+        self.__n_systems += 1
+        r = self.random
+        operating_system = r.choice(OPERATING_SYSTEMS)
+        graphics = r.choice(GRAPHICS)
+        name = "%s-%s-%d" % (operating_system.split()[0].lower(), graphics.split()[0].lower(), self.__n_systems)
+        secret_key = "".join([r.choice('0123456789abcdef') for i in xrange(0, 32)])
+
+        return System(name=name,
+                      owner_email="owner-%d@example.com" % self.__n_systems,
+                      operating_system=operating_system,
+                      graphics=graphics,
+                      processor=r.choice(PROCESSORS),
+                      notes="Synthetic system",
+                      secret_key=secret_key)
+
+    def __log(self):
+        r = self.random
+        t = 1000000000000000
+        log = []
+        for i in xrange(0, self.n_events):
+            t += r.randint(1, 20000)
+            name, statistic, argument = r.choice(EVENTS)
+            if argument == 'timestamp':
+                log.append([t, name, t - r.randint(1000, 16000)])
+            elif argument == 'value':
+                log.append([t, name, r.randint(10000000, 100000000)])
+            else:
+                log.append([t, name])
+
+        return log
+
+    # The report for a new upload from system, as a dictionary ready to
+    # be converted to JSON
+    def report(self, system, date):
+        r = self.random
+        levels = self.__levels.get(system.name)
+        if levels is None:
+            levels = self.__levels[system.name] = [typical * r.uniform(0.5, 2)
+                                                   for name, description, units, typical in self.metrics]
+
+        metrics = {}
+        for i, (name, description, units, typical) in enumerate(self.metrics):
+            # Occasionally, a change in the code moves the typical value
+            if r.random() < 0.02:
+                levels[i] *= r.choice([0.8, 1.25])
+            metrics[name] = { 'description': description,
+                              'units': units,
+                              'values': [levels[i] * r.lognormvariate(0, 0.05) for j in xrange(0, self.n_runs)] }
+
+        events = []
+        for name, statistic, argument in EVENTS:
+            event = { 'name': name }
+            if statistic:
+                event['statistic'] = True
+            events.append(event)
+
+        return { 'date': date.isoformat(),
+                 'revision': "%040x" % r.getrandbits(160),
+                 'monitors': ['*1024x768+0+0'],
+                 'metrics': metrics,
+                 'events': events,
+                 'logs': [self.__log() for i in xrange(0, self.n_runs)] }
+
+    # n reports from system, one a day up to end
+    def reports(self, system, n, end=None):
+        if end is None:
+            end = datetime.datetime(2011, 1, 1)
+        for i in xrange(0, n):
+            yield self.report(system, end - datetime.timedelta(days=(n - 1 - i)))
+
+# Writes a report as gzip-compressed JSON
+def write_report(report, path):
+    f = open(path, 'wb')
+    try:
+        gz = GzipFile(os.path.basename(path), mode="wb", fileobj=f)
+        json.dump(report, gz)
+        gz.close()
+    finally:
+        f.close()
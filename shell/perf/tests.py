@@ -0,0 +1,204 @@
+import asyncore
+import datetime
+import smtpd
+import socket
+import threading
+
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.test import TestCase
+
+from shell.perf.mail import MailSender
+from shell.perf.models import LatestReport, Metric, MetricDefinition, OutgoingMail, Regression, Report, ReportStatistics, System
+from shell.perf.report_table import STATISTICS_COLUMNS
+from shell.perf import page_cache
+from shell.perf import reduction
+
+# An SMTP server on localhost that keeps the messages it receives, or
+# answers the DATA command with response if that is set
+class _StubSMTPServer(smtpd.SMTPServer):
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.response = None
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        if self.response is not None:
+            return self.response
+        self.messages.append((mailfrom, rcpttos, data))
+
+# The mail worker (mail.MailSender) against a stub SMTP server
+class MailSenderTest(TestCase):
+    def setUp(self):
+        self.server = _StubSMTPServer()
+        self.running = True
+        self.thread = threading.Thread(target=self.__serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.sender = MailSender('127.0.0.1:%d' % self.server.port)
+
+    def __serve(self):
+        while self.running:
+            asyncore.loop(timeout=0.05, count=1)
+
+    def tearDown(self):
+        self.sender.close()
+        self.running = False
+        self.thread.join()
+        self.server.close()
+
+    def __queue(self, toaddr='someone@example.com'):
+        return OutgoingMail.objects.create(fromaddr='noreply@example.com',
+                                           toaddr=toaddr,
+                                           message=u'Subject: Test\n\nHello\n',
+                                           next_attempt=datetime.datetime.now())
+
+    def __make_due(self):
+        OutgoingMail.objects.update(next_attempt=datetime.datetime.now())
+
+    def test_delivery(self):
+        self.__queue('a@example.com')
+        self.__queue('b@example.com')
+
+        self.assertEqual(self.sender.send_batch(), 2)
+
+        self.assertEqual([rcpttos for mailfrom, rcpttos, data in self.server.messages],
+                         [['a@example.com'], ['b@example.com']])
+        self.assertEqual(self.server.messages[0][0], 'noreply@example.com')
+        self.assertEqual(OutgoingMail.objects.count(), 0)
+        self.assertEqual(self.sender.sent, 2)
+
+        # Nothing left to do
+        self.assertEqual(self.sender.send_batch(), 0)
+
+    def test_retry_after_temporary_failure(self):
+        self.__queue()
+
+        self.server.response = '451 Try again later'
+        self.assertEqual(self.sender.send_batch(), 1)
+
+        mail = OutgoingMail.objects.get()
+        self.assertEqual(mail.attempts, 1)
+        self.failIf(mail.failed)
+        self.assert_(mail.next_attempt > datetime.datetime.now())
+        self.assert_('451' in mail.last_error)
+        self.assertEqual(self.server.messages, [])
+
+        # Not due yet
+        self.assertEqual(self.sender.send_batch(), 0)
+
+        self.server.response = None
+        self.__make_due()
+        self.assertEqual(self.sender.send_batch(), 1)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(OutgoingMail.objects.count(), 0)
+
+    def test_retry_after_connection_failure(self):
+        self.__queue()
+
+        # A port that nothing is listening on
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        closed_port = s.getsockname()[1]
+        s.close()
+        sender = MailSender('127.0.0.1:%d' % closed_port)
+        self.assertEqual(sender.send_batch(), 1)
+
+        mail = OutgoingMail.objects.get()
+        self.assertEqual(mail.attempts, 1)
+        self.failIf(mail.failed)
+
+        self.__make_due()
+        self.assertEqual(self.sender.send_batch(), 1)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(OutgoingMail.objects.count(), 0)
+
+    def test_permanent_failure(self):
+        self.__queue()
+
+        self.server.response = '554 Rejected'
+        self.sender.send_batch()
+
+        mail = OutgoingMail.objects.get()
+        self.assert_(mail.failed)
+        self.assertEqual(self.sender.failed, 1)
+
+        # Failed mail isn't tried again
+        self.__make_due()
+        self.server.response = None
+        self.assertEqual(self.sender.send_batch(), 0)
+        self.assertEqual(self.server.messages, [])
+
+# The number of SQL queries for the home page and the system page mustn't
+# grow with the number of reports (columns) shown
+class ViewQueryCountTest(TestCase):
+    N_METRICS = 10
+
+    def setUp(self):
+        self.old_debug = settings.DEBUG
+        # Queries are only recorded with DEBUG
+        settings.DEBUG = True
+        self.keys = [('test.metric%d' % i, "Test metric %d" % i, 'ms') for i in xrange(0, self.N_METRICS)]
+        self.definitions = MetricDefinition.objects.get_for_keys(self.keys)
+        self.n_systems = 0
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+
+    def __add_system(self, n_reports):
+        name = 'test-system-%d' % self.n_systems
+        self.n_systems += 1
+        system = System.objects.create(name=name, owner_email='owner@example.com',
+                                       operating_system='OS', graphics='Graphics',
+                                       processor='Processor', notes='', secret_key='0' * 32)
+
+        date = datetime.datetime(2010, 1, 1)
+        for i in xrange(0, n_reports):
+            date += datetime.timedelta(hours=1)
+            report = Report.objects.create(system=system, date=date, upload='')
+            statistics = {}
+            metrics = []
+            for j, key in enumerate(self.keys):
+                value = float(i + j + 1)
+                statistics[key[0]] = reduction.compute_statistics([value])
+                metrics.append(Metric(report=report, definition=self.definitions[key], value=value))
+            Metric.objects.bulk_insert(metrics)
+            ReportStatistics.objects.create_for_report(report, statistics)
+            Regression.objects.create(report=report, definition=self.definitions[self.keys[0]],
+                                      value=1., baseline=0.5, spread=0.1, score=5.)
+            LatestReport.objects.update_for_report(report)
+
+        return system
+
+    def __count_queries(self, path):
+        # So that the page is rendered rather than taken from the cache
+        page_cache.invalidate('site')
+        reset_queries()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(connection.queries)
+
+    def test_home(self):
+        self.__add_system(1)
+        few = self.__count_queries('/home')
+        for i in xrange(0, 5):
+            self.__add_system(1)
+        many = self.__count_queries('/home')
+
+        self.assertEqual(few, many)
+
+    def test_system_view(self):
+        n_reports = STATISTICS_COLUMNS + 20
+        system = self.__add_system(n_reports)
+        path = '/system/' + system.name + '?reports=%d'
+
+        # Up to STATISTICS_COLUMNS, the statistics for the tooltips are
+        # loaded as well
+        few = self.__count_queries(path % 2)
+        self.assertEqual(few, self.__count_queries(path % STATISTICS_COLUMNS))
+        self.assertEqual(few, self.__count_queries(path % STATISTICS_COLUMNS + '&sort=change'))
+
+        wide = self.__count_queries(path % (STATISTICS_COLUMNS + 1))
+        self.assertEqual(wide, self.__count_queries(path % n_reports))
+        self.assertEqual(wide, self.__count_queries(path % n_reports + '&sort=change'))
@@ -1,16 +1,16 @@
+import codecs
 from datetime import datetime
 import hashlib
 import hmac
 import re
-import smtplib
 
 from django.conf import settings
-from django.template.loader import render_to_string
 
 # Encoding detection for JSON rfc4627, section 3. The RFC doesn't mention
 # the possibility of starting with a BOM, but in pratice that's likely
-# if the input data is UTF-16.
-def application_json_to_unicode(raw):
+# if the input data is UTF-16. Returns the encoding and whether a BOM
+# was found; at least the first 4 bytes of the data should be passed in.
+def detect_json_encoding(raw):
     bom = True
     if raw[0:2] == '\xfe\xff':
         encoding = 'UTF-16BE'
@@ -35,16 +35,98 @@ def application_json_to_unicode(raw):
         nullPattern = re.sub(r'\x00', 'N', nullPattern)
 
         if nullPattern in null_patterns:
-            encoding = encodings[nullPattern]
+            encoding = null_patterns[nullPattern]
         else:
             encoding = 'UTF-8'
 
-    # json module can't handle initial bom, so strip if we found it
-    decoded = raw.decode(encoding)
-    if bom:
-        return decoded[1:]
-    else:
-        return decoded
+    return encoding, bom
+
+# feed() takes successive chunks of a JSON document in any of the RFC 4627
+# encodings and returns them converted to UTF-8, with any initial BOM
+# stripped. The JSON module can't handle an initial BOM.
+class JsonUtf8Transcoder:
+    def __init__(self):
+        self.__head = ''
+        self.__decoder = None
+        self.__bom = False
+
+    def __decode(self, data, final=False):
+        decoded = self.__decoder.decode(data, final)
+        if self.__bom and len(decoded) > 0:
+            decoded = decoded[1:]
+            self.__bom = False
+        return decoded.encode('UTF-8')
+
+    def feed(self, data):
+        if self.__decoder is None:
+            # Wait until we have enough data to detect the encoding
+            self.__head += data
+            if len(self.__head) < 4:
+                return ''
+            data = self.__head
+            self.__head = ''
+            encoding, self.__bom = detect_json_encoding(data)
+            self.__decoder = codecs.getincrementaldecoder(encoding)()
+
+        return self.__decode(data)
+
+    def finish(self):
+        if self.__decoder is None:
+            encoding, self.__bom = detect_json_encoding(self.__head)
+            self.__decoder = codecs.getincrementaldecoder(encoding)()
+            return self.__decode(self.__head, True)
+
+        return self.__decode('', True)
+
+# Generator returning the body of a request in chunks, read straight
+# from the WSGI input stream rather than through request.raw_post_data,
+# so that the body is never held in memory all at once.
+def iter_request_body(request, chunk_size=64*1024):
+    remaining = int(request.META.get('CONTENT_LENGTH') or 0)
+    stream = request.environ['wsgi.input']
+    while remaining > 0:
+        data = stream.read(min(chunk_size, remaining))
+        if not data:
+            raise IOError("Request body truncated")
+        remaining -= len(data)
+        yield data
+
+# Returns True if the Accept-Encoding header of the request allows us
+# to send gzip-encoded content
+def accepts_gzip(request):
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        params = item.split(';')
+        coding = params[0].strip().lower()
+        if coding != 'gzip' and coding != 'x-gzip':
+            continue
+
+        q = 1.
+        for param in params[1:]:
+            m = re.match(r'^\s*q\s*=\s*([0-9.]+)\s*$', param)
+            if m:
+                try:
+                    q = float(m.group(1))
+                except ValueError:
+                    pass
+        return q > 0
+
+    return False
+
+# Returns the power of time in a metric's units: 1 for 'ms', -1 for
+# 'frames / s', 0 for 'B'. For a positive exponent smaller values are
+# better, for a negative one larger values are better.
+def time_exponent(units):
+    exponent = 0
+    for m in re.finditer(r'(/\s+)?(\S+)[^\S]*', units):
+        inverse = m.group(1) is not None
+        unit = m.group(2)
+        if unit in ('s', 'ms', 'us'):
+            if inverse:
+                exponent -= 1
+            else:
+                exponent = 1
+
+    return exponent
 
 # This is a workaround to make the Python 2.4 hmac module work with the
 # external hashlib module in python-2.4
@@ -57,6 +139,11 @@ def hmac_sha1(key, msg=None):
 
 _ISO_DATE_RE = re.compile('^(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)(?:\.(\d+))?Z?$')
 
+# Returns False for infinities and NaN, which float() accepts as
+# 'inf' and 'nan'. (math.isinf() and math.isnan() are new in Python 2.6.)
+def is_finite(x):
+    return x - x == 0
+
 # Parse the subset of ISO 8601 date formats that datetime.isoformat() produces
 def parse_isodate(s):
     m = _ISO_DATE_RE.match(s)
@@ -86,22 +173,3 @@ def random_key():
     f = open('/dev/random')
     bytes = f.read(16)
     return "".join((_hex(ord(byte)) for byte in bytes))
-
-def send_email(template_name, args, toaddr):
-    fullargs = dict(args)
-    fullargs['fromaddr'] = settings.MAIL_FROM
-    fullargs['toaddr'] = toaddr
-    msg = render_to_string(template_name, fullargs)
-    
-    m = re.match(r'([^:]+)(?::(\d+))?', settings.SMTP_SERVER)
-    if m is None:
-        raise ValueError("Bad setting for SMTP_SERVER, should be <host>[:<port>]")
-    host = m.group(1)
-    if m.group(2) is not None:
-        port = int(m.group(2))
-    else:
-        port = 25
-
-    server = smtplib.SMTP(host, port)
-    server.sendmail(settings.MAIL_FROM, [toaddr], msg)
-    server.quit()
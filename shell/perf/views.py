@@ -1,22 +1,36 @@
-from cStringIO import StringIO
+import calendar
 import datetime
-from gzip import GzipFile
+import hashlib
 import hmac
+import math
+import os
 try:
     import json
 except:
     import simplejson as json
 import re
+import urllib
 
 from django.shortcuts import render_to_response
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction, IntegrityError
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified, Http404
+from django.utils.http import http_date
 from django.views.decorators.http import require_POST
+from django.views.static import was_modified_since
 
-from models import Metric, System, SystemEdit, Report
-from report_table import ReportTable, RunTable
+from models import EventLog, LatestReport, Metric, MetricDefinition, System, SystemEdit, Report, ReportInfo, ReportStatistics, RunValues, UploadDigest, UploadJob, UploadRateLimit
+from report_table import ReportTable, RunTable, ROWS_PER_PAGE, COLUMNS_PER_PAGE
 from system_form import SystemForm, NameField
+import comparison
+import compression
+import downsample
+import event_log
+import ingest
+import instrumentation
+import mail
+import page_cache
 import signed_request
 import util
 
@@ -67,6 +81,8 @@ def activate(request):
         edit.system = system
         edit.confirmed = True
         edit.save()
+
+        page_cache.invalidate('site')
         
     return render_to_response('pages/activate.html',
                               { 'page': 'activate',
@@ -93,6 +109,8 @@ def confirm_edit(request):
         
         edit.confirmed = True
         edit.save()
+
+        page_cache.invalidate('site')
         
     return render_to_response('pages/confirm_edit.html',
                               { 'page': 'confirm_edit',
@@ -102,23 +120,17 @@ def confirm_edit(request):
                                 'edit': edit,
                                 'system': edit.system })
 
+# Number of systems (with the most recent reports) shown on the home page
+HOME_SYSTEMS = 6
+
+@page_cache.cached_page('site', 'uploads')
 def home(request):
-    recent_reports = Report.objects.order_by('-date')[0:20]
-
-    reports = []
-    systems = set()
-    for report in recent_reports:
-        if report.system in systems:
-            continue
-        systems.add(report.system)
-        reports.append(report)
-        if len(reports) > 5:
-            break
+    latest_reports = LatestReport.objects.select_related('system', 'report').order_by('-date')[0:HOME_SYSTEMS]
 
     report_table = ReportTable()
-    for report in reports:
-        report_table.add_report(report, report.system.name,
-                                "system/%s" % report.system.name)
+    for latest in latest_reports:
+        report_table.add_report(latest.report, latest.system.name,
+                                "system/%s" % latest.system.name)
 
     return render_to_response('pages/home.html',
                               { 'page': 'home',
@@ -139,7 +151,7 @@ def _do_register(form):
     
     activation_link = "activate?edit=%d&auth=%s" % (edit.id, edit.make_auth("activate"))
 
-    util.send_email('mails/activate.txt',
+    mail.send_email('mails/activate.txt',
                     { 'settings': settings,
                       'system': edit,
                       'activation_link': activation_link },
@@ -168,6 +180,7 @@ def register(request):
                                 'form_action': 'register',
                                 'form_submit': "Register" })
 
+@page_cache.cached_page('site')
 def systems(request):
     systems = System.objects.all()
     return render_to_response('pages/systems.html',
@@ -176,6 +189,50 @@ def systems(request):
                                 'settings': settings,
                                 'systems': systems })
 
+def _comparison_group_field(request):
+    field = request.GET.get('group', 'graphics')
+    if not field in comparison.GROUP_FIELDS:
+        raise ValueError("Unknown group field")
+    return field
+
+# Comparison of the latest reports of all systems; the work of building
+# the matrix is only done once per upload, since the page is cached
+@page_cache.cached_page('site', 'uploads')
+def compare(request):
+    try:
+        group_field = _comparison_group_field(request)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+
+    matrix = comparison.ComparisonMatrix()
+    ranking = []
+    for item in matrix.ranking():
+        ranking.append({ 'system': item['system'],
+                         'group': getattr(item['system'], group_field),
+                         'overall': item['overall'] })
+    groups = matrix.groups(group_field)
+    groups.sort(key=lambda g: (g['overall'] is None, - (g['overall'] or 0)))
+
+    return render_to_response('pages/compare.html',
+                              { 'page': 'compare',
+                                'page_title': "Compare Systems",
+                                'settings': settings,
+                                'group_field': group_field,
+                                'group_fields': comparison.GROUP_FIELDS,
+                                'ranking': ranking,
+                                'groups': groups })
+
+@page_cache.cached_page('site', 'uploads')
+def compare_json(request):
+    try:
+        group_field = _comparison_group_field(request)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+
+    matrix = comparison.ComparisonMatrix()
+
+    return HttpResponse(json.dumps(matrix.to_json(group_field)), mimetype="application/json")
+
 def system_admin(request, system_name):
     try:
         system = System.objects.get(name=system_name)
@@ -203,7 +260,7 @@ def _do_edit(system, form):
     
     confirm_link = "confirm_edit?edit=%d&auth=%s" % (edit.id, edit.make_auth("confirm"))
 
-    util.send_email('mails/confirm_edit.txt',
+    mail.send_email('mails/confirm_edit.txt',
                     { 'settings': settings,
                       'system': system,
                       'edit': edit,
@@ -212,43 +269,215 @@ def _do_edit(system, form):
 
     return edit
 
+# How long clients can cache the data for a report
+REPORT_MAX_AGE = 365 * 24 * 60 * 60
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Generators used to stream report data to the client in chunks without
+# reading it all into memory
+def _iter_file(f, start, end, chunk_size=64*1024):
+    try:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+def _iter_decompressed(codec, path, chunk_size=64*1024):
+    f = instrumentation.TimedReader(codec.open_read(path))
+    try:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        f.close()
+        instrumentation.observe_step(codec.read_step, f.elapsed)
+
+# Sends a stored compressed file (a report or an event log; see
+# compression.py). If the file is gzip-compressed and the client can
+# handle gzip, the file is sent as is, rather than being decompressed
+# here. Everything stored for a report is immutable, so it can be cached
+# by clients indefinitely.
+def _serve_compressed_file(request, path, mimetype):
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise Http404
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), int(st.st_mtime), st.st_size):
+        return HttpResponseNotModified()
+
+    codec = compression.codec_for_path(path)
+    if codec.content_encoding == 'gzip' and util.accepts_gzip(request):
+        f = open(path, 'rb')
+        start, end = 0, st.st_size
+
+        range_header = request.META.get('HTTP_RANGE')
+        m = range_header and _RANGE_RE.match(range_header)
+        if m:
+            if m.group(1) != '':
+                start = int(m.group(1))
+                if m.group(2) != '':
+                    end = min(end, int(m.group(2)) + 1)
+            elif m.group(2) != '':
+                start = max(0, end - int(m.group(2)))
+
+            if start >= end:
+                f.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % st.st_size
+                return response
+
+            response = HttpResponse(_iter_file(f, start, end), status=206, mimetype=mimetype)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, st.st_size)
+        else:
+            response = HttpResponse(_iter_file(f, start, end), mimetype=mimetype)
+
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = str(end - start)
+        response['Accept-Ranges'] = 'bytes'
+    else:
+        response = HttpResponse(_iter_decompressed(codec, path), mimetype=mimetype)
+
+    response['Cache-Control'] = 'public, max-age=%d' % REPORT_MAX_AGE
+    response['Last-Modified'] = http_date(st.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+
+    return response
+
 def report_json(request, system_name, report_id):
     try:
-        report = Report.objects.get(id=report_id)
+        report = Report.objects.select_related('system').get(id=report_id)
+    except Report.DoesNotExist:
+        raise Http404
+
+    if system_name != report.system.name:
+        raise Http404
+
+    return _serve_compressed_file(request, report.upload.path, "application/json")
+
+# The event logs of the report in the compact form from event_log.py
+def report_log(request, system_name, report_id):
+    try:
+        log = EventLog.objects.select_related('report__system').get(report=report_id)
+    except EventLog.DoesNotExist:
+        raise Http404
+
+    if system_name != log.report.system.name:
+        raise Http404
+
+    return _serve_compressed_file(request, log.upload.path, "application/octet-stream")
+
+# Statistics of the runs of each metric in a report, as JSON; see
+# reduction.py
+def report_statistics(request, system_name, report_id):
+    try:
+        report = Report.objects.select_related('system').get(id=report_id)
     except Report.DoesNotExist:
         raise Http404
 
     if system_name != report.system.name:
         raise Http404
 
-    response = HttpResponse(mimetype="application/json")
+    statistics = ReportStatistics.objects.get_for_reports([report])[report.id]
+
+    response = HttpResponse(json.dumps(statistics), mimetype="application/json")
+    response['Cache-Control'] = 'public, max-age=%d' % REPORT_MAX_AGE
+
+    return response
+
+# Limit on the height parameter of report_log_window
+MAX_WINDOW_HEIGHT = 10000
+
+# A window of one run of the event log, for the log viewer to show a
+# small part of a run too big to download all at once. The query
+# parameters are:
+#
+#  start, end: the window, in seconds since the start of the run (default
+#    to the whole run)
+#  height: height of the window in pixels
+#  bucket: events within this many pixels of each other are summarized
+#    if there are more than a few of them (see event_log.RunIndex.query())
+#  overview: if present, the response includes the pixel rows with events
+#    when the whole run is shown in height pixels
+def report_log_window(request, system_name, report_id, run):
+    try:
+        log = EventLog.objects.select_related('report__system').get(report=report_id)
+    except EventLog.DoesNotExist:
+        raise Http404
+
+    if system_name != log.report.system.name:
+        raise Http404
+
+    try:
+        run_index = event_log.load_run(log.upload.path, int(run))
+    except event_log.EventLogError:
+        raise Http404
+
+    try:
+        start = float(request.GET.get('start', 0))
+        end = float(request.GET.get('end', max(run_index.range, start + 0.001)))
+        height = int(request.GET.get('height', 600))
+        bucket = int(request.GET.get('bucket', 10))
+    except ValueError:
+        return HttpResponseBadRequest("Bad window parameters")
+
+    if not (end > start and 0 < height <= MAX_WINDOW_HEIGHT and 0 < bucket <= height):
+        return HttpResponseBadRequest("Bad window parameters")
+    # The time covered by a bucket has to be something we can divide by
+    bucket_time = (end - start) * bucket / float(height)
+    if not (util.is_finite(start) and util.is_finite(end) and util.is_finite(bucket_time) and bucket_time > 0):
+        return HttpResponseBadRequest("Bad window parameters")
+
+    result = run_index.query(start, end, height, bucket)
+    result['runs'] = run_index.run_count
+    result['count'] = run_index.count
+    result['range'] = run_index.range
+    result['start'] = run_index.start
+    if 'overview' in request.GET:
+        result['overview'] = run_index.overview(height)
 
-    gunzip = GzipFile(report.upload.path, "r")
-    reportContents = gunzip.read()
+    response = HttpResponse(json.dumps(result), mimetype="application/json")
+    response['Cache-Control'] = 'public, max-age=%d' % REPORT_MAX_AGE
 
-    return HttpResponse(reportContents, mimetype="application/json")
+    return response
 
+# Reports never change once uploaded
+@page_cache.cached_page('site')
 def report_view(request, system_name, report_id):
     try:
-        report = Report.objects.get(id=report_id)
+        report = Report.objects.select_related('system').get(id=report_id)
     except Report.DoesNotExist:
         raise Http404
 
     if system_name != report.system.name:
         raise Http404
 
-    gunzip = GzipFile(report.upload.path, "r")
-    report_contents = gunzip.read()
-    report_json = json.loads(report_contents)
+    info = ReportInfo.objects.get_for_report(report)
+
+    metrics = {}
+    for run_values in RunValues.objects.get_for_report(report):
+        definition = run_values.definition
+        metrics[definition.name] = { 'description': definition.description,
+                                     'units': definition.units,
+                                     'values': run_values.values }
 
-    run_table = RunTable(report_json)
+    run_table = RunTable(metrics)
 
     return render_to_response('pages/report_view.html',
                               { 'page': 'report_view',
                                 'page_title': report.system.name,
                                 'settings': settings,
                                 'report': report,
-                                'report_json': report_json,
+                                'info': info,
                                 'report_table': run_table})
 
 def system_edit(request, system_name):
@@ -308,7 +537,7 @@ def system_mail_key(request, system_name):
 
     mailed = False
     if request.method == 'POST':    
-        util.send_email('mails/mail_key.txt',
+        mail.send_email('mails/mail_key.txt',
                         { 'settings': settings,
                           'system': system },
                         system.owner_email)
@@ -321,11 +550,135 @@ def system_mail_key(request, system_name):
                                 'mailed': mailed,
                                 'system': system })
 
-# Failsafe to prevent memory exhaustion when reading report into memory
-# or parsing JSON. We store the report gzip'ed so disk space usage
-# will be significantly less than this.
-MAX_CONTENT_LENGTH = 4 * 1024 * 1024
+# Failsafe to prevent runaway uploads. The report is spooled to disk as it
+# is read, so this is not bounded by memory usage.
+MAX_CONTENT_LENGTH = 64 * 1024 * 1024
+
+# For system_upload_batch
+MAX_BATCH_CONTENT_LENGTH = 1024 * 1024 * 1024
+
+# Number of reports from a batch stored in each transaction when uploads
+# aren't deferred
+BATCH_TRANSACTION_SIZE = 50
+
+class ReportTooBig(Exception):
+    pass
+
+# Copies the body of the request to spool, feeding it to the signature
+# checker, and to digest if given. Raises ReportTooBig or IOError.
+def _spool_request_body(request, checker, spool, max_length, digest=None):
+    # The WSGI server doesn't necessarily enforce CONTENT_LENGTH
+    length = 0
+    for data in util.iter_request_body(request):
+        length += len(data)
+        if length > max_length:
+            raise ReportTooBig()
+        checker.update(data)
+        if digest is not None:
+            digest.update(data)
+        spool.write(data)
+
+# Checks everything about an upload that can be checked without reading
+# the body: the length, the signature header, and the rate of uploads from
+# the system (a batch counts as one upload). Returns a SignatureChecker to
+# feed the body to, or an error response.
+def _check_upload_headers(request, system, max_length, too_big_message):
+    try:
+        content_length = int(request.META['CONTENT_LENGTH'])
+    except KeyError:
+        return HttpResponse("Content-Length required\n", 'text/plain; charset=UTF-8', 411)
+    except ValueError:
+        return HttpResponseBadRequest("Bad Content-Length\n")
+    if content_length > max_length:
+        return HttpResponseBadRequest(too_big_message)
+
+    try:
+        checker = signed_request.SignatureChecker(request, system.secret_key)
+    except signed_request.BadSignature, e:
+        return HttpResponseForbidden(str(e))
+
+    # Checked after the header, so that requests that could never succeed
+    # don't use up the uploads of the system. The signature itself can
+    # only be checked once the body has been read; if it turns out to be
+    # bad, the token is given back with _refund_upload().
+    if settings.UPLOAD_RATE:
+        wait = UploadRateLimit.objects.take(system, settings.UPLOAD_RATE / 3600., settings.UPLOAD_BURST)
+        if wait > 0:
+            response = HttpResponse("Too many uploads\n", 'text/plain; charset=UTF-8', 429)
+            response['Retry-After'] = str(int(math.ceil(wait)))
+            return response
+
+    return checker
+
+# Called when an upload is rejected before its signature has been
+# verified, so it may not have come from the system at all
+def _refund_upload(system):
+    if settings.UPLOAD_RATE:
+        UploadRateLimit.objects.refund(system, settings.UPLOAD_BURST)
+
+def _upload_status_url(job):
+    return settings.BASE_URL + "system/%s/upload/%d" % (job.system.name, job.id)
+
+def _upload_report_url(job):
+    return settings.BASE_URL + "report/%s/%d" % (job.system.name, job.report_id)
+
+def _upload_status(job):
+    result = { 'id': job.id,
+               'status': _upload_status_url(job),
+               'state': job.state,
+               'created': job.created.isoformat(),
+               'attempts': job.attempts }
+    if job.finished is not None:
+        result['finished'] = job.finished.isoformat()
+    if job.error:
+        result['error'] = job.error
+    if job.report_id is not None:
+        result['report'] = _upload_report_url(job)
 
+    return result
+
+# Whether to queue an upload for the workers and return 202 Accepted.
+# Clients written before uploads were deferred treat anything but 200 as
+# a failure, so this is only done for clients that ask for it with
+# 'Prefer: respond-async' (RFC 7240).
+def _defer_upload(request):
+    if not settings.DEFERRED_UPLOADS:
+        return False
+
+    for preference in request.META.get('HTTP_PREFER', '').split(','):
+        if preference.split(';')[0].strip().lower() == 'respond-async':
+            return True
+
+    return False
+
+# Response to an upload of the same report as job: the URL of the report
+# if it has been stored, or otherwise the status of the first upload
+def _duplicate_upload_response(job, deferred):
+    if job.report_id is not None:
+        report_url = _upload_report_url(job)
+        response = HttpResponse("Report already uploaded\n" + report_url + "\n", 'text/plain; charset=UTF-8', 200)
+        response['Location'] = report_url
+    else:
+        status_url = _upload_status_url(job)
+        if deferred:
+            status = 202
+        else:
+            status = 200
+        response = HttpResponse("Report upload accepted\n" + status_url + "\n", 'text/plain; charset=UTF-8', status)
+        response['Location'] = status_url
+
+    return response
+
+# For clients that send 'Prefer: respond-async' (see _defer_upload()), the
+# upload is only checked for a valid signature and saved to disk as an
+# UploadJob here; it is processed later by a worker (see ingest.py), and
+# we return 202 Accepted with the URL of system_upload_status. For other
+# clients, or with DEFERRED_UPLOADS = False in the settings, the job is
+# processed before returning 200, as it was before uploads were deferred.
+#
+# An upload with exactly the same body as an earlier upload from the
+# system isn't stored again (unless the earlier upload failed); see
+# _duplicate_upload_response().
 @require_POST
 def system_upload(request, system_name):
     try:
@@ -333,99 +686,402 @@ def system_upload(request, system_name):
     except System.DoesNotExist:
         raise Http404
 
-    content_length = int(request.META['CONTENT_LENGTH'])
-    if content_length > MAX_CONTENT_LENGTH:
-        return HttpResponseBadRequest("Report too big")
+    checker = _check_upload_headers(request, system, MAX_CONTENT_LENGTH, "Report too big")
+    if isinstance(checker, HttpResponse):
+        return checker
 
+    spool = TemporaryUploadedFile(system_name + ".json", 'application/json', 0, None)
     try:
-        signed_request.check_signature(request, system.secret_key)
-    except signed_request.BadSignature, e:
-        return HttpResponseForbidden(str(e))
+        digest = hashlib.sha1()
+        try:
+            _spool_request_body(request, checker, spool, MAX_CONTENT_LENGTH, digest)
+        except ReportTooBig:
+            _refund_upload(system)
+            return HttpResponseBadRequest("Report too big")
+        except IOError, e:
+            _refund_upload(system)
+            return HttpResponseBadRequest(str(e))
 
-    reportContents = util.application_json_to_unicode(request.raw_post_data)
-    reportJson = json.loads(reportContents)
+        try:
+            checker.check()
+        except signed_request.BadSignature, e:
+            _refund_upload(system)
+            return HttpResponseForbidden(str(e))
 
-    date = util.parse_isodate(reportJson['date'])
+        deferred = _defer_upload(request)
+        digest = digest.hexdigest()
+        previous = UploadDigest.objects.lookup(system, digest)
+        if previous is not None and previous.job.state != 'failed':
+            return _duplicate_upload_response(previous.job, deferred)
 
-    metrics = reportJson['metrics']
+        if deferred:
+            job = UploadJob.objects.create_from_spool(system, spool, 'queued')
+        else:
+            job = UploadJob.objects.create_from_spool(system, spool, 'processing')
+    finally:
+        spool.close()
 
-    for name in metrics:
-        metric = metrics[name]
-        units = metric['units']
-        values = metric['values']
-        
-        time_exponent = 0
-        for m in re.finditer(r'(/\s+)?(\S+)[^\S]*', metric['units']):
-            inverse = m.group(1) is not None
-            unit = m.group(2)
-            if unit in ('s', 'ms', 'us'):
-                if inverse:
-                    time_exponent -= 1
-                else:
-                    time_exponent = 1
+    if not UploadDigest.objects.record(job, digest, previous):
+        # The same report was uploaded by another request at the same time
+        job.upload.delete(save=False)
+        job.delete()
+        return _duplicate_upload_response(UploadDigest.objects.lookup(system, digest).job, deferred)
+
+    if not deferred:
+        if ingest.run_job(job):
+            return HttpResponse("Report upload succeeded", 'text/plain; charset=UTF-8', 200)
+        elif job.error.startswith("Malformed report"):
+            return HttpResponseBadRequest(job.error)
+        else:
+            return HttpResponse(job.error, 'text/plain; charset=UTF-8', 500)
 
-        # Least contaminated run is shortest run
-        if time_exponent > 0:
-            value = min(values)
-        elif time_exponent < 0:
-            value = max(values)
+    status_url = _upload_status_url(job)
+    response = HttpResponse("Report upload accepted\n" + status_url + "\n", 'text/plain; charset=UTF-8', 202)
+    response['Location'] = status_url
+
+    return response
+
+# Splits a batch of reports, one per line, into jobs. Blank lines are
+# ignored. Returns a list with, for each report, either its UploadJob or
+# the error if the report couldn't be queued, and a list of the new jobs.
+# A report that was uploaded before (or earlier in the batch) gets the job
+# of the earlier upload, as for system_upload. If the transaction is
+# rolled back, the uploaded files of the new jobs are deleted.
+@transaction.commit_on_success
+def _create_batch_jobs(system, f, state):
+    results = []
+    new_jobs = []
+    # digest => job, for the jobs created here
+    batch_jobs = {}
+
+    def finish_item(spool, digest, length):
+        if length > MAX_CONTENT_LENGTH:
+            results.append("Report too big")
         else:
-            # median
-            l = len(values)
-            s = sorted(values)
-            if l % 2 == 1:
-                value = s[int(l/2)]
+            digest = digest.hexdigest()
+            if digest in batch_jobs:
+                results.append(batch_jobs[digest])
+            else:
+                previous = UploadDigest.objects.lookup(system, digest)
+                if previous is not None and previous.job.state != 'failed':
+                    results.append(previous.job)
+                else:
+                    job = UploadJob.objects.create_from_spool(system, spool, state)
+                    new_jobs.append(job)
+                    if UploadDigest.objects.record(job, digest, previous):
+                        results.append(job)
+                        batch_jobs[digest] = job
+                    else:
+                        # The same report was uploaded by another request
+                        # at the same time
+                        new_jobs.pop()
+                        job.upload.delete(save=False)
+                        job.delete()
+                        previous = UploadDigest.objects.lookup(system, digest)
+                        if previous is not None:
+                            results.append(previous.job)
+                        else:
+                            results.append("Report uploaded by another request at the same time")
+        spool.close()
+
+    spool = None
+    try:
+        length = 0
+        while True:
+            data = f.read(64 * 1024)
+            if not data:
+                break
+
+            lines = data.split('\n')
+            for i, line in enumerate(lines):
+                if spool is None and line.strip() != '':
+                    spool = TemporaryUploadedFile(system.name + ".json", 'application/json', 0, None)
+                    digest = hashlib.sha1()
+                    length = 0
+                if spool is not None:
+                    length += len(line)
+                    # Once the report is too big, just skip to the end of the line
+                    if length <= MAX_CONTENT_LENGTH:
+                        spool.write(line)
+                        digest.update(line)
+                    if i < len(lines) - 1:
+                        finish_item(spool, digest, length)
+                        spool = None
+
+        if spool is not None:
+            finish_item(spool, digest, length)
+    except:
+        if spool is not None:
+            spool.close()
+        for job in new_jobs:
+            job.upload.delete(save=False)
+        raise
+
+    return results, new_jobs
+
+# Uploads many reports at once, for backfilling history. The body is
+# newline-delimited JSON (application/x-ndjson): each line is a report
+# in the same form as for system_upload. The whole body is signed, as for
+# system_upload. The response is a JSON object with, in 'results', the
+# status of each report in the same form as system_upload_status, or
+# { 'state': 'failed', 'error': <error> } for a report that couldn't be
+# queued at all.
+@require_POST
+def system_upload_batch(request, system_name):
+    try:
+        system = System.objects.get(name=system_name)
+    except System.DoesNotExist:
+        raise Http404
+
+    checker = _check_upload_headers(request, system, MAX_BATCH_CONTENT_LENGTH, "Batch too big")
+    if isinstance(checker, HttpResponse):
+        return checker
+
+    spool = TemporaryUploadedFile(system_name + ".ndjson", 'application/x-ndjson', 0, None)
+    try:
+        try:
+            _spool_request_body(request, checker, spool, MAX_BATCH_CONTENT_LENGTH)
+        except ReportTooBig:
+            _refund_upload(system)
+            return HttpResponseBadRequest("Batch too big")
+        except IOError, e:
+            _refund_upload(system)
+            return HttpResponseBadRequest(str(e))
+
+        try:
+            checker.check()
+        except signed_request.BadSignature, e:
+            _refund_upload(system)
+            return HttpResponseForbidden(str(e))
+
+        spool.seek(0)
+        try:
+            if settings.DEFERRED_UPLOADS:
+                items, jobs = _create_batch_jobs(system, spool, 'queued')
             else:
-                value = (s[l/2 - 1] + s[l/2]) / 2
+                items, jobs = _create_batch_jobs(system, spool, 'processing')
+        except IntegrityError:
+            # A conflict with another request that couldn't be resolved;
+            # nothing was stored, so the client can just try again
+            response = HttpResponse("Conflict with another upload, try again\n", 'text/plain; charset=UTF-8', 503)
+            response['Retry-After'] = '1'
+            return response
+    finally:
+        spool.close()
 
-        metric['value'] = value
+    if not settings.DEFERRED_UPLOADS:
+        for start in xrange(0, len(jobs), BATCH_TRANSACTION_SIZE):
+            ingest.run_jobs(jobs[start:start + BATCH_TRANSACTION_SIZE])
 
-    report = Report(system=system, date=date)
-    
-    filename = system_name + "-" + date.strftime("%Y%m%d-%H%M%S") + ".gz"
-    str_io = StringIO()
-    gz = GzipFile(filename, mode="wb", fileobj=str_io)
-    gz.write(reportContents.encode("UTF-8"))
-    gz.close()
+    results = []
+    for item in items:
+        if isinstance(item, UploadJob):
+            results.append(_upload_status(item))
+        else:
+            results.append({ 'state': 'failed', 'error': item })
 
-    # so just compress into a memory buffer and save that.
-    report.upload.save(filename,
-                       ContentFile(str_io.getvalue()))
-    report.save()
+    if settings.DEFERRED_UPLOADS:
+        status = 202
+    else:
+        status = 200
 
-    
-    for name in metrics:
-        metric = metrics[name]
-        description = metric['description']
-        units = metric['units']
-        value = metric['value']
+    return HttpResponse(json.dumps({ 'results': results }), "application/json", status)
 
-        storedMetric = Metric(name=name,
-                              description=description,
-                              units=units,
-                              report=report,
-                              value=value)
-        storedMetric.save()
+# The state of an upload, as JSON
+def system_upload_status(request, system_name, job_id):
+    try:
+        job = UploadJob.objects.select_related('system').get(id=job_id)
+    except UploadJob.DoesNotExist:
+        raise Http404
+
+    if system_name != job.system.name:
+        raise Http404
+
+    response = HttpResponse(json.dumps(_upload_status(job)), mimetype="application/json")
+    response['Cache-Control'] = 'no-cache'
+
+    return response
 
-    return HttpResponse("Report upload succeeded", 'text/plain; charset=UTF-8"', 200)
+# Number of reports shown on the system page by default, and the most
+# that can be asked for
+SYSTEM_REPORTS = 5
+MAX_SYSTEM_REPORTS = 1000
 
+# Query parameters for the system page:
+#
+#  reports: the number of most recent reports in the table
+#  sort: 'name' or 'change', see ReportTable
+#  rows, columns: the first row and column of the page of the table shown
+#
+@page_cache.cached_page('site', 'system:%(system_name)s')
 def system_view(request, system_name):
     try:
         system = System.objects.get(name=system_name)
     except System.DoesNotExist:
         raise Http404
 
-    reports = Report.objects.filter(system=system).order_by('-date')[0:5]
+    try:
+        n_reports = int(request.GET.get('reports', SYSTEM_REPORTS))
+        row_offset = int(request.GET.get('rows', 0))
+        column_offset = int(request.GET.get('columns', 0))
+        if not 0 < n_reports <= MAX_SYSTEM_REPORTS or row_offset < 0 or column_offset < 0:
+            raise ValueError("Parameter out of range")
+        report_table = ReportTable(sort=request.GET.get('sort', 'name'),
+                                   row_offset=row_offset,
+                                   row_count=ROWS_PER_PAGE,
+                                   column_offset=column_offset,
+                                   column_count=COLUMNS_PER_PAGE)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e) + "\n")
+
+    reports = Report.objects.filter(system=system).order_by('-date')[0:n_reports]
 
-    report_table = ReportTable()
     for report in reports:
         report_table.add_report(report,
                                 report.date.strftime("%y-%m-%d"),
                                 "report/%s/%d" % (system.name, report.id))
 
+    def link(**changes):
+        params = { 'reports': n_reports,
+                   'sort': report_table.sort,
+                   'rows': row_offset,
+                   'columns': column_offset }
+        params.update(changes)
+        for name, default in (('reports', SYSTEM_REPORTS), ('sort', 'name'), ('rows', 0), ('columns', 0)):
+            if params[name] == default:
+                del params[name]
+        query = urllib.urlencode(sorted(params.items()))
+        if query:
+            query = "?" + query
+        return "system/%s%s" % (urllib.quote(system.name), query)
+
+    pages = {}
+    if row_offset > 0:
+        pages['previous_rows'] = link(rows=max(row_offset - report_table.row_count, 0))
+    if row_offset + report_table.row_count < report_table.n_rows:
+        pages['next_rows'] = link(rows=row_offset + report_table.row_count)
+    if column_offset > 0:
+        pages['newer_reports'] = link(columns=max(column_offset - report_table.column_count, 0))
+    if column_offset + report_table.column_count < report_table.n_columns:
+        pages['older_reports'] = link(columns=column_offset + report_table.column_count)
+    if report_table.sort == 'name':
+        pages['sort'] = link(sort='change', rows=0)
+    else:
+        pages['sort'] = link(sort='name', rows=0)
+    if report_table.n_columns == n_reports and n_reports < MAX_SYSTEM_REPORTS:
+        pages['more_reports'] = link(reports=min(n_reports * 4, MAX_SYSTEM_REPORTS), columns=0)
+
     return render_to_response('pages/system_view.html',
                               { 'page': 'system_view',
                                 'page_title': system.name,
                                 'settings': settings,
                                 'system': system,
-                                'report_table': report_table })
+                                'report_table': report_table,
+                                'pages': pages })
+
+SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+
+# Parses the query parameters common to the metric series views:
+#
+#  start, end: ISO dates limiting the reports included
+#  points: the number of points to downsample each series to
+#  method: 'lttb' (the default) or 'minmax', see downsample.py
+#
+# Returns the filtered queryset and a function to turn the rows of the
+# queryset for one series into the 'points' of the response. Raises
+# ValueError for bad parameters.
+def _series_params(request, metrics):
+    if 'start' in request.GET:
+        metrics = metrics.filter(report__date__gte=util.parse_isodate(request.GET['start']))
+    if 'end' in request.GET:
+        metrics = metrics.filter(report__date__lte=util.parse_isodate(request.GET['end']))
+
+    points = int(request.GET.get('points', SERIES_POINTS))
+    if not 0 < points <= MAX_SERIES_POINTS:
+        raise ValueError("Bad number of points")
+
+    method = request.GET.get('method', 'lttb')
+    if not method in downsample.METHODS:
+        raise ValueError("Unknown downsampling method")
+
+    # Rows are (date, value, report_id); dates are downsampled as
+    # seconds since the epoch and returned as ISO dates
+    def make_series(rows):
+        series = [(calendar.timegm(date.utctimetuple()), value, report_id)
+                  for date, value, report_id in rows]
+        series = downsample.downsample(series, points, method)
+        return { 'count': len(rows),
+                 'points': [[datetime.datetime.utcfromtimestamp(t).isoformat() + 'Z', value, report_id]
+                            for t, value, report_id in series] }
+
+    return metrics.order_by('report__date'), make_series
+
+def _get_metric_definitions(metric_name):
+    definitions = MetricDefinition.objects.filter(name=metric_name)
+    if len(definitions) == 0:
+        raise Http404
+
+    return [{ 'description': d.description, 'units': d.units } for d in definitions]
+
+def _series_response(result):
+    return HttpResponse(json.dumps(result), mimetype="application/json")
+
+# The values of a metric for all the reports from a system over time,
+# downsampled to a bounded number of points for charting long-term trends
+@page_cache.cached_page('site', 'system:%(system_name)s')
+def system_metric_series(request, system_name, metric_name):
+    try:
+        system = System.objects.get(name=system_name)
+    except System.DoesNotExist:
+        raise Http404
+
+    definitions = _get_metric_definitions(metric_name)
+
+    metrics = Metric.objects.filter(report__system=system, definition__name=metric_name)
+    try:
+        metrics, make_series = _series_params(request, metrics)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+
+    result = make_series(list(metrics.values_list('report__date', 'value', 'report')))
+    result['system'] = system.name
+    result['metric'] = metric_name
+    result['definitions'] = definitions
+
+    return _series_response(result)
+
+# Like system_metric_series, but with a series for each system that has
+# reported the metric
+@page_cache.cached_page('site', 'uploads')
+def metric_series(request, metric_name):
+    definitions = _get_metric_definitions(metric_name)
+
+    metrics = Metric.objects.filter(definition__name=metric_name)
+    try:
+        metrics, make_series = _series_params(request, metrics)
+    except ValueError, e:
+        return HttpResponseBadRequest(str(e))
+
+    by_system = {}
+    for system_name, date, value, report_id in metrics.values_list('report__system__name', 'report__date', 'value', 'report'):
+        by_system.setdefault(system_name, []).append((date, value, report_id))
+
+    systems = {}
+    for system_name, rows in by_system.iteritems():
+        systems[system_name] = make_series(rows)
+
+    return _series_response({ 'metric': metric_name,
+                              'definitions': definitions,
+                              'systems': systems })
+
+# Request metrics of all the server processes and upload workers, in the
+# Prometheus text format; see instrumentation.py
+def instrumentation_metrics(request):
+    if not request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_ADDRESSES:
+        return HttpResponseForbidden("Metrics are only available locally\n")
+
+    response = HttpResponse(instrumentation.render(), mimetype="text/plain; version=0.0.4")
+    response['Cache-Control'] = 'no-cache'
+
+    return response
@@ -14,14 +14,67 @@ TEMPLATE_DIRS = ( os.path.join(APP_ROOT, 'templates') )
 
 MEDIA_ROOT = os.path.join(DATA_ROOT, 'uploads')
 
+# Rendered pages are cached until the data on them changes (see
+# perf/page_cache.py), which needs a cache shared between all the server
+# processes. CACHE_BACKEND can be set in local_settings.py to use
+# memcached instead.
+if not 'CACHE_BACKEND' in globals():
+    CACHE_BACKEND = 'file://' + os.path.join(DATA_ROOT, 'cache')
+
+# Uploads from clients that send 'Prefer: respond-async' are processed by
+# 'manage.py process_uploads' rather than in the request, as are batch
+# uploads; set DEFERRED_UPLOADS = False in local_settings.py to process
+# all uploads immediately instead
+if not 'DEFERRED_UPLOADS' in globals():
+    DEFERRED_UPLOADS = True
+
+# Compression of the report files stored for new uploads: 'gzip', 'bz2'
+# or 'lzma' (see perf/compression.py), and the level, or None for the
+# default of the codec
+if not 'REPORT_CODEC' in globals():
+    REPORT_CODEC = 'gzip'
+if not 'REPORT_COMPRESS_LEVEL' in globals():
+    REPORT_COMPRESS_LEVEL = None
+
+# Statistics of the values of each metric over the runs of a report that
+# are stored when the report is uploaded; see perf/reduction.py for the
+# available statistics
+if not 'METRIC_STATISTICS' in globals():
+    METRIC_STATISTICS = ('min', 'median', 'mean', 'stddev', 'trimmed_mean', 'p90')
+
+# Addresses that can read the request metrics at /metrics (see
+# perf/instrumentation.py)
+if not 'METRICS_ALLOWED_ADDRESSES' in globals():
+    METRICS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
+
+# Uploads from each system are limited to UPLOAD_RATE an hour, with up to
+# UPLOAD_BURST at once; set UPLOAD_RATE = None (or 0) to remove the limit
+if not 'UPLOAD_RATE' in globals():
+    UPLOAD_RATE = 60
+if not 'UPLOAD_BURST' in globals():
+    UPLOAD_BURST = 30
+
+# Profiling of requests (see perf/profiling.py): the fraction of requests
+# profiled at random, the key that forces a request to be profiled when
+# passed as ?profile=<key> (None to disable), and the most space the
+# saved profiles may take up
+if not 'PROFILE_FRACTION' in globals():
+    PROFILE_FRACTION = 0
+if not 'PROFILE_KEY' in globals():
+    PROFILE_KEY = None
+if not 'PROFILE_MAX_BYTES' in globals():
+    PROFILE_MAX_BYTES = 100 * 1024 * 1024
+
 TEMPLATE_LOADERS = (
     'django.template.loaders.filesystem.load_template_source',
 )
 
 MIDDLEWARE_CLASSES = (
+    'shell.perf.instrumentation.InstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shell.perf.profiling.ProfilingMiddleware',
 )
 
 ROOT_URLCONF = 'shell.urls'
@@ -5,17 +5,27 @@ urlpatterns = patterns('',
                        (r'^$', 'django.views.generic.simple.redirect_to',
                             { 'url': 'home', 'permanent': True }),
                        (r'^activate$', 'shell.perf.views.activate'),
+                       (r'^compare$', 'shell.perf.views.compare'),
+                       (r'^compare/json$', 'shell.perf.views.compare_json'),
                        (r'^confirm_edit$', 'shell.perf.views.confirm_edit'),
                        (r'^home$', 'shell.perf.views.home'),
+                       (r'^metric/(?P<metric_name>[^/]+)/series$', 'shell.perf.views.metric_series'),
+                       (r'^metrics$', 'shell.perf.views.instrumentation_metrics'),
                        (r'^register$', 'shell.perf.views.register'),
                        # The system name is included in the report URls only to make the
                        # the URLs more self-documenting
                        (r'^report/(?P<system_name>[^/]+)/(?P<report_id>\d+)/json$', 'shell.perf.views.report_json'),
+                       (r'^report/(?P<system_name>[^/]+)/(?P<report_id>\d+)/log$', 'shell.perf.views.report_log'),
+                       (r'^report/(?P<system_name>[^/]+)/(?P<report_id>\d+)/log/(?P<run>\d+)$', 'shell.perf.views.report_log_window'),
+                       (r'^report/(?P<system_name>[^/]+)/(?P<report_id>\d+)/statistics$', 'shell.perf.views.report_statistics'),
                        (r'^report/(?P<system_name>[^/]+)/(?P<report_id>\d+)$', 'shell.perf.views.report_view'),
                        (r'^system/(?P<system_name>[^/]+)/admin$', 'shell.perf.views.system_admin'),
                        (r'^system/(?P<system_name>[^/]+)/edit$', 'shell.perf.views.system_edit'),
+                       (r'^system/(?P<system_name>[^/]+)/metric/(?P<metric_name>[^/]+)/series$', 'shell.perf.views.system_metric_series'),
                        (r'^system/(?P<system_name>[^/]+)/mail_key$', 'shell.perf.views.system_mail_key'),
                        (r'^system/(?P<system_name>[^/]+)/upload$', 'shell.perf.views.system_upload'),
+                       (r'^system/(?P<system_name>[^/]+)/upload/(?P<job_id>\d+)$', 'shell.perf.views.system_upload_status'),
+                       (r'^system/(?P<system_name>[^/]+)/upload_batch$', 'shell.perf.views.system_upload_batch'),
                        (r'^system/(?P<system_name>[^/]+)$', 'shell.perf.views.system_view'),
                        (r'^systems$', 'shell.perf.views.systems'),
                        (r'^static/(?P<path>.*)$', 'django.views.static.serve',
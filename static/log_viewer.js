@@ -86,10 +86,13 @@ EventPainter.prototype = {
 	    }
 	}
 
-	var label = this.log[this.i][1];
+	var e = this.log[this.i];
+	var label = e[1];
 	if ((this.lastPos == null || this.pos - this.lastPos > LABEL_SPACE) &&
 	    (this.nextPos == null || this.nextPos - this.pos > LABEL_SPACE)) {
-	    this.paintLabel(this.pos, label);
+	    // Summaries of clusters of events from a WindowedRun have the
+	    // summarized events as a tooltip
+	    this.paintLabel(this.pos, label, e.details);
 	} else {
 	    this.skippedEvents.push(label);
 	    if (this.nextI == null)
@@ -101,21 +104,23 @@ EventPainter.prototype = {
 };
 
 // An EventRun object holds information about one of the runs of data in
-// an uploaded report
+// an uploaded report. If start is given, the times in the log have already
+// been converted to seconds since start (see decodeEventLog()); otherwise
+// they are microseconds since the epoch as in the report JSON.
 
-function EventRun(log, events) {
-    this._init(log, events);
+function EventRun(log, events, start) {
+    this._init(log, events, start);
 }
 
 EventRun.prototype = {
-    _init: function(log, events) {
+    _init: function(log, events, start) {
 	this.log = log;
 	this.events = events;
 	this.prepared = false;
 
 	this.statistics = null;
 	this.statTimes = null;
-	this.start = null;
+	this.start = start != null ? start : null;
 	this.range = null;
     },
 
@@ -152,12 +157,15 @@ EventRun.prototype = {
 
 	var i;
 	var time;
-	var start = null;
+	var start = this.start;
+	var converted = start != null;
 
 	for (i = 0; i < this.log.length; i++) {
 	    var e = this.log[i];
 
-	    if (start == null) {
+	    if (converted) {
+		time = e[0];
+	    } else if (start == null) {
 		start = e[0];
 		e[0] = time = 0;
 	    } else {
@@ -199,6 +207,225 @@ EventRun.prototype = {
     }
 };
 
+// Runs with more events than this are loaded a window at a time with
+// WindowedRun rather than all at once
+var WINDOWED_EVENTS = 50000;
+
+function isScriptEvent(e) {
+    if (e.script !== undefined)
+	return e.script;
+    return /^script\./.test(e[1]);
+}
+
+// A WindowedRun is used in place of an EventRun for a run too big to
+// download all at once. The server sends the events for the part of the
+// run being displayed, with dense areas summarized as clusters of events,
+// and we fetch a new window as the user zooms and scrolls. url is
+// the URL for windows of the run; see report_log_window() in
+// shell/perf/views.py.
+function WindowedRun(viewer, url) {
+    this._init(viewer, url);
+}
+
+WindowedRun.prototype = {
+    _init: function(viewer, url) {
+	this.viewer = viewer;
+	this.url = url;
+
+	this.log = [];
+	this.range = null;
+	this.start = null;
+	this.overview = null;
+	this.overviewHeight = null;
+
+	this._window = null;
+	this._pending = null;
+    },
+
+    prepare: function() {
+	if (this.range == null)
+	    this._fetch(0, null, this.viewer.canvas.height, true);
+    },
+
+    // Called before drawing the given window; fetches new data if what
+    // we have doesn't cover the window at about the right resolution.
+    update: function(start, end, height) {
+	var w = this._window;
+	if (w != null && w.start <= start && w.end >= end) {
+	    var pixel = (end - start) / height;
+	    var dataPixel = (w.end - w.start) / w.height;
+	    if (dataPixel <= pixel * 1.5 && dataPixel >= pixel / 2)
+		return;
+	}
+
+	// Fetch twice the visible range so that scrolling a bit doesn't
+	// immediately need another fetch
+	var range = end - start;
+	var fetchStart = Math.max(0, start - range / 2);
+	var fetchEnd = Math.min(this.range, end + range / 2);
+	var fetchHeight = Math.max(1, Math.round(height * (fetchEnd - fetchStart) / range));
+
+	this._fetch(fetchStart, fetchEnd, fetchHeight, false);
+    },
+
+    _fetch: function(start, end, height, overview) {
+	var url = this.url + '?start=' + start + '&height=' + height;
+	if (end != null)
+	    url += '&end=' + end;
+	if (overview)
+	    url += '&overview=1';
+
+	if (this._pending == url)
+	    return;
+	this._pending = url;
+
+	var me = this;
+	var req = new XMLHttpRequest();
+	req.open("GET", url);
+	req.onreadystatechange = function() {
+	    if (this.readyState != 4) // DONE
+		return;
+
+	    // Ignore responses for windows we are no longer interested in
+	    if (me._pending != url)
+		return;
+	    me._pending = null;
+
+	    if (this.status != 200) {
+		me.viewer._showMessage("Couldn't load log");
+		return;
+	    }
+
+	    var data;
+	    try {
+		data = JSON.parse(this.responseText);
+	    } catch(e) {
+		me.viewer._showMessage("Malformed log");
+		return;
+	    }
+
+	    me.setData(data, start, end != null ? end : data.range, height);
+	};
+	req.send();
+    },
+
+    // Sets the contents of the run from a response from the server
+    setData: function(data, start, end, height) {
+	var i;
+
+	var firstLoad = this.range == null;
+	this.range = data.range;
+	this.start = data.start;
+	if (data.overview) {
+	    this.overview = data.overview;
+	    this.overviewHeight = height;
+	}
+
+	var log = data.events;
+	for (i = 0; i < log.length; i++) {
+	    var e = log[i];
+	    if (e[1] == 'glx.swapComplete' && e.length > 2)
+		e[2] = (e[2] - this.start) / 1000000;
+	}
+
+	// Each cluster becomes one pseudo-event for each column of the
+	// display, placed in the middle of the clustered events
+	for (i = 0; i < data.clusters.length; i++) {
+	    var cluster = data.clusters[i];
+	    var time = (cluster[0] + cluster[1]) / 2;
+	    var columns = { script: { count: 0, details: [] },
+			    other: { count: 0, details: [] } };
+
+	    for (var name in cluster[3]) {
+		var count = cluster[3][name];
+		var column = /^script\./.test(name) ? columns.script : columns.other;
+		column.count += count;
+		column.details.push(name + " (" + count + ")");
+	    }
+
+	    for (var key in columns) {
+		if (columns[key].count == 0)
+		    continue;
+
+		var summary = [time, '<' + columns[key].count + ' events>'];
+		summary.script = key == 'script';
+		summary.details = columns[key].details;
+		log.push(summary);
+	    }
+	}
+
+	log.sort(function(a, b) { return a[0] - b[0]; });
+
+	this.log = log;
+	this._window = { start: start, end: end, height: height };
+
+	this.viewer._onRunUpdated(this, firstLoad);
+    }
+};
+
+function align8(offset) {
+    return (offset + 7) & ~7;
+}
+
+// Decodes the compact binary form of the event logs of a report, as
+// generated by shell/perf/event_log.py. Returns an object with the
+// 'events' of the report, and a list of 'runs', each with the 'start'
+// time of the run in microseconds since the epoch and the 'log', which
+// is like the logs in the report JSON, except that times have already
+// been converted to seconds since the start.
+function decodeEventLog(buffer) {
+    var bytes = new Uint8Array(buffer);
+    var i;
+
+    if (String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]) != 'SPLG')
+	throw new Error("Not an event log");
+
+    var words = new Uint32Array(buffer, 4, 2);
+    if (words[0] != 1)
+	throw new Error("Unknown event log version " + words[0]);
+
+    // The header is JSON with non-ASCII characters escaped
+    var headerLength = words[1];
+    var headerText = '';
+    for (i = 0; i < headerLength; i += 4096) {
+	var chunk = bytes.subarray(12 + i, 12 + Math.min(i + 4096, headerLength));
+	headerText += String.fromCharCode.apply(null, chunk);
+    }
+    var header = JSON.parse(headerText);
+
+    var offset = align8(12 + headerLength);
+    var runs = [];
+    for (var r = 0; r < header.runs.length; r++) {
+	var run = header.runs[r];
+	var count = run.count;
+
+	var args = new Float64Array(buffer, offset, count);
+	offset += 8 * count;
+	var deltas = new Uint32Array(buffer, offset, count);
+	offset += 4 * count;
+	var names = new Uint16Array(buffer, offset, count);
+	offset = align8(offset + 2 * count);
+
+	var log = new Array(count);
+	var time = 0;
+	for (i = 0; i < count; i++) {
+	    time += deltas[i];
+	    var arg = args[i];
+	    if (isNaN(arg))
+		log[i] = [time / 1000000, header.names[names[i]]];
+	    else
+		log[i] = [time / 1000000, header.names[names[i]], arg];
+	}
+
+	for (i = 0; i < run.strings.length; i++)
+	    log[run.strings[i][0]][2] = run.strings[i][1];
+
+	runs.push({ start: run.start, log: log });
+    }
+
+    return { events: header.events, runs: runs };
+}
+
 // The LogViewer class adds event log behavior to the canvas
 function LogViewer(canvas) {
     this._init(canvas);
@@ -220,8 +447,103 @@ LogViewer.prototype = {
 				     true);
     },
 
-    // Load the given URL into the report log
-    load: function(reportUrl) {
+    // Load the event logs of a report. reportUrl is the URL of the report
+    // JSON; if logUrl is given, we first try to load the much smaller and
+    // faster to decode binary form of the logs from there, falling back to
+    // the JSON if that fails or the browser doesn't support binary data.
+    load: function(reportUrl, logUrl) {
+	this._showMessage("Loading...");
+
+	if (logUrl && window.ArrayBuffer && window.Uint8Array) {
+	    // Start by getting an overview of the first run, which tells us
+	    // how big the runs are
+	    var me = this;
+	    var height = this.canvas.height;
+	    var req = new XMLHttpRequest();
+	    req.open("GET", logUrl + '/0?overview=1&height=' + height);
+	    req.onreadystatechange = function() {
+		if (this.readyState != 4) // DONE
+		    return;
+
+		var data = null;
+		if (this.status == 200) {
+		    try {
+			data = JSON.parse(this.responseText);
+		    } catch(e) {
+		    }
+		}
+
+		if (data == null)
+		    me._loadJson(reportUrl);
+		else if (data.count > WINDOWED_EVENTS)
+		    me._loadWindowed(logUrl, data, height);
+		else
+		    me._loadBinary(reportUrl, logUrl);
+	    };
+	    req.send();
+	} else {
+	    this._loadJson(reportUrl);
+	}
+    },
+
+    _loadWindowed: function(logUrl, data, height) {
+	var runs = [];
+	for (var i = 0; i < data.runs; i++)
+	    runs.push(new WindowedRun(this, logUrl + '/' + i));
+
+	runs[0].setData(data, 0, data.range, height);
+	this._setRuns([], runs);
+    },
+
+    // Called by a WindowedRun when it gets new data
+    _onRunUpdated: function(run, firstLoad) {
+	if (run != this.run)
+	    return;
+
+	if (firstLoad) {
+	    this.zoomStart = 0;
+	    this.zoomEnd = run.range;
+	}
+
+	this.redraw();
+    },
+
+    _loadBinary: function(reportUrl, logUrl) {
+	var me = this;
+	var req = new XMLHttpRequest();
+	req.open("GET", logUrl);
+	req.responseType = 'arraybuffer';
+	req.onreadystatechange = function() {
+	    if (this.readyState != 4) // DONE
+		return;
+
+	    if (!me._onBinaryLoaded(this))
+		me._loadJson(reportUrl);
+	};
+	req.send();
+    },
+
+    _onBinaryLoaded: function(req) {
+	if (req.status != 200 || !req.response || !(req.response instanceof ArrayBuffer))
+	    return false;
+
+	var decoded;
+	try {
+	    decoded = decodeEventLog(req.response);
+	} catch(e) {
+	    return false;
+	}
+
+	var runs = [];
+	for (var i = 0; i < decoded.runs.length; i++)
+	    runs.push(new EventRun(decoded.runs[i].log, decoded.events, decoded.runs[i].start));
+
+	this._setRuns(decoded.events, runs);
+
+	return true;
+    },
+
+    _loadJson: function(reportUrl) {
 	var req = new XMLHttpRequest();
 	req.open("GET", reportUrl);
 	req.send();
@@ -230,10 +552,6 @@ LogViewer.prototype = {
 	req.onreadystatechange = function() {
 	    me._onReadyStateChange(this);
 	};
-
-	var context = this.canvas.getContext('2d');
-
-	this._showMessage("Loading...");
     },
 
     _onReadyStateChange: function(req) {
@@ -245,26 +563,32 @@ LogViewer.prototype = {
 	    return;
 	}
 
+	var events;
+	var runs = [];
 	try {
 	    var report = JSON.parse(req.responseText);
 	    var i;
 
-	    var events = report['events'];
-	    this.events = {};
-	    for (i = 0; i < events.length; i++) {
-		var event = events[i];
-		this.events[event.name] = event;
-	    }
-
+	    events = report['events'];
 	    var logs = report['logs'];
-	    this.runs = [];
 	    for (i = 0; i < logs.length; i++)
-		this.runs.push(new EventRun(logs[i], events));
+		runs.push(new EventRun(logs[i], events));
 	} catch(e) {
 	    this._showMessage("Malformed log");
 	    return;
 	}
 
+	this._setRuns(events, runs);
+    },
+
+    _setRuns: function(events, runs) {
+	this.events = {};
+	for (var i = 0; i < events.length; i++) {
+	    var event = events[i];
+	    this.events[event.name] = event;
+	}
+
+	this.runs = runs;
 	this.setRun(0);
     },
 
@@ -511,10 +835,18 @@ LogViewer.prototype = {
 	if (!this.run)
 	    return;
 
+	if (this.run.range == null) {
+	    this._showMessage("Loading...");
+	    return;
+	}
+
 	var context = this.canvas.getContext('2d');
 	var width = this.canvas.width;
 	var height = this.canvas.height;
 
+	if (this.run.update)
+	    this.run.update(this.zoomStart, this.zoomEnd, height);
+
 	context.clearRect(0, 0, width, height);
 	context.textBaseline = 'middle';
 
@@ -536,12 +868,24 @@ LogViewer.prototype = {
 	// Paint the entire set of ticks over the scrollbar for context
 
 	var lastY = null;
-	for (i = 0; i < this.run.log.length; i++) {
-	    var e = this.run.log[i];
-	    var y =  Math.floor(height * e[0] / this.run.range);
-	    if (y != lastY) {
-		context.fillRect(0, y, 20, 1);
-		lastY = y;
+	if (this.run.overview) {
+	    // For a WindowedRun we don't have all the events, but the server
+	    // gave us the rows that have events in them
+	    for (i = 0; i < this.run.overview.length; i++) {
+		var y = Math.floor(height * this.run.overview[i] / this.run.overviewHeight);
+		if (y != lastY) {
+		    context.fillRect(0, y, 20, 1);
+		    lastY = y;
+		}
+	    }
+	} else {
+	    for (i = 0; i < this.run.log.length; i++) {
+		var e = this.run.log[i];
+		var y =  Math.floor(height * e[0] / this.run.range);
+		if (y != lastY) {
+		    context.fillRect(0, y, 20, 1);
+		    lastY = y;
+		}
 	    }
 	}
 
@@ -571,7 +915,7 @@ LogViewer.prototype = {
 	    log: this.run.log,
 	    getPos: getY,
 	    predicate: function(e) {
-		return /^script\./.test(e[1]);
+		return isScriptEvent(e);
 	    },
 	    paintLine: function(pos) {
 		context.save();
@@ -593,7 +937,7 @@ LogViewer.prototype = {
 	    log: this.run.log,
 	    getPos: getY,
 	    predicate: function(e) {
-		return !/^script\./.test(e[1]);
+		return !isScriptEvent(e);
 	    },
 	    paintLine: function(pos) {
 		if (pos != lastY)
@@ -720,6 +1064,8 @@ LogViewer.prototype = {
     setRun: function(runIndex) {
 	this.run = this.runs[runIndex];
 
+	// For a WindowedRun that hasn't been fetched yet, this starts the
+	// fetch, and the zoom is set up in _onRunUpdated() when it arrives
 	this.run.prepare();
 	this.zoomStart = 0;
 	this.zoomEnd = this.run.range;